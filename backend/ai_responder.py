@@ -1,33 +1,43 @@
-import requests
 import asyncio
+import json
 import logging
-from typing import List, Dict, Optional
-from collections import deque
+import time
+from typing import List, Dict, Optional, AsyncIterator
+import httpx
 from config import config
+from http_client import http_client
+from llm_scheduler import llm_scheduler, PRIORITY_MANUAL, PRIORITY_BACKGROUND
+from llm_router import llm_router, LLMEndpoint, is_endpoint_failure
+from answer_cache import AnswerCache
+from knowledge_base import knowledge_base, KnowledgeHit
+from history import ConversationHistory
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class AIResponder:
-    def __init__(self):
-        # Настраиваем ProxyAPI через requests
-        self.api_url = f"{config.PROXY_API_BASE_URL}/chat/completions"
-        self.headers = {
-            'Authorization': f'Bearer {config.PROXYAPI_KEY}',
-            'Content-Type': 'application/json'
-        }
-        logger.info(f"Используем ProxyAPI: {config.PROXY_API_BASE_URL}")
+    def __init__(self, answer_cache: Optional[AnswerCache] = None):
+        # Endpoint выбирается на каждый запрос (оценки задержки и ошибок общие)
+        self.router = llm_router
+        logger.debug("LLM endpoint'ы: %s", ', '.join(e.name for e in self.router.endpoints))
             
-        self.conversation_history = deque(maxlen=10)  # Последние 10 сообщений
+        # История ограничена бюджетом токенов, старое сворачивается в резюме
+        self.conversation_history = ConversationHistory()
+        self._summary_task: Optional[asyncio.Task] = None
         self.current_profile = "general"
+        # Кэш может быть общим для нескольких сессий
+        if answer_cache is None and config.ANSWER_CACHE_ENABLED:
+            answer_cache = AnswerCache()
+        self.answer_cache = answer_cache
         
     def set_profile(self, profile_name: str):
         """Устанавливает профиль интервью"""
         if profile_name in config.INTERVIEW_PROFILES:
             self.current_profile = profile_name
-            logger.info(f"Профиль изменен на: {profile_name}")
+            logger.info("Профиль изменен на: %s", profile_name)
         else:
-            logger.warning(f"Неизвестный профиль: {profile_name}")
+            logger.warning("Неизвестный профиль: %s", profile_name)
     
     def add_to_history(self, role: str, content: str):
         """Добавляет сообщение в историю диалога"""
@@ -38,9 +48,60 @@ class AIResponder:
     
     def clear_history(self):
         """Очищает историю диалога"""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
         self.conversation_history.clear()
         logger.info("История диалога очищена")
     
+    def _history_budget(self) -> int:
+        """Бюджет токенов истории для текущего профиля"""
+        profile = config.INTERVIEW_PROFILES[self.current_profile]
+        return profile.get("history_tokens", config.HISTORY_TOKEN_BUDGET)
+    
+    def _schedule_summary(self):
+        """Запускает в фоне сворачивание вытесненной истории в резюме"""
+        if not config.HISTORY_SUMMARY_ENABLED:
+            return
+        if self._summary_task and not self._summary_task.done():
+            return
+        if not self.conversation_history.needs_summary(self._history_budget()):
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # синхронный вызов - свернем при следующем асинхронном ответе
+        
+        self._summary_task = loop.create_task(
+            self.conversation_history.fold(self._history_budget(), self._summarize)
+        )
+    
+    async def _summarize(self, summary: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Обновляет резюме диалога с учетом вытесненных сообщений"""
+        names = {"user": "Вопрос", "assistant": "Ответ"}
+        dialog = "\n".join(f"{names.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+        prompt = (
+            "Обнови краткое резюме диалога на собеседовании. Сохрани факты, "
+            "темы вопросов и ключевые тезисы ответов, без лишних слов.\n\n"
+            f"Текущее резюме: {summary or 'нет'}\n\nНовая часть диалога:\n{dialog}"
+        )
+        data = {
+            'model': config.OPENAI_MODEL,
+            'messages': [{"role": "user", "content": prompt}],
+            'max_tokens': config.HISTORY_SUMMARY_MAX_TOKENS,
+            'temperature': 0.2
+        }
+        
+        try:
+            response = await self._post(data, PRIORITY_BACKGROUND)
+            if response.status_code != 200:
+                logger.error("Ошибка ProxyAPI при резюмировании: %s", response.status_code)
+                return None
+            return response.json()['choices'][0]['message']['content'].strip()
+        except Exception as e:
+            logger.error("Ошибка при резюмировании истории: %s", e)
+            return None
+    
     def _prepare_messages(self, question: str) -> List[Dict[str, str]]:
         """Подготавливает сообщения для OpenAI API"""
         profile = config.INTERVIEW_PROFILES[self.current_profile]
@@ -49,93 +110,276 @@ class AIResponder:
             {"role": "system", "content": profile["system_prompt"]}
         ]
         
-        # Добавляем историю диалога
-        messages.extend(list(self.conversation_history))
+        # Близкие фрагменты локального корпуса - опора для ответа
+        context = self._knowledge_context(question)
+        if context:
+            messages.append({"role": "system", "content": f"Справочные материалы:\n\n{context}"})
+        
+        # Добавляем резюме и последние сообщения в пределах бюджета токенов
+        messages.extend(self.conversation_history.get_messages(self._history_budget()))
         
         # Добавляем текущий вопрос
         messages.append({"role": "user", "content": question})
         
         return messages
     
-    async def get_response(self, question: str) -> Optional[str]:
-        """Получает ответ от ProxyAPI"""
+    def _knowledge_context(self, question: str) -> str:
+        """Контекст из корпуса профиля в пределах KNOWLEDGE_CONTEXT_MAX_CHARS"""
+        parts, length = [], 0
+        for hit in knowledge_base.context(self.current_profile, question):
+            text = hit.as_context()
+            if length + len(text) > config.KNOWLEDGE_CONTEXT_MAX_CHARS:
+                break
+            parts.append(text)
+            length += len(text)
+        return "\n\n".join(parts)
+    
+    def local_answer(self, question: str, commit: bool = True) -> Optional[KnowledgeHit]:
+        """Подготовленный ответ из корпуса профиля (без обращения к LLM)"""
+        hit = knowledge_base.answer(self.current_profile, question)
+        if hit and commit:
+            logger.info("📚 Ответ найден в локальной базе (%.2f): %s", hit.score, hit.entry.text[:100])
+            self.add_to_history("user", question)
+            self.add_to_history("assistant", hit.entry.answer)
+        return hit
+    
+    def context_key(self) -> str:
+        """Профиль и отпечаток истории - ключ для общих одновременных запросов.
+        
+        Кэш ответов им не пользуется: ключ меняется с каждым ответом, и
+        повторный вопрос в той же сессии никогда бы в кэш не попал.
+        """
+        return f"{self.current_profile}:{self.conversation_history.fingerprint()}"
+    
+    def _get_cached(self, question: str, commit: bool = True) -> Optional[str]:
+        """Ищет готовый ответ в кэше и при попадании добавляет его в историю"""
+        if not self.answer_cache:
+            return None
+        
+        answer = self.answer_cache.get(self.current_profile, question)
+        if answer:
+            logger.info("💾 Ответ взят из кэша: %s", question[:100])
+            if commit:
+                self.add_to_history("user", question)
+                self.add_to_history("assistant", answer)
+        return answer
+    
+    def commit_answer(self, question: str, answer: str):
+        """Сохраняет завершенный ответ в истории и кэше"""
+        self.add_to_history("user", question)
+        self.add_to_history("assistant", answer)
+        if self.answer_cache:
+            self.answer_cache.put(self.current_profile, question, answer)
+        self._schedule_summary()
+    
+    def get_history_stats(self) -> dict:
+        """Возвращает статистику истории диалога"""
+        return self.conversation_history.get_stats(self._history_budget())
+    
+    def get_cache_stats(self) -> dict:
+        """Возвращает статистику кэша ответов"""
+        if not self.answer_cache:
+            return {"enabled": False}
+        return {"enabled": True, **self.answer_cache.get_stats()}
+    
+    def _prepare_payload(self, question: str, stream: bool = False) -> Dict:
+        """Подготавливает тело запроса к /chat/completions"""
+        profile = config.INTERVIEW_PROFILES[self.current_profile]
+        data = {
+            'model': config.OPENAI_MODEL,
+            'messages': self._prepare_messages(question),
+            'max_tokens': profile["max_tokens"],
+            'temperature': config.OPENAI_TEMPERATURE
+        }
+        if stream:
+            data['stream'] = True
+        return data
+    
+    @staticmethod
+    def _endpoint_payload(endpoint: LLMEndpoint, data: Dict) -> Dict:
+        """Тело запроса с моделью выбранного endpoint'а"""
+        return {**data, 'model': endpoint.model}
+    
+    def _retries_for(self, endpoint: LLMEndpoint) -> Optional[int]:
+        """Повторы на том же endpoint'е не нужны, если есть куда переключиться"""
+        return 0 if self.router.has_alternative(endpoint) else None
+    
+    async def _post(self, data: Dict, priority: int) -> httpx.Response:
+        """POST через лучший доступный endpoint с переключением при его сбое"""
+        response, error = None, None
+        for endpoint in self.router.candidates():
+            try:
+                response = await llm_scheduler.post_json(
+                    endpoint.url, endpoint.headers, self._endpoint_payload(endpoint, data),
+                    priority, self._retries_for(endpoint)
+                )
+            except httpx.TransportError as e:
+                error = e
+                self.router.record_failure(endpoint, type(e).__name__)
+                continue
+            if is_endpoint_failure(response.status_code):
+                self.router.record_failure(endpoint, str(response.status_code))
+                continue
+            # Полное время ответа несравнимо с TTFB - обновляем только здоровье
+            self.router.record_success(endpoint)
+            return response
+        if response is None:
+            raise error
+        return response
+    
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[str]:
+        """Извлекает текстовую дельту из строки SSE (None - строка без текста)"""
+        if not line or not line.startswith("data:"):
+            return None
+        
+        payload = line[len("data:"):].strip()
+        if not payload or payload == "[DONE]":
+            return None
+        
         try:
-            messages = self._prepare_messages(question)
-            profile = config.INTERVIEW_PROFILES[self.current_profile]
+            chunk = json.loads(payload)
+            choices = chunk.get('choices') or []
+            if not choices:
+                return None
+            return (choices[0].get('delta') or {}).get('content')
+        except (ValueError, AttributeError) as e:
+            logger.debug("Пропускаем некорректный SSE чанк: %s", e, extra={"category": "ai_stream"})
+            return None
+    
+    async def stream_response(self, question: str, commit: bool = True,
+                              priority: int = PRIORITY_MANUAL) -> AsyncIterator[str]:
+        """Потоково получает ответ от ProxyAPI (SSE, stream: true).
+        
+        Отдает текстовые дельты по мере их появления. История диалога
+        обновляется только после получения полного ответа; при
+        commit=False (спекулятивный запрос) это делает вызывающий код
+        через commit_answer.
+        
+        Запрос идет через llm_scheduler: priority определяет очередность
+        при занятых слотах, повторы выполняются до получения заголовков.
+        """
+        cached = self._get_cached(question, commit=commit)
+        if cached:
+            yield cached
+            return
+        
+        data = self._prepare_payload(question, stream=True)
+        parts: List[str] = []
+        
+        for endpoint in self.router.candidates():
+            logger.info("Отправляем потоковый запрос в %s: %s...", endpoint.name, question[:100])
+            started_at = time.perf_counter()
+            try:
+                async with llm_scheduler.stream_post(
+                    endpoint.url, endpoint.headers, self._endpoint_payload(endpoint, data),
+                    priority, self._retries_for(endpoint)
+                ) as response:
+                    ttfb = time.perf_counter() - started_at
+                    metrics.observe("llm_ttfb_seconds", ttfb, "Время до заголовков ответа LLM")
+                    if response.status_code != 200:
+                        metrics.increment("llm_errors_total")
+                        body = await response.aread()
+                        logger.error("Ошибка %s: %s - %s", endpoint.name, response.status_code, body.decode(errors='replace'))
+                        if is_endpoint_failure(response.status_code):
+                            self.router.record_failure(endpoint, str(response.status_code))
+                            continue
+                        return
+                    self.router.record_success(endpoint, ttfb)
+                    
+                    async for line in response.aiter_lines():
+                        delta = self._parse_stream_line(line)
+                        if delta:
+                            if not parts:
+                                metrics.observe("llm_first_token_seconds", time.perf_counter() - started_at,
+                                                "Время до первого токена LLM")
+                            parts.append(delta)
+                            yield delta
+            except httpx.TransportError as e:
+                metrics.increment("llm_errors_total")
+                self.router.record_failure(endpoint, type(e).__name__)
+                if parts:
+                    raise  # часть ответа уже отдана - повтор на другом endpoint'е ее продублирует
+                logger.error("Ошибка соединения с %s: %s", endpoint.name, e)
+                continue
             
-            logger.info(f"Отправляем запрос в ProxyAPI: {question[:100]}...")
+            metrics.observe("llm_total_seconds", time.perf_counter() - started_at, "Полное время ответа LLM")
+            answer = "".join(parts).strip()
+            if answer and commit:
+                self.commit_answer(question, answer)
+            if answer:
+                logger.info("Потоковый ответ завершен: %s...", answer[:100])
+            return
+        
+        logger.error("❌ Ни один LLM endpoint не ответил")
+    
+    async def get_response(self, question: str, priority: int = PRIORITY_MANUAL) -> Optional[str]:
+        """Получает ответ от ProxyAPI"""
+        cached = self._get_cached(question)
+        if cached:
+            return cached
+        
+        try:
+            logger.info("Отправляем запрос в ProxyAPI: %s...", question[:100])
             
             # Подготавливаем данные для запроса
-            data = {
-                'model': config.OPENAI_MODEL,
-                'messages': messages,
-                'max_tokens': profile["max_tokens"],
-                'temperature': config.OPENAI_TEMPERATURE
-            }
+            data = self._prepare_payload(question)
             
-            # Используем async запрос
-            response = await asyncio.to_thread(
-                requests.post,
-                self.api_url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
+            # Запрос через маршрутизатор и планировщик (выбор endpoint'а, очередь, повторы)
+            started_at = time.perf_counter()
+            response = await self._post(data, priority)
+            metrics.observe("llm_total_seconds", time.perf_counter() - started_at, "Полное время ответа LLM")
             
             if response.status_code == 200:
                 result = response.json()
                 answer = result['choices'][0]['message']['content'].strip()
                 
-                # Добавляем в историю
-                self.add_to_history("user", question)
-                self.add_to_history("assistant", answer)
+                # Добавляем в историю и кэш
+                self.commit_answer(question, answer)
                 
-                logger.info(f"Получен ответ: {answer[:100]}...")
+                logger.info("Получен ответ: %s...", answer[:100])
                 return answer
             else:
-                logger.error(f"Ошибка ProxyAPI: {response.status_code} - {response.text}")
+                metrics.increment("llm_errors_total")
+                logger.error("Ошибка ProxyAPI: %s - %s", response.status_code, response.text)
                 return None
             
         except Exception as e:
-            logger.error(f"Ошибка при получении ответа от ProxyAPI: {e}")
+            metrics.increment("llm_errors_total")
+            logger.error("Ошибка при получении ответа от ProxyAPI: %s", e)
             return None
     
     def get_quick_response(self, question: str) -> str:
         """Синхронный метод для быстрого ответа"""
+        cached = self._get_cached(question)
+        if cached:
+            return cached
+        
         try:
-            messages = self._prepare_messages(question)
-            profile = config.INTERVIEW_PROFILES[self.current_profile]
-            
             # Подготавливаем данные для запроса
-            data = {
-                'model': config.OPENAI_MODEL,
-                'messages': messages,
-                'max_tokens': profile["max_tokens"],
-                'temperature': config.OPENAI_TEMPERATURE
-            }
+            data = self._prepare_payload(question)
             
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
+            endpoint = next(self.router.candidates())
+            response = http_client.post_json_sync(endpoint.url, endpoint.headers, self._endpoint_payload(endpoint, data))
+            if is_endpoint_failure(response.status_code):
+                self.router.record_failure(endpoint, str(response.status_code))
+            else:
+                self.router.record_success(endpoint)
             
             if response.status_code == 200:
                 result = response.json()
                 answer = result['choices'][0]['message']['content'].strip()
                 
-                # Добавляем в историю
-                self.add_to_history("user", question)
-                self.add_to_history("assistant", answer)
+                # Добавляем в историю и кэш
+                self.commit_answer(question, answer)
                 
                 return answer
             else:
-                logger.error(f"Ошибка ProxyAPI: {response.status_code} - {response.text}")
+                logger.error("Ошибка ProxyAPI: %s - %s", response.status_code, response.text)
                 return "Извините, произошла ошибка при генерации ответа."
             
         except Exception as e:
-            logger.error(f"Ошибка при получении быстрого ответа: {e}")
+            logger.error("Ошибка при получении быстрого ответа: %s", e)
             return "Извините, произошла ошибка при генерации ответа."
     
     def get_conversation_summary(self) -> str:
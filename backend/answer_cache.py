@@ -0,0 +1,268 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Приводит вопрос к каноническому виду для ключа кэша"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def vectorize(normalized: str, ngram: int, dim: int) -> np.ndarray:
+    """Нормированный вектор символьных n-грамм (hashing trick)"""
+    padded = f" {normalized} "
+    indices = [zlib.crc32(padded[i:i + ngram].encode("utf-8")) % dim
+               for i in range(max(len(padded) - ngram + 1, 1))]
+    vector = np.bincount(indices, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+@dataclass
+class CacheEntry:
+    profile: str
+    question: str
+    answer: str
+    created_at: float
+
+
+class AnswerCache:
+    """Кэш ответов AI с точным и приближенным совпадением вопросов.
+
+    Точное совпадение ищется по (профиль, нормализованный текст).
+    Перефразированные вопросы находятся по косинусной близости векторов
+    символьных n-грамм (hashing trick), хранящихся в заранее выделенной
+    матрице NumPy. Вытеснение - LRU + TTL, опционально хранение на диске.
+
+    Файл перезаписывается не на каждое изменение: изменения копятся
+    ANSWER_CACHE_SAVE_DELAY секунд и пишутся одним разом в потоке таймера,
+    не блокируя event loop. flush() записывает накопленное сразу
+    (вызывается при завершении работы).
+    """
+
+    def __init__(self, capacity: int = None, ttl: float = None,
+                 similarity_threshold: float = None, path: Optional[str] = None):
+        self.capacity = capacity or config.ANSWER_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else config.ANSWER_CACHE_TTL
+        self.similarity_threshold = (similarity_threshold if similarity_threshold is not None
+                                     else config.ANSWER_CACHE_SIMILARITY)
+        self.path = path if path is not None else config.ANSWER_CACHE_PATH
+        self.ngram = config.ANSWER_CACHE_NGRAM
+        self.dim = config.ANSWER_CACHE_VECTOR_DIM
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._slot_keys: list = [None] * self.capacity
+        self._free_slots = list(range(self.capacity - 1, -1, -1))
+        self._vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        # -1 - свободный слот, иначе номер профиля
+        self._slot_profiles = np.full(self.capacity, -1, dtype=np.int32)
+        self._profile_ids: Dict[str, int] = {}
+
+        self.stats = {"hits_exact": 0, "hits_similar": 0, "misses": 0, "evictions": 0, "saves": 0}
+
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+
+        if self.path:
+            self._load()
+            atexit.register(self.flush)
+
+    # --- Векторизация ---
+
+    def _vectorize(self, normalized: str) -> np.ndarray:
+        return vectorize(normalized, self.ngram, self.dim)
+
+    def _profile_id(self, profile: str) -> int:
+        if profile not in self._profile_ids:
+            self._profile_ids[profile] = len(self._profile_ids)
+        return self._profile_ids[profile]
+
+    # --- Внутренние операции (под блокировкой) ---
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def _remove(self, key: Tuple[str, str]):
+        self._entries.pop(key, None)
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._slot_profiles[slot] = -1
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def _insert(self, key: Tuple[str, str], entry: CacheEntry, vector: np.ndarray):
+        if key in self._entries:
+            self._remove(key)
+        while not self._free_slots:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+        slot = self._free_slots.pop()
+        self._vectors[slot] = vector
+        self._slot_profiles[slot] = self._profile_id(entry.profile)
+        self._slots[key] = slot
+        self._slot_keys[slot] = key
+        self._entries[key] = entry
+
+    def _find_similar(self, profile: str, vector: np.ndarray, now: float) -> Optional[CacheEntry]:
+        profile_id = self._profile_ids.get(profile)
+        if profile_id is None:
+            return None
+
+        scores = self._vectors @ vector
+        scores[self._slot_profiles != profile_id] = -1.0
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.similarity_threshold:
+            return None
+
+        key = self._slot_keys[slot]
+        if key is None:
+            return None
+        entry = self._entries[key]
+        if self._is_expired(entry, now):
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    # --- Публичный интерфейс ---
+
+    def get(self, profile: str, question: str) -> Optional[str]:
+        """Ищет ответ на вопрос (точное, затем приближенное совпадение)"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+
+        key = (profile, normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_expired(entry, now):
+                    self._remove(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats["hits_exact"] += 1
+                    return entry.answer
+
+            if len(normalized) >= config.ANSWER_CACHE_MIN_SIMILAR_LENGTH:
+                entry = self._find_similar(profile, self._vectorize(normalized), now)
+                if entry is not None:
+                    self.stats["hits_similar"] += 1
+                    logger.info("💾 Найден похожий вопрос в кэше: '%s'", entry.question[:60])
+                    return entry.answer
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, profile: str, question: str, answer: str):
+        """Сохраняет ответ в кэше"""
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+
+        entry = CacheEntry(profile=profile, question=question, answer=answer, created_at=time.time())
+        vector = self._vectorize(normalized)
+        with self._lock:
+            self._insert((profile, normalized), entry, vector)
+
+        self._schedule_save()
+
+    def clear(self):
+        """Очищает кэш"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+        self._schedule_save()
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики попаданий и промахов"""
+        with self._lock:
+            hits = self.stats["hits_exact"] + self.stats["hits_similar"]
+            total = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hit_rate": round(hits / total, 3) if total else 0.0
+            }
+
+    # --- Хранение на диске ---
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            now = time.time()
+            with self._lock:
+                for record in records:
+                    entry = CacheEntry(**record)
+                    if self._is_expired(entry, now):
+                        continue
+                    normalized = normalize_question(entry.question)
+                    self._insert((entry.profile, normalized), entry, self._vectorize(normalized))
+            logger.info(f"💾 Загружено {len(self._entries)} ответов из кэша {self.path}")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке кэша ответов: {e}")
+
+    def _schedule_save(self):
+        """Откладывает запись файла, собирая изменения за ANSWER_CACHE_SAVE_DELAY"""
+        if not self.path:
+            return
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(config.ANSWER_CACHE_SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Записывает накопленные изменения на диск"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+        self._save()
+
+    def _save(self):
+        try:
+            with self._lock:
+                records = [asdict(entry) for entry in self._entries.values()]
+                self.stats["saves"] += 1
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кэша ответов: {e}")
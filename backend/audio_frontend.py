@@ -0,0 +1,198 @@
+import logging
+import math
+from typing import Optional
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Постоянная времени оценки постоянной составляющей, секунд
+DC_TIME_CONSTANT = 1.0
+# Сглаживание усиления: быстро вниз на громкой речи, медленно вверх
+AGC_ATTACK = 0.5
+AGC_RELEASE = 0.05
+
+
+class AudioRingBuffer:
+    """Кольцевой буфер PCM16 фиксированного размера с чтением без копирования.
+
+    Каждый отсчет пишется дважды - в позицию i и i + capacity, поэтому
+    любое окно длиной до capacity лежит в памяти непрерывно и отдается
+    как view. Позиции абсолютные: position - всего записано отсчетов.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=np.int16)
+        self.position = 0
+
+    def write(self, samples: np.ndarray) -> np.ndarray:
+        """Записывает отсчеты и возвращает view на записанное"""
+        n = len(samples)
+        if n > self.capacity:
+            self.position += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        capacity, data = self.capacity, self._data
+        start = self.position % capacity
+        first = min(n, capacity - start)
+        data[start:start + first] = samples[:first]
+        data[start + capacity:start + capacity + first] = samples[:first]
+        if first < n:
+            rest = n - first
+            data[:rest] = samples[first:]
+            data[capacity:capacity + rest] = samples[first:]
+        self.position += n
+        return data[start:start + n]
+
+    def since(self, position: int) -> np.ndarray:
+        """View на отсчеты с абсолютной позиции (не старше capacity)"""
+        count = min(self.position - position, self.capacity, self.position)
+        if count <= 0:
+            return self._data[:0]
+        start = (self.position - count) % self.capacity
+        return self._data[start:start + count]
+
+    def latest(self, count: int) -> np.ndarray:
+        """View на последние count отсчетов"""
+        return self.since(self.position - count)
+
+    @property
+    def available(self) -> int:
+        return min(self.position, self.capacity)
+
+
+class AudioFrontEnd:
+    """Предобработка аудио перед VAD и Whisper.
+
+    Чанк PCM16 с частотой источника передискретизируется линейной
+    интерполяцией в SAMPLE_RATE, из него вычитается постоянная
+    составляющая и применяется автоматическая регулировка усиления.
+    Результат пишется в кольцевой буфер на AUDIO_BUFFER_DURATION секунд,
+    откуда его можно перечитать ("распознать последние N секунд").
+
+    Все рабочие массивы выделяются один раз под CHUNK_SIZE отсчетов;
+    чанки длиннее обрабатываются частями. Вызывающий получает view на
+    кольцевой буфер - данные действительны до следующего круга записи.
+    """
+
+    def __init__(self, source_rate: int = None, target_rate: int = None,
+                 chunk_size: int = None, buffer_seconds: float = None):
+        self.source_rate = source_rate or config.SAMPLE_RATE
+        self.target_rate = target_rate or config.SAMPLE_RATE
+        self.chunk_size = chunk_size or config.CHUNK_SIZE
+        buffer_seconds = buffer_seconds or config.AUDIO_BUFFER_DURATION
+        self.ring = AudioRingBuffer(int(self.target_rate * buffer_seconds))
+
+        self.step = self.source_rate / self.target_rate
+        max_output = int(math.ceil(self.chunk_size / self.step)) + 2
+        # [предыдущий отсчет, чанк] - интерполяции нужен отсчет с прошлого чанка
+        self._input = np.zeros(self.chunk_size + 1, dtype=np.float32)
+        self._ramp = np.arange(max_output, dtype=np.float64)
+        self._positions = np.zeros(max_output, dtype=np.float64)
+        self._left = np.zeros(max_output, dtype=np.intp)
+        self._right = np.zeros(max_output, dtype=np.intp)
+        self._frac = np.zeros(max_output, dtype=np.float32)
+        self._low = np.zeros(max_output, dtype=np.float32)
+        self._high = np.zeros(max_output, dtype=np.float32)
+        self._output = np.zeros(max(max_output, self.chunk_size), dtype=np.int16)
+
+        self._phase = 0.0  # позиция следующего выходного отсчета относительно начала чанка
+        self._dc = 0.0
+        self.gain = 1.0
+        self.stats = {"chunks": 0, "input_samples": 0, "output_samples": 0}
+
+    def _resample(self, work: np.ndarray, n: int) -> np.ndarray:
+        """Линейная интерполяция work[0..n] (work[0] - отсчет прошлого чанка)"""
+        first = self._phase + 1.0
+        if first > n:
+            self._phase -= n
+            return self._low[:0]
+        m = int((n - first) // self.step) + 1
+
+        positions = self._positions[:m]
+        np.multiply(self._ramp[:m], self.step, out=positions)
+        positions += first
+        left, right, frac = self._left[:m], self._right[:m], self._frac[:m]
+        np.copyto(left, positions, casting="unsafe")  # floor для неотрицательных
+        np.subtract(positions, left, out=frac, casting="same_kind")
+        np.add(left, 1, out=right)
+        np.minimum(right, n, out=right)
+
+        low, high = self._low[:m], self._high[:m]
+        np.take(work, left, out=low)
+        np.take(work, right, out=high)
+        np.subtract(high, low, out=high)
+        np.multiply(high, frac, out=high)
+        np.add(low, high, out=low)
+
+        self._phase += m * self.step - n
+        return low
+
+    def _process_slice(self, chunk: np.ndarray) -> int:
+        n = len(chunk)
+        work = self._input[:n + 1]
+        # work[0] уже содержит последний отсчет прошлого чанка
+        np.copyto(work[1:], chunk, casting="unsafe")
+
+        if self.step == 1.0:
+            signal = self._low[:n]
+            np.copyto(signal, work[1:])
+        else:
+            signal = self._resample(work, n)
+        work[0] = work[n]
+
+        m = len(signal)
+        if m:
+            if config.AUDIO_DC_REMOVAL:
+                alpha = min(1.0, m / (self.target_rate * DC_TIME_CONSTANT))
+                self._dc += alpha * (float(signal.mean()) - self._dc)
+                signal -= self._dc
+            if config.AUDIO_AGC_ENABLED:
+                rms = math.sqrt(float(np.dot(signal, signal)) / m)
+                if rms > config.AUDIO_AGC_NOISE_FLOOR:
+                    desired = min(config.AUDIO_AGC_TARGET_RMS / rms, config.AUDIO_AGC_MAX_GAIN)
+                    rate = AGC_ATTACK if desired < self.gain else AGC_RELEASE
+                    self.gain += rate * (desired - self.gain)
+                signal *= self.gain
+            np.clip(signal, -32768, 32767, out=signal)
+            np.copyto(self._output[:m], signal, casting="unsafe")
+            self.ring.write(self._output[:m])
+        return m
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Обрабатывает чанк PCM16 источника; возвращает view на результат в кольцевом буфере"""
+        total = 0
+        for start in range(0, len(chunk), self.chunk_size):
+            total += self._process_slice(chunk[start:start + self.chunk_size])
+        self.stats["chunks"] += 1
+        self.stats["input_samples"] += len(chunk)
+        self.stats["output_samples"] += total
+        return self.ring.latest(total)
+
+    def append(self, samples: np.ndarray):
+        """Добавляет в буфер уже обработанный звук (захват микрофона рекордером)"""
+        self.ring.write(samples)
+        self.stats["output_samples"] += len(samples)
+
+    def last_seconds(self, seconds: float) -> Optional[np.ndarray]:
+        """Копия последних seconds секунд как float32 [-1, 1] для Whisper"""
+        count = min(int(seconds * self.target_rate), self.ring.available)
+        if count <= 0:
+            return None
+        return self.ring.latest(count).astype(np.float32) / 32768.0
+
+    def describe(self) -> dict:
+        return {
+            "source_rate": self.source_rate,
+            "target_rate": self.target_rate,
+            "buffer_seconds": round(self.ring.capacity / self.target_rate, 1),
+            "buffered_seconds": round(self.ring.available / self.target_rate, 2),
+            "dc_removal": config.AUDIO_DC_REMOVAL,
+            "agc": config.AUDIO_AGC_ENABLED,
+            "gain": round(self.gain, 2),
+            **self.stats
+        }
@@ -0,0 +1,238 @@
+import logging
+import os
+import sys
+import time
+import wave
+from typing import BinaryIO, Iterator, Optional
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+# Источник по умолчанию: микрофон (PyAudio во фронтенде обработки или внутри RealtimeSTT)
+MICROPHONE = "microphone"
+STDIN = "stdin"
+
+
+def to_mono_int16(samples: np.ndarray) -> np.ndarray:
+    """Сводит многоканальный сигнал в моно int16"""
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if samples.dtype.kind == "f":
+        samples = np.clip(samples, -1.0, 1.0) * 32767
+    return samples.astype(np.int16)
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Линейная передискретизация моно сигнала"""
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / source_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.linspace(0, len(samples) - 1, target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(samples.dtype)
+
+
+def load_audio_file(path: str, target_rate: int = None) -> np.ndarray:
+    """Загружает WAV/FLAC файл как моно int16 с нужной частотой"""
+    target_rate = target_rate or config.SAMPLE_RATE
+
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"Поддерживаются только 16-битные WAV файлы: {path}")
+            rate = wav.getframerate()
+            data = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            samples = data.reshape(-1, wav.getnchannels())
+    elif soundfile is not None:
+        samples, rate = soundfile.read(path, dtype="int16", always_2d=True)
+    else:
+        raise ValueError(f"Для чтения {os.path.splitext(path)[1]} установите пакет soundfile")
+
+    return resample(to_mono_int16(samples), rate, target_rate)
+
+
+class AudioSource:
+    """Источник аудио для SpeechProcessor.
+
+    Отдает чанки моно PCM16 с частотой sample_rate; SpeechProcessor
+    передает их в рекордер через feed_audio.
+    """
+
+    name = "base"
+    uses_microphone = False
+
+    def __init__(self, sample_rate: int = None, chunk_size: int = None, realtime: bool = None):
+        self.sample_rate = sample_rate or config.SAMPLE_RATE
+        self.chunk_size = chunk_size or config.CHUNK_SIZE
+        # realtime=True - отдаем аудио с реальной скоростью, как микрофон
+        self.realtime = config.AUDIO_FEED_REALTIME if realtime is None else realtime
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        raise NotImplementedError
+
+    def paced_chunks(self, should_stop=lambda: False) -> Iterator[np.ndarray]:
+        """Чанки с выдержкой реального времени (если включено)"""
+        started_at = time.monotonic()
+        fed_seconds = 0.0
+        for chunk in self.chunks():
+            if should_stop():
+                return
+            yield chunk
+            if self.realtime:
+                fed_seconds += len(chunk) / self.sample_rate
+                delay = started_at + fed_seconds - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def trailing_silence(self) -> np.ndarray:
+        """Тишина в конце записи, чтобы VAD закрыл последнюю фразу"""
+        seconds = config.RTT_POST_SPEECH_SILENCE + 0.5
+        return np.zeros(int(self.sample_rate * seconds), dtype=np.int16)
+
+    def describe(self) -> dict:
+        return {"type": self.name, "sample_rate": self.sample_rate, "realtime": self.realtime}
+
+
+class MicrophoneSource(AudioSource):
+    """Микрофон хоста: захватом занимается сам рекордер"""
+
+    name = MICROPHONE
+    uses_microphone = True
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        return iter(())
+
+
+class CaptureMicrophoneSource(AudioSource):
+    """Микрофон хоста, захват через PyAudio для фронтенда обработки аудио.
+
+    Открывается с частотой SAMPLE_RATE, если устройство ее поддерживает,
+    иначе с родной частотой устройства - передискретизирует фронтенд.
+    Микрофон занят только пока идет чтение чанков.
+    """
+
+    name = "microphone_capture"
+
+    def __init__(self, device_index: Optional[int] = None, **kwargs):
+        kwargs.setdefault("realtime", False)  # темп задает устройство
+        super().__init__(**kwargs)
+        self.device_index = device_index
+        self.sample_rate = self._pick_sample_rate()
+
+    def _pick_sample_rate(self) -> int:
+        audio = pyaudio.PyAudio()
+        try:
+            device = (audio.get_device_info_by_index(self.device_index) if self.device_index is not None
+                      else audio.get_default_input_device_info())
+            try:
+                audio.is_format_supported(self.sample_rate, input_device=device["index"],
+                                          input_channels=1, input_format=pyaudio.paInt16)
+                return self.sample_rate
+            except ValueError:
+                return int(device["defaultSampleRate"])
+        finally:
+            audio.terminate()
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        audio = pyaudio.PyAudio()
+        stream = None
+        try:
+            stream = audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=self.sample_rate,
+                input=True,
+                input_device_index=self.device_index,
+                frames_per_buffer=self.chunk_size
+            )
+            while True:
+                data = stream.read(self.chunk_size, exception_on_overflow=False)
+                yield np.frombuffer(data, dtype=np.int16)
+        finally:
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            audio.terminate()
+
+    def describe(self) -> dict:
+        return {**super().describe(), "device_index": self.device_index}
+
+
+class FileSource(AudioSource):
+    """WAV/FLAC файл"""
+
+    name = "file"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        samples = load_audio_file(self.path, self.sample_rate)
+        for start in range(0, len(samples), self.chunk_size):
+            yield samples[start:start + self.chunk_size]
+        yield self.trailing_silence()
+
+    def describe(self) -> dict:
+        return {**super().describe(), "path": self.path}
+
+
+class RawPCMStreamSource(AudioSource):
+    """Сырой поток PCM16 моно (по умолчанию stdin)"""
+
+    name = "pcm_stream"
+
+    def __init__(self, stream: Optional[BinaryIO] = None, **kwargs):
+        kwargs.setdefault("realtime", False)  # поток сам задает темп
+        super().__init__(**kwargs)
+        self.stream = stream or sys.stdin.buffer
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        chunk_bytes = self.chunk_size * 2
+        pending = b""
+        while True:
+            data = self.stream.read(chunk_bytes)
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % 2
+            if usable:
+                yield np.frombuffer(pending[:usable], dtype=np.int16)
+                pending = pending[usable:]
+        yield self.trailing_silence()
+
+
+def create_audio_source(spec: str = None) -> AudioSource:
+    """Создает источник по описанию: microphone, websocket, stdin/-, путь к файлу или file:путь"""
+    spec = spec or config.AUDIO_INPUT
+    if spec == MICROPHONE:
+        if config.AUDIO_FRONTEND_CAPTURE:
+            if pyaudio is not None:
+                try:
+                    return CaptureMicrophoneSource()
+                except Exception as e:
+                    logger.warning(f"Не удалось открыть микрофон через PyAudio: {e}")
+            else:
+                logger.warning("PyAudio не установлен - микрофон захватывает RealtimeSTT")
+        return MicrophoneSource()
+    if spec == "websocket":
+        from audio_stream import WebSocketAudioSource
+        return WebSocketAudioSource()
+    if spec in (STDIN, "-"):
+        return RawPCMStreamSource()
+    if spec.startswith("file:"):
+        spec = spec[len("file:"):]
+    return FileSource(spec)
@@ -0,0 +1,277 @@
+"""
+Прием аудио от удаленных клиентов через WebSocket.
+
+Протокол:
+    1. Клиент отправляет JSON {"type": "audio_stream_start", "stream_id": 1,
+       "codec": "pcm16" | "opus", "sample_rate": 16000}.
+    2. Затем бинарные кадры: заголовок STREAM_HEADER (little-endian:
+       stream_id u16, флаги u16, порядковый номер u32) и полезная нагрузка -
+       моно PCM16 или один пакет Opus.
+    3. {"type": "audio_stream_stop", "stream_id": 1} завершает поток.
+
+Кадры проходят через jitter buffer (восстановление порядка, замена
+потерянных кадров тишиной) и отдаются SpeechProcessor как AudioSource.
+"""
+import logging
+import queue
+import struct
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+from config import config
+from audio_sources import AudioSource, resample
+
+logger = logging.getLogger(__name__)
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+WEBSOCKET = "websocket"
+
+CODEC_PCM16 = "pcm16"
+CODEC_OPUS = "opus"
+
+STREAM_HEADER = struct.Struct("<HHI")
+# Номер кадра - u32 и после 2**32 - 1 продолжается с нуля
+SEQ_MODULUS = 1 << 32
+FLAG_END_OF_STREAM = 0x1
+
+# Opus допускает только эти частоты дискретизации
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class AudioStreamError(ValueError):
+    pass
+
+
+def parse_frame(frame: bytes):
+    """Разбирает бинарный кадр: (stream_id, flags, seq, memoryview нагрузки) без копирования"""
+    if len(frame) < STREAM_HEADER.size:
+        raise AudioStreamError(f"Кадр короче заголовка: {len(frame)} байт")
+    stream_id, flags, seq = STREAM_HEADER.unpack_from(frame)
+    return stream_id, flags, seq, memoryview(frame)[STREAM_HEADER.size:]
+
+
+def seq_distance(seq: int, base: int) -> int:
+    """На сколько кадров seq впереди base (отрицательное - позади).
+
+    Арифметика серийных номеров (RFC 1982) по модулю SEQ_MODULUS: номер
+    в пределах половины диапазона вперед считается более поздним, поэтому
+    переход через 2**32 не выглядит как опоздание.
+    """
+    distance = (seq - base) % SEQ_MODULUS
+    return distance - SEQ_MODULUS if distance >= SEQ_MODULUS // 2 else distance
+
+
+class JitterBuffer:
+    """Восстанавливает порядок кадров по номерам.
+
+    Кадры отдаются строго по порядку; если следующего кадра нет, а в
+    буфере уже depth более поздних, пропуск считается потерей и
+    заменяется тишиной длиной в последний кадр, но не больше
+    max_concealed кадров на один пропуск. Номера сравниваются по модулю
+    SEQ_MODULUS (см. seq_distance); скачок больше resync_frames в любую
+    сторону означает, что клиент сбросил нумерацию, и буфер продолжает
+    с нового номера, отдав то, что успел накопить.
+    """
+
+    def __init__(self, depth: int, max_concealed: int = None, resync_frames: int = None):
+        self.depth = max(0, depth)
+        self.max_concealed = (config.AUDIO_STREAM_MAX_CONCEALED_FRAMES if max_concealed is None
+                              else max_concealed)
+        self.resync_frames = max(self.depth + 1, resync_frames or config.AUDIO_STREAM_RESYNC_FRAMES)
+        self.pending: Dict[int, np.ndarray] = {}
+        # Кадры старой нумерации, которые нужно отдать до новых
+        self._released: Deque[np.ndarray] = deque()
+        self.next_seq: Optional[int] = None
+        self.last_length = 0
+        self.stats = {"received": 0, "reordered": 0, "late": 0, "duplicate": 0, "lost": 0, "resyncs": 0}
+
+    def _resync(self, seq: int):
+        for pending_seq in sorted(self.pending, key=lambda s: seq_distance(s, self.next_seq)):
+            self._released.append(self.pending[pending_seq])
+        self.pending.clear()
+        self.next_seq = seq
+        self.stats["resyncs"] += 1
+
+    def push(self, seq: int, samples: np.ndarray):
+        self.stats["received"] += 1
+        if self.next_seq is None:
+            self.next_seq = seq
+        distance = seq_distance(seq, self.next_seq)
+        if abs(distance) > self.resync_frames:
+            self._resync(seq)
+        elif distance < 0:
+            self.stats["late"] += 1
+            return
+        if seq in self.pending:
+            self.stats["duplicate"] += 1
+            return
+        if seq != self.next_seq:
+            self.stats["reordered"] += 1
+        self.pending[seq] = samples
+
+    def pop_ready(self, flush: bool = False) -> Iterator[np.ndarray]:
+        while self._released:
+            samples = self._released.popleft()
+            self.last_length = len(samples)
+            if len(samples):
+                yield samples
+        while self.pending:
+            samples = self.pending.pop(self.next_seq, None)
+            if samples is None:
+                if not flush and len(self.pending) <= self.depth:
+                    return
+                # Кадры потеряны: переходим к ближайшему пришедшему, пропуск заполняем тишиной
+                gap = min(seq_distance(seq, self.next_seq) for seq in self.pending)
+                self.stats["lost"] += gap
+                self.next_seq = (self.next_seq + gap) % SEQ_MODULUS
+                if self.last_length:
+                    for _ in range(min(gap, self.max_concealed)):
+                        yield np.zeros(self.last_length, dtype=np.int16)
+                continue
+            self.last_length = len(samples)
+            self.next_seq = (self.next_seq + 1) % SEQ_MODULUS
+            if len(samples):
+                yield samples
+
+
+class AudioStream:
+    """Один поток аудио от клиента: декодер и jitter buffer"""
+
+    def __init__(self, stream_id: int, codec: str, sample_rate: int, owner: Any = None):
+        if codec not in (CODEC_PCM16, CODEC_OPUS):
+            raise AudioStreamError(f"Неизвестный кодек: {codec}")
+        if codec == CODEC_OPUS:
+            if opuslib is None:
+                raise AudioStreamError("Для приема Opus установите пакет opuslib")
+            if sample_rate not in OPUS_SAMPLE_RATES:
+                raise AudioStreamError(f"Opus не поддерживает частоту {sample_rate}")
+        self.stream_id = stream_id
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.owner = owner
+        self.decoder = opuslib.Decoder(sample_rate, 1) if codec == CODEC_OPUS else None
+        # Максимальный пакет Opus - 120 мс
+        self._opus_frame_size = sample_rate * 120 // 1000
+        self.jitter = JitterBuffer(config.AUDIO_STREAM_JITTER_FRAMES)
+
+    def decode(self, payload: memoryview) -> np.ndarray:
+        if self.decoder is not None:
+            pcm = self.decoder.decode(bytes(payload), self._opus_frame_size)
+            return np.frombuffer(pcm, dtype="<i2")
+        if len(payload) % 2:
+            raise AudioStreamError("Длина PCM16 кадра должна быть четной")
+        # Представление над буфером кадра, без копирования
+        return np.frombuffer(payload, dtype="<i2")
+
+    def describe(self) -> dict:
+        return {
+            "stream_id": self.stream_id,
+            "codec": self.codec,
+            "sample_rate": self.sample_rate,
+            **self.jitter.stats
+        }
+
+
+class WebSocketAudioSource(AudioSource):
+    """Аудио от клиентов WebSocket.
+
+    У сервера один рекордер, поэтому одновременно принимается один
+    поток; следующий клиент может начать передачу после остановки
+    текущего потока.
+    """
+
+    name = WEBSOCKET
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("realtime", False)  # темп задает клиент
+        super().__init__(**kwargs)
+        self.stream: Optional[AudioStream] = None
+        self.output: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=config.AUDIO_STREAM_QUEUE_FRAMES)
+        self.dropped_frames = 0
+        self._lock = threading.Lock()
+
+    def open_stream(self, stream_id: int, codec: str = CODEC_PCM16, sample_rate: int = None,
+                    owner: Any = None) -> AudioStream:
+        with self._lock:
+            if self.stream is not None and self.stream.owner is not owner:
+                raise AudioStreamError("Уже идет поток от другого клиента")
+            previous = self.stream
+            self.stream = AudioStream(stream_id, codec, sample_rate or self.sample_rate, owner)
+        if previous is not None:
+            # Повторное открытие: дописываем накопленное в буфере старого потока
+            self._enqueue(previous, flush=True)
+        logger.info(f"🎙️ Поток аудио {stream_id} открыт: {codec}, {self.stream.sample_rate} Гц")
+        return self.stream
+
+    def close_stream(self, stream_id: Optional[int] = None, owner: Any = None) -> Optional[dict]:
+        """Закрывает поток (по номеру или владельцу), дописывая буфер"""
+        with self._lock:
+            stream = self.stream
+            if stream is None:
+                return None
+            if stream_id is not None and stream.stream_id != stream_id:
+                return None
+            if owner is not None and stream.owner is not owner:
+                return None
+            self.stream = None
+        self._enqueue(stream, flush=True)
+        self._put(self.trailing_silence())
+        logger.info(f"🎙️ Поток аудио {stream.stream_id} закрыт: {stream.describe()}")
+        return stream.describe()
+
+    def push_frame(self, frame: bytes, owner: Any = None):
+        """Принимает бинарный кадр из WebSocket (вызывается в event loop)"""
+        stream_id, flags, seq, payload = parse_frame(frame)
+        stream = self.stream
+        if stream is None or stream.stream_id != stream_id or (owner is not None and stream.owner is not owner):
+            raise AudioStreamError(f"Поток {stream_id} не открыт")
+        if len(payload):
+            stream.jitter.push(seq, stream.decode(payload))
+        if flags & FLAG_END_OF_STREAM:
+            self.close_stream(stream_id, owner)
+        else:
+            self._enqueue(stream)
+
+    def _enqueue(self, stream: AudioStream, flush: bool = False):
+        for samples in stream.jitter.pop_ready(flush=flush):
+            if stream.sample_rate != self.sample_rate:
+                samples = resample(samples, stream.sample_rate, self.sample_rate)
+            self._put(samples)
+
+    def _put(self, samples: np.ndarray):
+        try:
+            self.output.put_nowait(samples)
+        except queue.Full:
+            # Распознавание не успевает: выбрасываем самый старый кадр
+            try:
+                self.output.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped_frames += 1
+            self.output.put_nowait(samples)
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        # Пустой чанк раз в таймаут дает потоку подачи проверить остановку
+        empty = np.zeros(0, dtype=np.int16)
+        while True:
+            try:
+                yield self.output.get(timeout=0.2)
+            except queue.Empty:
+                yield empty
+
+    def describe(self) -> dict:
+        stream = self.stream
+        return {
+            **super().describe(),
+            "stream": stream.describe() if stream else None,
+            "queued_frames": self.output.qsize(),
+            "dropped_frames": self.dropped_frames,
+            "opus_available": opuslib is not None
+        }
@@ -0,0 +1,132 @@
+"""
+Пакетная транскрипция каталога аудиофайлов на пуле процессов.
+
+Пример:
+    python batch_transcribe.py recordings/ --output transcripts/ --workers 4
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from config import config
+from stt_engine import STTEngineSettings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".m4a")
+
+# Модель загружается один раз на процесс пула
+_worker_model = None
+_worker_settings: Optional[STTEngineSettings] = None
+
+
+def _init_worker(settings: STTEngineSettings, cpu_threads: int):
+    """Инициализирует процесс пула: загружает модель Whisper"""
+    global _worker_model, _worker_settings
+    from faster_whisper import WhisperModel
+
+    _worker_settings = settings
+    _worker_model = WhisperModel(
+        settings.final.model,
+        device=settings.device,
+        compute_type=settings.compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=settings.num_workers
+    )
+
+
+def format_timestamp(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def _transcribe_file(path: str, output_dir: str) -> Dict:
+    """Транскрибирует один файл и пишет .txt и .json рядом в output_dir"""
+    started_at = time.time()
+    segments, info = _worker_model.transcribe(
+        path,
+        language=_worker_settings.language or None,
+        beam_size=_worker_settings.final.beam_size
+    )
+    records = [{"start": s.start, "end": s.end, "text": s.text.strip()} for s in segments]
+
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(output_dir, f"{base_name}.txt"), "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(f"[{format_timestamp(r['start'])} -> {format_timestamp(r['end'])}] {r['text']}\n")
+    with open(os.path.join(output_dir, f"{base_name}.json"), "w", encoding="utf-8") as f:
+        json.dump({"file": path, "duration": info.duration, "segments": records}, f, ensure_ascii=False, indent=2)
+
+    elapsed = time.time() - started_at
+    return {
+        "file": path,
+        "segments": len(records),
+        "duration": info.duration,
+        "elapsed": elapsed,
+        "rtf": elapsed / info.duration if info.duration else None
+    }
+
+
+def find_audio_files(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def transcribe_directory(input_dir: str, output_dir: str, workers: int = None) -> List[Dict]:
+    """Транскрибирует все аудиофайлы каталога на пуле процессов"""
+    files = find_audio_files(input_dir)
+    if not files:
+        logger.warning(f"В каталоге {input_dir} нет аудиофайлов")
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    settings = STTEngineSettings.from_config(use_microphone=False)
+    # Делим ядра между процессами, чтобы они не конкурировали за потоки
+    cpu_threads = settings.cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+
+    logger.info(f"🗂️ Файлов: {len(files)}, процессов: {workers}, потоков на процесс: {cpu_threads}")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(settings, cpu_threads)) as pool:
+        futures = {pool.submit(_transcribe_file, path, output_dir): path for path in files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                logger.info(f"✅ {path}: {result['segments']} сегментов, RTF {result['rtf'] or 0:.2f}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка транскрипции {path}: {e}")
+                results.append({"file": path, "error": str(e)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная транскрипция аудиофайлов")
+    parser.add_argument("input_dir", help="Каталог с WAV/FLAC/MP3 файлами")
+    parser.add_argument("--output", default="transcripts", help="Каталог для транскрипций")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов")
+    parser.add_argument("--model", default=None, help=f"Модель Whisper (по умолчанию {config.WHISPER_MODEL})")
+    args = parser.parse_args()
+
+    if args.model:
+        config.WHISPER_MODEL = args.model
+
+    results = transcribe_directory(args.input_dir, args.output, args.workers)
+    failed = sum(1 for r in results if "error" in r)
+    print(f"Готово: {len(results) - failed} файлов, ошибок: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Сквозной бенчмарк задержек: аудио -> транскрипция -> первый токен -> клиент.
+
+Проигрывает записанные фразы в SpeechProcessor, направляет AIResponder на
+локальную LLM заглушку и работает через настоящий WebSocket сервер
+StealthAssistant, ведя себя как фронтенд с автоотправкой.
+
+Задержки сопоставляются с фразами по тексту, а не по порядку: если STT
+разбил фразу на две или пропустил ее, остальные фразы не сдвигаются.
+Текст фразы берется из файла рядом с аудио (phrase.wav -> phrase.txt);
+без него транскрипцией фразы считается первая, пришедшая после конца
+ее речи и до конца речи следующей фразы.
+
+Примеры:
+    python benchmark.py --fixtures fixtures/ --output bench.json
+    python benchmark.py --questions questions.txt --latency 0.5 --tokens-per-second 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import websockets
+
+from config import config
+from audio_sources import AudioSource, load_audio_file
+from llm_stub import LLMStubServer, StubSettings
+from answer_cache import normalize_question
+from speculative import texts_match
+
+logger = logging.getLogger("benchmark")
+
+# Порог амплитуды PCM16, выше которого отсчет считается речью
+SPEECH_AMPLITUDE_THRESHOLD = 500
+
+STAGES = (
+    "speech_end_to_transcript",
+    "transcript_to_first_token",
+    "first_token_to_broadcast",
+    "speech_end_to_first_token_client",
+)
+
+
+def expected_text(path: str) -> Optional[str]:
+    """Текст фразы из файла рядом с аудио, если он есть"""
+    text_path = os.path.splitext(path)[0] + ".txt"
+    if not os.path.exists(text_path):
+        return None
+    with open(text_path, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+class ReplayAudioSource(AudioSource):
+    """Проигрывает фразы из файлов подряд и запоминает моменты конца речи"""
+
+    name = "replay"
+
+    def __init__(self, paths: List[str], gap: float, **kwargs):
+        kwargs.setdefault("realtime", True)  # бенчмарк должен идти в реальном времени
+        super().__init__(**kwargs)
+        self.paths = paths
+        self.gap = gap
+        # Фразы: {"text": ожидаемый текст или None, "speech_end": момент конца речи}
+        self.utterances: List[dict] = []
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        silence = np.zeros(int(self.sample_rate * self.gap), dtype=np.int16)
+        for path in self.paths:
+            samples = load_audio_file(path, self.sample_rate)
+            voiced = np.flatnonzero(np.abs(samples.astype(np.int32)) > SPEECH_AMPLITUDE_THRESHOLD)
+            speech_end = int(voiced[-1]) if len(voiced) else len(samples) - 1
+
+            for start in range(0, len(samples), self.chunk_size):
+                chunk = samples[start:start + self.chunk_size]
+                if start <= speech_end < start + len(chunk):
+                    self.utterances.append({"text": expected_text(path), "speech_end": time.time()})
+                yield chunk
+            yield silence
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "mean": None}
+    data = np.asarray(values) * 1000.0  # миллисекунды
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(data, 50)), 1),
+        "p95": round(float(np.percentile(data, 95)), 1),
+        "p99": round(float(np.percentile(data, 99)), 1),
+        "mean": round(float(data.mean()), 1)
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _texts_overlap(expected: str, text: str) -> bool:
+    """Текст события относится к фразе: совпадает или содержит ее (или ее часть)"""
+    if texts_match(expected, text):
+        return True
+    expected, text = normalize_question(expected), normalize_question(text)
+    return bool(expected and text) and (expected in text or text in expected)
+
+
+def match_utterances(utterances: List[dict], events: List[tuple]) -> List[Optional[float]]:
+    """Для каждой фразы - время ее события (транскрипции, первого токена) или None.
+
+    events - (текст, время) в порядке прихода. Событие берется не раньше
+    конца речи фразы; при известном тексте фразы - первое совпавшее по
+    тексту, иначе первое до конца речи следующей фразы.
+    """
+    matched: List[Optional[float]] = []
+    used = set()
+    for index, utterance in enumerate(utterances):
+        window_end = utterances[index + 1]["speech_end"] if index + 1 < len(utterances) else float("inf")
+        found = None
+        for event_index, (text, timestamp) in enumerate(events):
+            if event_index in used or timestamp < utterance["speech_end"]:
+                continue
+            if utterance["text"] is not None:
+                if not _texts_overlap(utterance["text"], text):
+                    continue
+            elif timestamp >= window_end:
+                break
+            found = event_index
+            break
+        if found is not None:
+            used.add(found)
+        matched.append(events[found][1] if found is not None else None)
+    return matched
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BenchmarkClient:
+    """WebSocket клиент, ведущий себя как фронтенд с автоотправкой"""
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.transcripts: List[dict] = []
+        self.answers_done = 0
+        self._last_transcript_ts: Optional[float] = None
+        self._first_delta_seen = set()
+        # (вопрос, время получения первого токена клиентом)
+        self._first_tokens: List[tuple] = []
+        self.unmatched = 0  # фразы без транскрипции
+
+    async def _handle(self, websocket, message: dict, received_at: float):
+        message_type = message.get("type")
+
+        if message_type == "speech_transcription":
+            self.transcripts.append({"text": message["text"], "timestamp": message["timestamp"]})
+            self._last_transcript_ts = message["timestamp"]
+
+        elif message_type == "question_ready" and not message.get("auto_asked"):
+            await websocket.send(json.dumps({"type": "manual_question", "question": message["text"]}))
+
+        elif message_type == "ai_response_delta":
+            request_id = message["request_id"]
+            if request_id in self._first_delta_seen:
+                return
+            self._first_delta_seen.add(request_id)
+            self._first_tokens.append((message.get("question", ""), received_at))
+            self.samples["first_token_to_broadcast"].append(received_at - message["timestamp"])
+            if self._last_transcript_ts is not None:
+                self.samples["transcript_to_first_token"].append(message["timestamp"] - self._last_transcript_ts)
+
+        elif message_type == "ai_response_done":
+            self.answers_done += 1
+
+    async def run(self, start_messages: List[dict], expected_answers: int, timeout: float,
+                  on_started=None):
+        async with websockets.connect(self.uri, max_size=None) as websocket:
+            # Ждем готовности моделей
+            welcome = json.loads(await websocket.recv())
+            if not welcome.get("ready"):
+                while json.loads(await websocket.recv()).get("type") != "ready":
+                    pass
+
+            for message in start_messages:
+                await websocket.send(json.dumps(message))
+            if on_started:
+                on_started()
+
+            deadline = time.time() + timeout
+            while self.answers_done < expected_answers and time.time() < deadline:
+                try:
+                    raw = await asyncio.wait_for(websocket.recv(), timeout=max(deadline - time.time(), 0.01))
+                except asyncio.TimeoutError:
+                    break
+                await self._handle(websocket, json.loads(raw), time.time())
+
+    def finalize(self, utterances: List[dict]):
+        """Считает задержки от конца речи, сопоставляя события с фразами (match_utterances)"""
+        transcripts = [(t["text"], t["timestamp"]) for t in self.transcripts]
+        for stage, events in (("speech_end_to_transcript", transcripts),
+                              ("speech_end_to_first_token_client", self._first_tokens)):
+            matched = match_utterances(utterances, events)
+            for utterance, timestamp in zip(utterances, matched):
+                if timestamp is not None:
+                    self.samples[stage].append(timestamp - utterance["speech_end"])
+            if stage == "speech_end_to_transcript":
+                self.unmatched = matched.count(None)
+
+
+def run_benchmark(args) -> dict:
+    # Заглушка LLM и изолированная конфигурация
+    stub = LLMStubServer(settings=StubSettings(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens
+    )).start()
+    config.ANSWER_CACHE_ENABLED = False  # меряем полный путь запроса
+    config.WEBSOCKET_HOST = "127.0.0.1"
+    config.WEBSOCKET_PORT = free_port()
+
+    # Импорт после настройки конфигурации
+    from main import StealthAssistant
+    from llm_router import LLMEndpoint, llm_router
+
+    # Весь трафик - только в заглушку, даже если настроены LLM_ENDPOINTS
+    llm_router.set_endpoints([LLMEndpoint("stub", stub.base_url, config.OPENAI_MODEL)])
+
+    questions: List[str] = []
+    source = None
+    if args.fixtures:
+        paths = sorted(
+            os.path.join(args.fixtures, name) for name in os.listdir(args.fixtures)
+            if name.lower().endswith((".wav", ".flac"))
+        )
+        source = ReplayAudioSource(paths, gap=args.gap)
+        expected = len(paths)
+        start_messages = [{"type": "start_listening"}]
+    else:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        expected = len(questions)
+        start_messages = []
+
+    assistant = StealthAssistant(audio_source=source)
+    server_thread = threading.Thread(target=assistant.start_server, daemon=True, name="BenchmarkServer")
+    server_thread.start()
+
+    client = BenchmarkClient(f"ws://{config.WEBSOCKET_HOST}:{config.WEBSOCKET_PORT}")
+    simulated: List[dict] = []
+
+    async def drive():
+        # Ждем, пока сервер откроет порт
+        for _ in range(100):
+            try:
+                await asyncio.open_connection(config.WEBSOCKET_HOST, config.WEBSOCKET_PORT)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        if questions:
+            # Без аудио: имитируем распознанную речь через simulate_speech
+            async def simulate():
+                async with websockets.connect(client.uri) as websocket:
+                    await websocket.recv()
+                    for question in questions:
+                        simulated.append({"text": question, "speech_end": time.time()})
+                        await websocket.send(json.dumps({"type": "simulate_speech", "text": question}))
+                        await asyncio.sleep(args.gap)
+            await asyncio.gather(client.run([], expected, args.timeout), simulate())
+        else:
+            await client.run(start_messages, expected, args.timeout)
+
+    started_at = time.time()
+    asyncio.run(drive())
+    elapsed = time.time() - started_at
+
+    client.finalize(source.utterances if source else simulated)
+    assistant.loop.call_soon_threadsafe(assistant.loop.stop)
+    server_thread.join(timeout=5)
+    stub.stop()
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "elapsed": round(elapsed, 2),
+        "mode": "audio" if source else "text",
+        "utterances": expected,
+        "answers": client.answers_done,
+        "unmatched_utterances": client.unmatched,
+        "settings": {
+            "llm_latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "answer_tokens": args.answer_tokens,
+            "gap": args.gap,
+            "whisper_model": config.WHISPER_MODEL,
+            "post_speech_silence": config.RTT_POST_SPEECH_SILENCE
+        },
+        "stages_ms": {stage: percentiles(values) for stage, values in client.samples.items()},
+        "llm_stub": dict(stub.stats)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк задержек Stealth AI Assistant")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--fixtures", help="Каталог с WAV/FLAC фразами (по одной на файл)")
+    inputs.add_argument("--questions", help="Текстовый файл с вопросами (без STT)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Задержка первого токена заглушки, с")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--gap", type=float, default=5.0, help="Пауза между фразами, с")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_benchmark(args)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"Ревизия: {result['revision']}, ответов: {result['answers']}/{result['utterances']}")
+    for stage, stats in result["stages_ms"].items():
+        print(f"  {stage:36s} p50={stats['p50']} p95={stats['p95']} p99={stats['p99']} (n={stats['count']})")
+    print(f"Результат записан в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
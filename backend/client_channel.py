@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Политики для клиента, который не успевает читать
+SLOW_POLICY_DROP_OLDEST = "drop_oldest"  # выбрасывать самые старые сообщения
+SLOW_POLICY_DOWNGRADE = "downgrade"  # перестать слать дельты; если не помогло - отключить
+SLOW_POLICY_DISCONNECT = "disconnect"  # закрыть соединение
+
+
+def _merge_delta(queued: dict, new: dict) -> Optional[dict]:
+    if queued.get("request_id") != new.get("request_id"):
+        return None
+    return {**new, "delta": queued["delta"] + new["delta"]}
+
+
+def _merge_partial(queued: dict, new: dict) -> Optional[dict]:
+    # Новая фраза начинается с keep == 0 и не зависит от прошлой
+    if queued.get("utterance") != new.get("utterance"):
+        return new
+    # Два диффа подряд - один дифф от базы первого к результату второго
+    if new["keep"] >= queued["keep"]:
+        keep = queued["keep"]
+        append = queued["append"][:new["keep"] - queued["keep"]] + new["append"]
+    else:
+        keep, append = new["keep"], new["append"]
+    return {**new, "base": queued["base"], "keep": keep, "append": append}
+
+
+# Сообщения, которые можно склеивать в очереди: тип -> функция слияния.
+# Словари сообщений общие для всех клиентов, поэтому слияние создает новый.
+COALESCE_RULES: Dict[str, Callable[[dict, dict], Optional[dict]]] = {
+    "ai_response_delta": _merge_delta,
+    "speech_transcription_partial": _merge_partial,
+}
+
+# Сообщения, которые можно потерять: итог приходит отдельным сообщением
+# (ai_response_done содержит полный ответ, финальная транскрипция - полный текст).
+# После потери диффа промежуточной транскрипции следующий уходит полным (keep == 0),
+# иначе клиент не сможет применить ни один дифф до конца фразы.
+PARTIAL_TYPE = "speech_transcription_partial"
+DROPPABLE_TYPES = frozenset(COALESCE_RULES)
+
+
+class _Outgoing:
+    __slots__ = ("type", "message", "encoded")
+
+    def __init__(self, message: dict, encoded: Optional[str]):
+        self.type = message.get("type")
+        self.message = message
+        self.encoded = encoded
+
+
+class ClientChannel:
+    """Очередь исходящих сообщений одного клиента со своей задачей записи.
+
+    Широковещательная рассылка только кладет сообщение в очереди и не
+    ждет клиентов, поэтому медленный клиент не задерживает остальных.
+    Когда очередь копится, дельты и промежуточные результаты склеиваются;
+    при переполнении срабатывает политика CLIENT_SLOW_POLICY.
+
+    Канал держит текст текущей фразы, собранный из диффов, чтобы после
+    потерянного диффа отправить следующий полностью.
+    """
+
+    def __init__(self, websocket: Any, on_closed: Optional[Callable[[Any], None]] = None,
+                 max_size: int = None, policy: str = None):
+        self.websocket = websocket
+        self.on_closed = on_closed
+        self.max_size = max_size or config.CLIENT_QUEUE_SIZE
+        self.policy = policy or config.CLIENT_SLOW_POLICY
+        self.queue: Deque[_Outgoing] = deque()
+        self.degraded = False
+        self.closed = False
+        self.stats = {"sent": 0, "coalesced": 0, "dropped": 0, "max_depth": 0, "downgrades": 0,
+                      "partial_resyncs": 0}
+        self._partial_utterance = None
+        self._partial_text = ""
+        self._partial_resync = False
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def send(self, message: dict, encoded: Optional[str] = None):
+        """Ставит сообщение в очередь (не блокирует)"""
+        if self.closed:
+            return
+        message_type = message.get("type")
+        if message_type == PARTIAL_TYPE:
+            message, encoded = self._track_partial(message, encoded)
+
+        if self.degraded and message_type in DROPPABLE_TYPES:
+            self._dropped(message_type)
+            return
+
+        # Писатель занят - пробуем склеить с последним сообщением того же типа
+        if self.queue and message_type in COALESCE_RULES:
+            tail = self.queue[-1]
+            merged = COALESCE_RULES[message_type](tail.message, message) if tail.type == message_type else None
+            if merged is not None:
+                tail.message = merged
+                tail.encoded = encoded if merged is message else None  # иначе перекодируется при отправке
+                self.stats["coalesced"] += 1
+                return
+
+        if len(self.queue) >= self.max_size and not self._make_room():
+            return
+
+        self.queue.append(_Outgoing(message, encoded))
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self.queue))
+        self._wakeup.set()
+
+    def _track_partial(self, message: dict, encoded: Optional[str]):
+        """Обновляет текст фразы; после потери диффа заменяет его полным текстом"""
+        if message["utterance"] != self._partial_utterance:
+            self._partial_utterance = message["utterance"]
+            self._partial_text = ""
+            # Первый дифф фразы и так полный
+            self._partial_resync = False
+        self._partial_text = self._partial_text[:message["keep"]] + message["append"]
+        if not self._partial_resync or message["keep"] == 0:
+            self._partial_resync = False
+            return message, encoded
+        self._partial_resync = False
+        self.stats["partial_resyncs"] += 1
+        return {**message, "keep": 0, "append": self._partial_text}, None
+
+    def _dropped(self, message_type: str, count: int = 1):
+        self.stats["dropped"] += count
+        if message_type == PARTIAL_TYPE:
+            self._partial_resync = True
+
+    def _make_room(self) -> bool:
+        """Применяет политику медленного клиента; False - сообщение не ставится"""
+        if self.policy == SLOW_POLICY_DOWNGRADE:
+            if not self.degraded:
+                self.degraded = True
+                self.stats["downgrades"] += 1
+                logger.warning("🐢 Клиент %s не успевает читать - отключаем дельты", self.websocket.remote_address)
+                kept = deque(item for item in self.queue if item.type not in DROPPABLE_TYPES)
+                for item in self.queue:
+                    if item.type in DROPPABLE_TYPES:
+                        self._dropped(item.type)
+                self.queue = kept
+            if len(self.queue) < self.max_size:
+                return True
+            # Очередь забита обязательными сообщениями - терять их нельзя
+
+        if self.policy in (SLOW_POLICY_DISCONNECT, SLOW_POLICY_DOWNGRADE):
+            logger.warning("🐢 Клиент %s не успевает читать - отключаем", self.websocket.remote_address)
+            self.close()
+            asyncio.get_running_loop().create_task(self.websocket.close(1013, "slow consumer"))
+            return False
+
+        # Выбрасываем самое старое сообщение, по возможности из теряемых
+        for index, item in enumerate(self.queue):
+            if item.type in DROPPABLE_TYPES:
+                del self.queue[index]
+                break
+        else:
+            item = self.queue.popleft()
+        self._dropped(item.type)
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                item = self.queue.popleft()
+                encoded = item.encoded
+                if encoded is None:
+                    encoded = json.dumps(item.message, ensure_ascii=False)
+                with metrics.timer("client_send_seconds", "Отправка сообщения одному клиенту"):
+                    await self.websocket.send(encoded)
+                self.stats["sent"] += 1
+
+                # Клиент догнал очередь - возвращаем дельты
+                if self.degraded and len(self.queue) <= self.max_size // 4:
+                    self.degraded = False
+                    logger.info("✅ Клиент %s снова получает дельты", self.websocket.remote_address)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("❌ Ошибка при отправке сообщения клиенту %s: %s", self.websocket.remote_address, e,
+                         extra={"category": "client_send"})
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self.on_closed:
+            self.on_closed(self.websocket)
+
+    def get_stats(self) -> dict:
+        return {
+            "client": str(self.websocket.remote_address),
+            "depth": len(self.queue),
+            "degraded": self.degraded,
+            **self.stats
+        }
+
+
+def summarize_channels(channels) -> dict:
+    """Сводка по всем очередям для get_status"""
+    channels = list(channels)
+    return {
+        "policy": config.CLIENT_SLOW_POLICY,
+        "max_queue": config.CLIENT_QUEUE_SIZE,
+        "total_depth": sum(len(c.queue) for c in channels),
+        "total_dropped": sum(c.stats["dropped"] for c in channels),
+        "clients": [c.get_stats() for c in channels],
+        "timestamp": time.time()
+    }
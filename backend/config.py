@@ -1,3 +1,4 @@
+import json
 import os
 from dataclasses import dataclass
 from typing import Optional
@@ -10,20 +11,133 @@ class Config:
     OPENAI_MODEL: str = "gpt-3.5-turbo"
     OPENAI_TEMPERATURE: float = 0.7
     OPENAI_MAX_TOKENS: int = 1000
+    AI_STREAMING: bool = True  # потоковая выдача ответа (SSE) клиентам
+    AI_REQUEST_POLICY: str = "supersede"  # supersede - новый вопрос отменяет старые, parallel - все выполняются
+    
+    # История диалога (бюджет токенов и резюме)
+    HISTORY_TOKEN_BUDGET: int = 1500  # токенов истории в промпте (если не задано в профиле)
+    HISTORY_MAX_MESSAGES: int = 40  # жесткий предел хранимых сообщений
+    HISTORY_SUMMARY_ENABLED: bool = True  # сворачивать вытесненные сообщения в резюме
+    HISTORY_SUMMARY_MAX_TOKENS: int = 200  # размер резюме
+    
+    # HTTP клиент (общий пул соединений к LLM API)
+    HTTP_MAX_CONNECTIONS: int = 10  # максимум одновременных соединений
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 5  # соединений, удерживаемых в пуле
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0  # секунд простоя до закрытия соединения
+    HTTP2_ENABLED: bool = False  # требует пакет h2
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # секунд
+    HTTP_READ_TIMEOUT: float = 30.0  # секунд
+    HTTP_POOL_TIMEOUT: float = 5.0  # ожидание свободного соединения в пуле
+    
+    # Планировщик LLM запросов
+    LLM_MAX_CONCURRENCY: int = 4  # одновременных запросов к LLM API
+    LLM_MAX_RETRIES: int = 3  # повторов при 429/5xx и сетевых ошибках
+    LLM_RETRY_BASE_DELAY: float = 0.25  # секунд, база экспоненциальной задержки
+    LLM_RETRY_MAX_DELAY: float = 4.0  # секунд, потолок задержки между повторами
+    LLM_LATENCY_BUDGET: float = 20.0  # секунд на все попытки одного запроса
+    LLM_HEDGING_ENABLED: bool = False  # дублировать запрос, не ответивший за p95
+    LLM_HEDGING_MIN_SAMPLES: int = 20  # замеров до включения дублирования
+    LLM_LATENCY_WINDOW: int = 200  # замеров времени ответа для оценки p95
+    
+    # Маршрутизация между несколькими OpenAI-совместимыми API
+    LLM_ROUTER_EWMA_ALPHA: float = 0.2  # вес нового замера в скользящих оценках TTFB и ошибок
+    LLM_BREAKER_FAILURES: int = 3  # ошибок подряд до отключения endpoint'а
+    LLM_BREAKER_COOLDOWN: float = 30.0  # секунд до пробного запроса к отключенному endpoint'у
+    # Список {"name", "base_url", "model", "api_key" или "api_key_env"} (или JSON в переменной
+    # окружения LLM_ENDPOINTS). Пустой - один endpoint из PROXY_API_BASE_URL/OPENAI_MODEL/PROXYAPI_KEY.
+    # Заглушка llm_stub.py подключается как {"name": "stub", "base_url": "http://127.0.0.1:8099/v1"}
+    LLM_ENDPOINTS = []
+    
+    # Кэш ответов AI
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 256  # максимум ответов (LRU)
+    ANSWER_CACHE_TTL: float = 3600.0  # секунд жизни ответа (0 - без ограничения)
+    ANSWER_CACHE_SIMILARITY: float = 0.88  # порог косинусной близости для похожих вопросов
+    ANSWER_CACHE_MIN_SIMILAR_LENGTH: int = 15  # короче - только точное совпадение
+    ANSWER_CACHE_NGRAM: int = 3  # длина символьных n-грамм
+    ANSWER_CACHE_VECTOR_DIM: int = 2048  # размерность хэшированных векторов
+    ANSWER_CACHE_PATH: Optional[str] = None  # файл для хранения кэша на диске
+    ANSWER_CACHE_SAVE_DELAY: float = 5.0  # секунд копить изменения перед записью файла
+    
+    # Локальная база подготовленных ответов (корпус задается ключом "corpus" профиля)
+    KNOWLEDGE_ENABLED: bool = True
+    KNOWLEDGE_INDEX_DIR: Optional[str] = None  # каталог индексов (None - <корпус>.index рядом с корпусом)
+    KNOWLEDGE_ANSWER_THRESHOLD: float = 0.85  # близость к подготовленному вопросу для ответа без LLM
+    KNOWLEDGE_CONTEXT_THRESHOLD: float = 0.3  # минимальная близость фрагмента для контекста промпта
+    KNOWLEDGE_CONTEXT_TOP_K: int = 3  # фрагментов в контексте
+    KNOWLEDGE_CONTEXT_MAX_CHARS: int = 1500  # предел длины контекста в промпте
     
     # WebSocket настройки
     WEBSOCKET_HOST: str = "localhost"
     WEBSOCKET_PORT: int = 8765
+    CLIENT_QUEUE_SIZE: int = 256  # предел очереди исходящих сообщений одного клиента
+    SESSION_MAX_COUNT: int = 32  # одновременно хранимых сессий пользователей
+    SESSION_IDLE_TIMEOUT: float = 1800.0  # секунд без соединений до удаления сессии
+    SESSION_EVICT_INTERVAL: float = 60.0  # период проверки простаивающих сессий
+    SESSION_DEFAULT_TOPICS: tuple = ("speech",)  # подписки новой сессии
+    CLIENT_SLOW_POLICY: str = "downgrade"  # downgrade - без дельт (затем отключать), drop_oldest - терять старые, disconnect - отключать
+    
+    # Метрики задержек
+    METRICS_ENABLED: bool = True  # гистограммы задержек по этапам конвейера
+    METRICS_HTTP_PORT: Optional[int] = None  # порт HTTP listener в формате Prometheus (None - выключен)
+    
+    # Журналирование (фоновый поток записи)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "console"  # console или json (JSON lines)
+    LOG_FILE: Optional[str] = None  # файл JSON lines (None - только консоль)
+    LOG_RING_SIZE: int = 1000  # последних записей в памяти для get_logs
+    # Предел записей в секунду для частых категорий (предупреждения и ошибки не ограничиваются)
+    LOG_RATE_LIMITS = {
+        "transcript": 5.0,
+        "broadcast": 2.0,
+        "client_send": 1.0,
+        "ai_stream": 2.0
+    }
     
     # Аудио настройки
     SAMPLE_RATE: int = 16000
     CHUNK_SIZE: int = 1024
-    AUDIO_BUFFER_DURATION: int = 15  # секунд
+    AUDIO_BUFFER_DURATION: int = 15  # секунд в кольцевом буфере (для повторного распознавания)
+    AUDIO_INPUT: str = "microphone"  # microphone, websocket (аудио от клиентов), stdin (сырой PCM16 16 кГц) или путь к WAV/FLAC
+    AUDIO_FEED_REALTIME: bool = True  # подавать файлы со скоростью реального времени
+    AUDIO_STREAM_JITTER_FRAMES: int = 4  # кадров ожидания пропущенного номера до признания потери
+    AUDIO_STREAM_MAX_CONCEALED_FRAMES: int = 5  # предел кадров тишины на месте одного пропуска
+    AUDIO_STREAM_RESYNC_FRAMES: int = 100  # скачок номера больше этого - клиент сбросил нумерацию
+    AUDIO_STREAM_QUEUE_FRAMES: int = 200  # предел очереди кадров перед распознаванием
+    AUDIO_FRONTEND_CAPTURE: bool = True  # микрофон захватывает фронтенд (PyAudio), а не RealtimeSTT
+    AUDIO_DC_REMOVAL: bool = True  # вычитать постоянную составляющую
+    AUDIO_AGC_ENABLED: bool = True  # автоматическая регулировка усиления
+    AUDIO_AGC_TARGET_RMS: float = 3000.0  # целевой уровень речи (PCM16)
+    AUDIO_AGC_MAX_GAIN: float = 4.0  # максимальное усиление
+    AUDIO_AGC_NOISE_FLOOR: float = 200.0  # уровень тишины: ниже усиление не меняется
+    AUDIO_RETRANSCRIBE_MAX_SECONDS: float = 15.0  # предел запроса "распознать последние N секунд"
+    EVENT_BRIDGE_CAPACITY: int = 1024  # событий распознавания в буфере до разбора event loop
     
     # Whisper настройки
     WHISPER_MODEL: str = "base"
     WHISPER_LANGUAGE: str = "ru"
     WHISPER_DEVICE: str = "auto"  # auto, cpu, cuda
+    WHISPER_COMPUTE_TYPE: str = "auto"  # auto, int8, int8_float16, int8_float32, float16, float32
+    WHISPER_BEAM_SIZE: int = 5
+    WHISPER_REALTIME_MODEL: str = "tiny"  # модель для промежуточной транскрипции
+    WHISPER_REALTIME_BEAM_SIZE: int = 1
+    WHISPER_CPU_THREADS: int = 0  # 0 - по умолчанию CTranslate2
+    WHISPER_NUM_WORKERS: int = 1
+    STT_ENGINE: str = "realtime_stt"
+    WARMUP_ENABLED: bool = True  # прогон синтетического аудио после загрузки моделей
+    WARMUP_AUDIO_SECONDS: float = 1.0
+    WARMUP_TIMEOUT: float = 30.0  # секунд ожидания прогрева финальной модели
+    
+    # Распознавание речи в отдельном процессе (speech_worker.py)
+    SPEECH_WORKER_ENABLED: bool = False
+    SPEECH_WORKER_START_METHOD: str = "spawn"  # fork небезопасен при запущенных потоках и CUDA
+    SPEECH_WORKER_START_TIMEOUT: float = 300.0  # загрузка и прогрев моделей в новом процессе
+    SPEECH_WORKER_CALL_TIMEOUT: float = 5.0  # ожидание ответа на вызов метода
+    SPEECH_WORKER_HEARTBEAT_INTERVAL: float = 1.0
+    SPEECH_WORKER_HEARTBEAT_TIMEOUT: float = 10.0  # без heartbeat дольше - процесс завис
+    SPEECH_WORKER_RESTART_DELAY: float = 1.0  # пауза перед перезапуском, удваивается при неудачах
+    SPEECH_WORKER_RESTART_MAX_DELAY: float = 30.0
+    SPEECH_WORKER_BUFFER_SECONDS: float = 5.0  # аудио в разделяемой памяти
     
     # VAD настройки
     VAD_THRESHOLD: float = 0.5
@@ -38,28 +152,56 @@ class Config:
     RTT_BUFFER_SIZE: int = 8192  # размер буфера
     RTT_SILERO_SENSITIVITY: float = 0.4  # чувствительность VAD
     RTT_WEBRTC_SENSITIVITY: int = 2  # чувствительность WebRTC
+    VAD_BACKEND: str = "silero_onnx"  # silero_onnx, silero_torch, webrtc (только WebRTC, без Silero)
+    VAD_THREADS: int = 1  # потоков на инференс Silero (больше одного на кадр 32 мс не окупается)
+    VAD_ONNX_MODEL_PATH: Optional[str] = None  # silero_vad.onnx для vad_benchmark.py, иначе ищем в кэше
+    
+    # Сегментация вопросов (склейка фрагментов речи)
+    SEGMENTER_ENABLED: bool = True
+    SEGMENTER_MAX_PAUSE: float = 1.5  # секунд тишины, после которых незаконченный вопрос отправляется
+    SEGMENTER_COMPLETE_PAUSE: float = 0.3  # ожидание после законченного предложения с вопросительным словом
+    SEGMENTER_MAX_GAP: float = 4.0  # пауза, после которой фрагмент считается новой репликой
+    SEGMENTER_MAX_WORDS: int = 80  # принудительная отправка длинного вопроса
+    SEGMENTER_AUTO_ASK: bool = False  # отправлять собранный вопрос в AI на сервере
+    
+    # Спекулятивные запросы к AI по промежуточной транскрипции
+    SPECULATIVE_ENABLED: bool = False
+    SPECULATIVE_STABLE_WINDOW: float = 0.4  # секунд без изменений текста до запуска запроса
+    SPECULATIVE_MIN_WORDS: int = 3  # минимум слов для спекулятивного запроса
+    SPECULATIVE_MATCH_THRESHOLD: float = 0.9  # близость финального текста к спекулятивному
+    
+    # Промежуточная транскрипция для клиента (speech_transcription_partial)
+    PARTIAL_TRANSCRIPTS_ENABLED: bool = True
+    PARTIAL_AGREEMENT: int = 2  # гипотез подряд, совпавших на слове, чтобы его зафиксировать
+    PARTIAL_MIN_INTERVAL: float = 0.15  # минимальный интервал между обновлениями, секунд
     
     # Безопасность
     KILL_SWITCH_HOTKEY: str = "ctrl+shift+f12"
     SCREEN_CAPTURE_CHECK_INTERVAL: int = 5  # секунд
     
-    # Профили интервью
+    # Профили интервью. Необязательный ключ "corpus" - файл или каталог с подготовленными
+    # ответами и заметками (.json/.jsonl: {"question", "answer"} или {"text"}; .md/.txt: абзацы,
+    # абзац "Вопрос: ... Ответ: ..." - пара вопрос-ответ)
     INTERVIEW_PROFILES = {
         "technical": {
             "system_prompt": "Ты опытный технический специалист. Отвечай кратко, технически точно и по делу. Предоставляй конкретные примеры кода если нужно.",
-            "max_tokens": 800
+            "max_tokens": 800,
+            "history_tokens": 1500
         },
         "hr": {
             "system_prompt": "Ты HR-консультант. Помогай с поведенческими вопросами, рассказывай о soft skills и корпоративной культуре.",
-            "max_tokens": 600
+            "max_tokens": 600,
+            "history_tokens": 1000
         },
         "sales": {
             "system_prompt": "Ты эксперт по продажам. Помогай с переговорами, работой с возражениями и закрытием сделок.",
-            "max_tokens": 500
+            "max_tokens": 500,
+            "history_tokens": 800
         },
         "general": {
             "system_prompt": "Ты умный ассистент. Отвечай кратко, по существу и полезно.",
-            "max_tokens": 600
+            "max_tokens": 600,
+            "history_tokens": 1000
         }
     }
     
@@ -68,7 +210,15 @@ class Config:
         if self.PROXYAPI_KEY is None:
             self.PROXYAPI_KEY = os.getenv("PROXYAPI_KEY")
         
-        if not self.PROXYAPI_KEY:
+        # Источник аудио можно переопределить для headless запуска
+        self.AUDIO_INPUT = os.getenv("AUDIO_INPUT", self.AUDIO_INPUT)
+        self.LOG_LEVEL = os.getenv("LOG_LEVEL", self.LOG_LEVEL).upper()
+        self.LOG_FORMAT = os.getenv("LOG_FORMAT", self.LOG_FORMAT)
+        self.VAD_BACKEND = os.getenv("VAD_BACKEND", self.VAD_BACKEND).lower()
+        if os.getenv("LLM_ENDPOINTS"):
+            self.LLM_ENDPOINTS = json.loads(os.environ["LLM_ENDPOINTS"])
+        
+        if not self.PROXYAPI_KEY and not self.LLM_ENDPOINTS:
             raise ValueError("PROXYAPI_KEY не найден в переменных окружения")
 
 # Глобальная конфигурация
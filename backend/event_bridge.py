@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Типы событий распознавания
+EVENT_TRANSCRIPT = "transcript"  # финальный текст фразы
+EVENT_PARTIAL = "partial"  # промежуточная транскрипция
+EVENT_STATUS = "status"  # изменение состояния записи
+
+
+@dataclass
+class SpeechEvent:
+    """Событие потока распознавания для event loop"""
+    kind: str
+    text: str = ""
+    data: dict = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class LoopEventBridge:
+    """Канал событий из потоков распознавания в asyncio loop.
+
+    Потоки только добавляют событие в кольцевой буфер (deque.append
+    атомарен, блокировки не нужны) и, если разбор еще не запланирован,
+    будят loop одним call_soon_threadsafe. Loop забирает все накопленные
+    события пачкой; из промежуточных результатов пачки остается последний.
+    До подключения loop события копятся в буфере.
+    """
+
+    def __init__(self, handler: Callable[[List[SpeechEvent]], None], capacity: int = None):
+        self.handler = handler
+        self.capacity = capacity or config.EVENT_BRIDGE_CAPACITY
+        self.buffer = deque(maxlen=self.capacity)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._scheduled = False
+        self.stats = {"posted": 0, "batches": 0, "max_batch": 0, "coalesced": 0, "overflow": 0}
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Подключает loop и разбирает накопленные до этого события"""
+        self.loop = loop
+        if self.buffer:
+            self._wake()
+
+    def post(self, event: SpeechEvent):
+        """Публикует событие (из любого потока)"""
+        if len(self.buffer) >= self.capacity:
+            self.stats["overflow"] += 1  # deque с maxlen вытеснит самое старое
+        self.buffer.append(event)
+        self.stats["posted"] += 1
+        if not self._scheduled and self.loop is not None:
+            self._wake()
+
+    def _wake(self):
+        self._scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # Loop закрыт - события остаются в буфере
+            self._scheduled = False
+
+    def _drain(self):
+        # Сбрасываем флаг до разбора: событие, пришедшее во время разбора,
+        # либо попадет в эту пачку, либо запланирует новую
+        self._scheduled = False
+        batch: List[SpeechEvent] = []
+        try:
+            while True:
+                batch.append(self.buffer.popleft())
+        except IndexError:
+            pass
+        if not batch:
+            return
+
+        # Из промежуточных результатов важен только последний
+        last_partial = max((i for i, e in enumerate(batch) if e.kind == EVENT_PARTIAL), default=None)
+        if last_partial is not None:
+            kept = [e for i, e in enumerate(batch) if e.kind != EVENT_PARTIAL or i == last_partial]
+            self.stats["coalesced"] += len(batch) - len(kept)
+            batch = kept
+
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        try:
+            self.handler(batch)
+        except Exception as e:
+            logger.error(f"Ошибка обработки событий распознавания: {e}")
+
+    def get_stats(self) -> dict:
+        return {"pending": len(self.buffer), "capacity": self.capacity, **self.stats}
@@ -0,0 +1,158 @@
+import logging
+import math
+import zlib
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Служебные токены на каждое сообщение в формате chat/completions
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """Локальный подсчет токенов (tiktoken, либо оценка по длине текста)"""
+
+    def __init__(self, model: str = None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or config.OPENAI_MODEL)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        else:
+            logger.info("tiktoken не установлен - токены оцениваются по длине текста")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # Для кириллицы в среднем ~3 символа на токен
+        return math.ceil(len(text) / 3)
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationHistory:
+    """История диалога с ограничением по токенам и накопительным резюме.
+
+    В промпт попадают резюме старой части диалога и последние сообщения,
+    помещающиеся в бюджет. Сообщения, вытесненные из бюджета, сворачиваются
+    в резюме функцией summarize в фоне между вопросами.
+    """
+
+    def __init__(self, counter: TokenCounter = None):
+        self.counter = counter or TokenCounter()
+        self.summary = ""
+        self._messages: List[Dict[str, str]] = []
+        self._tokens: List[int] = []
+        self._generation = 0  # меняется при очистке, чтобы отбросить устаревшее резюме
+
+    # --- Совместимость с прежним deque ---
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(list(self._messages))
+
+    def __bool__(self) -> bool:
+        return bool(self._messages) or bool(self.summary)
+
+    def append(self, message: Dict[str, str]):
+        self._messages.append(message)
+        self._tokens.append(self.counter.count_message(message))
+
+        # Жесткий предел памяти: если резюме не успевает, старое просто отбрасываем
+        overflow = len(self._messages) - config.HISTORY_MAX_MESSAGES
+        if overflow > 0:
+            del self._messages[:overflow]
+            del self._tokens[:overflow]
+
+    def fingerprint(self) -> str:
+        """Отпечаток резюме и сообщений - контекста, от которого зависит ответ"""
+        crc = zlib.crc32(self.summary.encode("utf-8"))
+        for message in self._messages:
+            crc = zlib.crc32(f"{message['role']}\0{message['content']}\0".encode("utf-8"), crc)
+        return f"{crc:08x}"
+
+    def clear(self):
+        self._messages.clear()
+        self._tokens.clear()
+        self.summary = ""
+        self._generation += 1
+
+    # --- Бюджет ---
+
+    def _summary_message(self) -> Optional[Dict[str, str]]:
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Краткое содержание предыдущего диалога: {self.summary}"}
+
+    def _window_start(self, budget: int) -> int:
+        """Индекс первого сообщения, с которого история помещается в бюджет"""
+        summary_message = self._summary_message()
+        used = self.counter.count_message(summary_message) if summary_message else 0
+        start = len(self._messages)
+        while start > 0 and used + self._tokens[start - 1] <= budget:
+            start -= 1
+            used += self._tokens[start]
+        # Не начинаем окно с ответа ассистента без вопроса
+        if start < len(self._messages) and self._messages[start]["role"] == "assistant":
+            start += 1
+        return start
+
+    def get_messages(self, budget: int) -> List[Dict[str, str]]:
+        """Возвращает резюме и последние сообщения в пределах бюджета токенов"""
+        messages = []
+        summary_message = self._summary_message()
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(self._messages[self._window_start(budget):])
+        return messages
+
+    def needs_summary(self, budget: int) -> bool:
+        return self._window_start(budget) > 0
+
+    async def fold(self, budget: int, summarize: Callable[[str, List[Dict[str, str]]], Awaitable[Optional[str]]]):
+        """Сворачивает сообщения за пределами бюджета в резюме"""
+        count = self._window_start(budget)
+        if count == 0:
+            return
+
+        generation = self._generation
+        folded = self._messages[:count]
+        new_summary = await summarize(self.summary, folded)
+
+        if generation != self._generation:
+            return  # история была очищена, пока шло резюмирование
+        if not new_summary:
+            logger.warning("Не удалось обновить резюме диалога")
+            return
+
+        # Пока шел запрос, в начале списка могли удалиться сообщения по пределу
+        offset = next((i for i, m in enumerate(self._messages) if m is folded[-1]), None)
+        drop = offset + 1 if offset is not None else 0
+        del self._messages[:drop]
+        del self._tokens[:drop]
+        self.summary = new_summary
+        logger.info(f"📝 Резюме диалога обновлено ({self.counter.count(new_summary)} токенов, свернуто {count} сообщений)")
+
+    def get_stats(self, budget: int) -> dict:
+        start = self._window_start(budget)
+        return {
+            "messages": len(self._messages),
+            "messages_in_prompt": len(self._messages) - start,
+            "prompt_tokens": sum(self._tokens[start:]) + (
+                self.counter.count_message(self._summary_message()) if self.summary else 0),
+            "summary_tokens": self.counter.count(self.summary),
+            "budget": budget
+        }
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 - нужен httpx для HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMHttpClient:
+    """Общий пул HTTP соединений для всего LLM трафика.
+
+    httpx.AsyncClient привязан к event loop, в котором используется,
+    поэтому на каждый loop создается ровно один клиент с keep-alive и
+    ограниченным пулом. Синхронные вызовы выполняются через собственный
+    фоновый loop и тоже переиспользуют соединения.
+    """
+
+    def __init__(self):
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_thread: Optional[threading.Thread] = None
+
+        self.http2 = config.HTTP2_ENABLED and HTTP2_AVAILABLE
+        if config.HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 запрошен, но пакет h2 не установлен - используем HTTP/1.1")
+
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(
+            config.HTTP_READ_TIMEOUT,
+            connect=config.HTTP_CONNECT_TIMEOUT,
+            pool=config.HTTP_POOL_TIMEOUT
+        )
+        logger.info(
+            f"Создан HTTP клиент (http2={self.http2}, "
+            f"max_connections={config.HTTP_MAX_CONNECTIONS})"
+        )
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=self.http2)
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Возвращает клиент для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._create_client()
+                self._clients[loop] = client
+            return client
+
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                        timeout: Optional[float] = None) -> httpx.Response:
+        """POST с JSON телом, ответ читается целиком"""
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        return await self.get_client().post(url, headers=headers, json=payload, **kwargs)
+
+    async def open_stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                          timeout: Optional[float] = None) -> httpx.Response:
+        """POST с потоковым чтением: возвращает ответ после заголовков.
+
+        Вызывающий код обязан закрыть ответ (response.aclose()).
+        """
+        client = self.get_client()
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        request = client.build_request("POST", url, headers=headers, json=payload, **kwargs)
+        return await client.send(request, stream=True)
+
+    @asynccontextmanager
+    async def stream_post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                          timeout: Optional[float] = None) -> AsyncIterator[httpx.Response]:
+        """POST с потоковым чтением ответа.
+
+        При выходе из контекста (в том числе по отмене задачи) соединение
+        сразу возвращается в пул или закрывается.
+        """
+        response = await self.open_stream(url, headers, payload, timeout=timeout)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    # --- Синхронные обертки ---
+
+    def _ensure_sync_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._sync_loop is None or self._sync_loop.is_closed():
+                self._sync_loop = asyncio.new_event_loop()
+                self._sync_thread = threading.Thread(
+                    target=self._sync_loop.run_forever,
+                    daemon=True,
+                    name="LLMHttpClient"
+                )
+                self._sync_thread.start()
+            return self._sync_loop
+
+    def run_sync(self, coro):
+        """Выполняет корутину клиента из синхронного кода"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_sync_loop())
+        return future.result()
+
+    def post_json_sync(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                       timeout: Optional[float] = None) -> httpx.Response:
+        """Синхронный POST через общий пул соединений"""
+        return self.run_sync(self.post_json(url, headers, payload, timeout=timeout))
+
+    # --- Завершение ---
+
+    async def aclose(self):
+        """Закрывает клиент текущего event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def close_sync(self):
+        """Закрывает фоновый loop синхронных вызовов"""
+        loop = self._sync_loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            self.run_sync(self.aclose())
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии HTTP клиента: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if self._sync_thread:
+            self._sync_thread.join(timeout=2)
+        if not loop.is_running():
+            loop.close()
+        self._sync_loop = None
+        self._sync_thread = None
+
+
+# Глобальный HTTP клиент для LLM запросов
+http_client = LLMHttpClient()
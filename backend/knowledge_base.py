@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from answer_cache import normalize_question, vectorize
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Виды записей корпуса
+KIND_QA = "qa"  # подготовленный вопрос с ответом
+KIND_NOTE = "note"  # заметка, идет только в контекст промпта
+
+CORPUS_EXTENSIONS = (".json", ".jsonl", ".md", ".txt")
+INDEX_VERSION = 1
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_QUESTION_RE = re.compile(r"^(?:Q|В|Вопрос)\s*:\s*", re.IGNORECASE)
+_ANSWER_RE = re.compile(r"^(?:A|О|Ответ)\s*:\s*", re.IGNORECASE | re.MULTILINE)
+
+
+@dataclass
+class KnowledgeEntry:
+    kind: str
+    text: str  # вопрос (qa) или текст заметки
+    answer: str = ""
+    source: str = ""
+
+
+@dataclass
+class KnowledgeHit:
+    entry: KnowledgeEntry
+    score: float
+
+    def as_context(self) -> str:
+        if self.entry.kind == KIND_QA:
+            return f"Вопрос: {self.entry.text}\nОтвет: {self.entry.answer}"
+        return self.entry.text
+
+
+# --- Чтение корпуса ---
+
+def _corpus_files(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, _, names in os.walk(path):
+        files.extend(os.path.join(root, name) for name in names if name.lower().endswith(CORPUS_EXTENSIONS))
+    return sorted(files)
+
+
+def _entry_from_record(record: dict, source: str) -> Optional[KnowledgeEntry]:
+    if record.get("question") and record.get("answer"):
+        return KnowledgeEntry(KIND_QA, record["question"].strip(), record["answer"].strip(), source)
+    if record.get("text"):
+        return KnowledgeEntry(KIND_NOTE, record["text"].strip(), source=source)
+    return None
+
+
+def _parse_text(text: str, source: str) -> List[KnowledgeEntry]:
+    """Абзацы текста; абзац "Вопрос: ... Ответ: ..." становится парой вопрос-ответ"""
+    entries = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _QUESTION_RE.match(paragraph):
+            parts = _ANSWER_RE.split(_QUESTION_RE.sub("", paragraph, count=1), maxsplit=1)
+            if len(parts) == 2 and parts[0].strip() and parts[1].strip():
+                entries.append(KnowledgeEntry(KIND_QA, parts[0].strip(), parts[1].strip(), source))
+                continue
+        entries.append(KnowledgeEntry(KIND_NOTE, paragraph, source=source))
+    return entries
+
+
+def read_corpus(path: str) -> List[KnowledgeEntry]:
+    """Читает корпус: .json (список записей), .jsonl, .md/.txt (абзацы)"""
+    entries: List[KnowledgeEntry] = []
+    for file_path in _corpus_files(path):
+        source = os.path.relpath(file_path, path) if os.path.isdir(path) else os.path.basename(path)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            if file_path.endswith(".json"):
+                records = json.loads(content)
+                if isinstance(records, dict):
+                    records = records.get("items", [])
+            elif file_path.endswith(".jsonl"):
+                records = [json.loads(line) for line in content.splitlines() if line.strip()]
+            else:
+                entries.extend(_parse_text(content, source))
+                continue
+            entries.extend(e for e in (_entry_from_record(r, source) for r in records) if e is not None)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения корпуса {file_path}: {e}")
+    return entries
+
+
+def _corpus_signature(path: str) -> str:
+    """Отпечаток корпуса и параметров векторизации для проверки актуальности индекса"""
+    digest = hashlib.sha1(f"{INDEX_VERSION}:{config.ANSWER_CACHE_NGRAM}:{config.ANSWER_CACHE_VECTOR_DIM}".encode())
+    for file_path in _corpus_files(path):
+        stat = os.stat(file_path)
+        digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+# --- Индекс ---
+
+class KnowledgeIndex:
+    """Векторный индекс корпуса одного профиля.
+
+    Векторы - те же нормированные символьные n-граммы, что и в кэше
+    ответов, в одной матрице float32. Матрица сохраняется в .npy и при
+    следующем запуске открывается через mmap без пересчета, если корпус
+    не изменился.
+    """
+
+    def __init__(self, entries: List[KnowledgeEntry], vectors: np.ndarray):
+        self.entries = entries
+        self.vectors = vectors
+        self._qa_mask = np.array([e.kind == KIND_QA for e in entries], dtype=bool)
+
+    @classmethod
+    def build(cls, entries: List[KnowledgeEntry]) -> "KnowledgeIndex":
+        vectors = np.zeros((len(entries), config.ANSWER_CACHE_VECTOR_DIM), dtype=np.float32)
+        for i, entry in enumerate(entries):
+            vectors[i] = vectorize(normalize_question(entry.text), config.ANSWER_CACHE_NGRAM,
+                                   config.ANSWER_CACHE_VECTOR_DIM)
+        return cls(entries, vectors)
+
+    @classmethod
+    def load_or_build(cls, corpus_path: str, index_dir: str) -> "KnowledgeIndex":
+        """Открывает сохраненный индекс или строит и сохраняет новый"""
+        signature = _corpus_signature(corpus_path)
+        meta_path = os.path.join(index_dir, "entries.json")
+        vectors_path = os.path.join(index_dir, "vectors.npy")
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("signature") == signature:
+                entries = [KnowledgeEntry(**record) for record in meta["entries"]]
+                vectors = np.load(vectors_path, mmap_mode="r")
+                if len(vectors) == len(entries):
+                    return cls(entries, vectors)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # индекса нет или он поврежден - строим заново
+
+        index = cls.build(read_corpus(corpus_path))
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            tmp_path = f"{vectors_path}.tmp.npy"
+            np.save(tmp_path, index.vectors)
+            os.replace(tmp_path, vectors_path)
+            tmp_path = f"{meta_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "entries": [asdict(e) for e in index.entries]},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить индекс корпуса в {index_dir}: {e}")
+        return index
+
+    def search(self, question: str, top_k: int, qa_only: bool = False) -> List[KnowledgeHit]:
+        normalized = normalize_question(question)
+        if not normalized or not self.entries:
+            return []
+        scores = np.asarray(self.vectors @ vectorize(normalized, config.ANSWER_CACHE_NGRAM,
+                                                     config.ANSWER_CACHE_VECTOR_DIM))
+        if qa_only:
+            scores = np.where(self._qa_mask, scores, -1.0)
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [KnowledgeHit(self.entries[i], float(scores[i])) for i in best if scores[i] > 0]
+
+
+# --- База знаний по профилям ---
+
+class KnowledgeBase:
+    """Локальные корпуса профилей (ключ "corpus" в INTERVIEW_PROFILES).
+
+    Индексы строятся при запуске сервера в фоне; пока индекс профиля
+    не готов, поиск просто ничего не находит.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, KnowledgeIndex] = {}
+        self._lock = threading.Lock()
+        self.stats = {"answered": 0, "grounded": 0, "misses": 0}
+
+    def _index_dir(self, profile: str, corpus_path: str) -> str:
+        if config.KNOWLEDGE_INDEX_DIR:
+            return os.path.join(config.KNOWLEDGE_INDEX_DIR, profile)
+        return f"{corpus_path.rstrip(os.sep)}.index"
+
+    def load(self):
+        """Индексирует корпуса всех профилей (блокирующий вызов)"""
+        if not config.KNOWLEDGE_ENABLED:
+            return
+        with self._lock:
+            for profile, settings in config.INTERVIEW_PROFILES.items():
+                corpus_path = settings.get("corpus")
+                if not corpus_path:
+                    continue
+                if not os.path.exists(corpus_path):
+                    logger.warning(f"Корпус профиля {profile} не найден: {corpus_path}")
+                    continue
+                started_at = time.time()
+                index = KnowledgeIndex.load_or_build(corpus_path, self._index_dir(profile, corpus_path))
+                self._indexes[profile] = index
+                logger.info(
+                    f"📚 Корпус профиля {profile}: {len(index.entries)} записей "
+                    f"за {(time.time() - started_at) * 1000:.0f}мс"
+                )
+
+    def answer(self, profile: str, question: str) -> Optional[KnowledgeHit]:
+        """Подготовленный ответ, если вопрос достаточно близок к одному из корпуса"""
+        index = self._indexes.get(profile)
+        if index is None:
+            return None
+        with metrics.timer("knowledge_lookup_seconds", "Поиск в локальной базе ответов"):
+            hits = index.search(question, 1, qa_only=True)
+        if hits and hits[0].score >= config.KNOWLEDGE_ANSWER_THRESHOLD:
+            self.stats["answered"] += 1
+            return hits[0]
+        return None
+
+    def context(self, profile: str, question: str) -> List[KnowledgeHit]:
+        """Фрагменты корпуса для контекста промпта"""
+        index = self._indexes.get(profile)
+        if index is None:
+            return []
+        with metrics.timer("knowledge_lookup_seconds", "Поиск в локальной базе ответов"):
+            hits = index.search(question, config.KNOWLEDGE_CONTEXT_TOP_K)
+        hits = [hit for hit in hits if hit.score >= config.KNOWLEDGE_CONTEXT_THRESHOLD]
+        self.stats["grounded" if hits else "misses"] += 1
+        return hits
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": config.KNOWLEDGE_ENABLED,
+            "profiles": {profile: len(index.entries) for profile, index in self._indexes.items()},
+            **self.stats
+        }
+
+
+# Глобальная база знаний (индексы общие для всех сессий)
+knowledge_base = KnowledgeBase()
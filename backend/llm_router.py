@@ -0,0 +1,179 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Состояния circuit breaker
+BREAKER_CLOSED = "closed"  # endpoint работает
+BREAKER_OPEN = "open"  # endpoint исключен до истечения паузы
+BREAKER_HALF_OPEN = "half_open"  # пауза истекла, пропускаем один пробный запрос
+
+# Ответы, говорящие о проблеме endpoint, а не запроса: переключаемся на другой
+ENDPOINT_FAILURE_STATUSES = frozenset({401, 403, 404, 408, 409, 429})
+
+
+def is_endpoint_failure(status_code: int) -> bool:
+    return status_code >= 500 or status_code in ENDPOINT_FAILURE_STATUSES
+
+
+@dataclass
+class LLMEndpoint:
+    """OpenAI-совместимый API со своей моделью и ключом"""
+    name: str
+    base_url: str
+    model: str
+    api_key: Optional[str] = None
+
+    # Скользящие оценки (EWMA)
+    ttfb: Optional[float] = None  # секунд до заголовков ответа
+    error_rate: float = 0.0
+
+    # Circuit breaker
+    state: str = BREAKER_CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    probe_started_at: float = 0.0
+
+    stats: Dict[str, int] = field(default_factory=lambda: {"requests": 0, "failures": 0, "opened": 0})
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url.rstrip('/')}/chat/completions"
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def score(self) -> float:
+        """Ожидаемое время до ответа с учетом повторов после ошибок"""
+        if self.ttfb is not None:
+            ttfb = self.ttfb
+        else:
+            # Новый endpoint пробуем первым, а ни разу не ответивший - последним
+            ttfb = 0.0 if not self.stats["failures"] else config.HTTP_READ_TIMEOUT
+        return ttfb / max(1.0 - self.error_rate, 0.05)
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "state": self.state,
+            "ttfb": round(self.ttfb, 3) if self.ttfb is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            **self.stats
+        }
+
+
+def load_endpoints() -> List[LLMEndpoint]:
+    """Endpoint'ы из config.LLM_ENDPOINTS, либо единственный из настроек ProxyAPI"""
+    if not config.LLM_ENDPOINTS:
+        return [LLMEndpoint("proxyapi", config.PROXY_API_BASE_URL, config.OPENAI_MODEL, config.PROXYAPI_KEY)]
+
+    endpoints = []
+    for i, spec in enumerate(config.LLM_ENDPOINTS):
+        api_key = spec.get("api_key")
+        if api_key is None and spec.get("api_key_env"):
+            api_key = os.getenv(spec["api_key_env"])
+        endpoints.append(LLMEndpoint(
+            name=spec.get("name") or f"endpoint{i}",
+            base_url=spec["base_url"],
+            model=spec.get("model") or config.OPENAI_MODEL,
+            api_key=api_key
+        ))
+    return endpoints
+
+
+class LLMRouter:
+    """Выбор endpoint'а LLM по задержке и здоровью.
+
+    Для каждого endpoint'а ведутся скользящие оценки TTFB и доли ошибок;
+    запрос уходит на endpoint с наименьшим ожидаемым временем ответа.
+    После LLM_BREAKER_FAILURES ошибок подряд endpoint исключается на
+    LLM_BREAKER_COOLDOWN секунд, затем получает один пробный запрос.
+    Если исключены все, пробуем их в порядке давности отключения -
+    лучше медленный ответ, чем никакого.
+    """
+
+    def __init__(self, endpoints: Optional[List[LLMEndpoint]] = None):
+        self.endpoints = endpoints if endpoints is not None else load_endpoints()
+        self.stats = {"failovers": 0}
+
+    def set_endpoints(self, endpoints: List[LLMEndpoint]):
+        self.endpoints = endpoints
+
+    def _available(self, endpoint: LLMEndpoint, now: float) -> bool:
+        if endpoint.state == BREAKER_CLOSED:
+            return True
+        if now - endpoint.opened_at < config.LLM_BREAKER_COOLDOWN:
+            return False
+        # Пробный запрос один; зависший пробный не блокирует endpoint навсегда
+        return now - endpoint.probe_started_at >= config.LLM_BREAKER_COOLDOWN
+
+    def candidates(self) -> Iterator[LLMEndpoint]:
+        """Endpoint'ы в порядке попыток: следующий выбирается после неудачи предыдущего"""
+        tried: Set[int] = set()
+        while len(tried) < len(self.endpoints):
+            now = time.monotonic()
+            remaining = [e for e in self.endpoints if id(e) not in tried]
+            healthy = [e for e in remaining if self._available(e, now)]
+            if healthy:
+                endpoint = min(healthy, key=LLMEndpoint.score)
+            else:
+                endpoint = min(remaining, key=lambda e: e.opened_at)
+            if endpoint.state != BREAKER_CLOSED:
+                endpoint.state = BREAKER_HALF_OPEN
+                endpoint.probe_started_at = now
+            if tried:
+                self.stats["failovers"] += 1
+                logger.warning("🔀 Переключаемся на LLM endpoint %s", endpoint.name)
+            tried.add(id(endpoint))
+            yield endpoint
+
+    def has_alternative(self, endpoint: LLMEndpoint) -> bool:
+        """Есть ли другой endpoint, на который можно переключиться"""
+        now = time.monotonic()
+        return any(e is not endpoint and self._available(e, now) for e in self.endpoints)
+
+    def record_success(self, endpoint: LLMEndpoint, ttfb: Optional[float] = None):
+        alpha = config.LLM_ROUTER_EWMA_ALPHA
+        endpoint.stats["requests"] += 1
+        if ttfb is not None:
+            endpoint.ttfb = ttfb if endpoint.ttfb is None else (1 - alpha) * endpoint.ttfb + alpha * ttfb
+        endpoint.error_rate *= 1 - alpha
+        endpoint.consecutive_failures = 0
+        if endpoint.state != BREAKER_CLOSED:
+            logger.info("✅ LLM endpoint %s снова доступен", endpoint.name)
+            endpoint.state = BREAKER_CLOSED
+
+    def record_failure(self, endpoint: LLMEndpoint, reason: str = ""):
+        alpha = config.LLM_ROUTER_EWMA_ALPHA
+        endpoint.stats["requests"] += 1
+        endpoint.stats["failures"] += 1
+        endpoint.error_rate = (1 - alpha) * endpoint.error_rate + alpha
+        endpoint.consecutive_failures += 1
+        if endpoint.state == BREAKER_HALF_OPEN or (
+                endpoint.state == BREAKER_CLOSED and endpoint.consecutive_failures >= config.LLM_BREAKER_FAILURES):
+            endpoint.state = BREAKER_OPEN
+            endpoint.opened_at = time.monotonic()
+            endpoint.stats["opened"] += 1
+            logger.warning(
+                f"⛔ LLM endpoint {endpoint.name} отключен на {config.LLM_BREAKER_COOLDOWN:.0f}с "
+                f"({endpoint.consecutive_failures} ошибок подряд, {reason})"
+            )
+
+    def get_stats(self) -> dict:
+        return {"endpoints": [e.describe() for e in self.endpoints], **self.stats}
+
+
+# Глобальный маршрутизатор LLM запросов (общие оценки для всех сессий)
+llm_router = LLMRouter()
@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from config import config
+from http_client import http_client
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: меньше - важнее
+PRIORITY_MANUAL = 0  # вопрос, отправленный пользователем
+PRIORITY_AUTO = 1  # автоотправка и спекулятивные запросы
+PRIORITY_BACKGROUND = 2  # резюмирование истории
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Разбирает длительность вида "1s", "6m0s", "20ms" или число секунд"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class _PrioritySlots:
+    """Семафор, отдающий освободившийся слот самому приоритетному ожидающему"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = []  # куча (приоритет, порядковый номер, future)
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    @asynccontextmanager
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()  # слот уже передан нам - отдаем следующему
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # слот переходит ожидающему, active не меняется
+                return
+        self.active -= 1
+
+
+class LLMScheduler:
+    """Планировщик запросов к LLM API.
+
+    - ограничивает число одновременных запросов, пропуская ручные
+      вопросы вперед автоматических и фоновых;
+    - учитывает заголовки rate limit (x-ratelimit-*, retry-after) и
+      приостанавливает отправку до сброса лимита;
+    - повторяет запрос при 429/5xx и сетевых ошибках с экспоненциальной
+      задержкой со случайным разбросом, пока укладывается в бюджет;
+    - при LLM_HEDGING_ENABLED отправляет дубль, если первый запрос не
+      ответил за наблюдаемый p95, и берет тот ответ, что пришел раньше.
+
+    Повторы и дубли возможны только до начала чтения тела ответа.
+    """
+
+    def __init__(self):
+        self.slots = _PrioritySlots(config.LLM_MAX_CONCURRENCY)
+        self.latencies = deque(maxlen=config.LLM_LATENCY_WINDOW)  # время до заголовков ответа
+        self.blocked_until: Dict[str, float] = {}  # URL -> монотонное время сброса rate limit
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0,
+                      "rate_limited": 0, "failed": 0}
+
+    # --- Rate limit ---
+
+    def _update_rate_limits(self, url: str, response: httpx.Response):
+        headers = response.headers
+        wait = None
+        if response.status_code == 429:
+            self.stats["rate_limited"] += 1
+            retry_after_ms = headers.get("retry-after-ms")
+            wait = float(retry_after_ms) / 1000 if retry_after_ms else parse_duration(headers.get("retry-after"))
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None and remaining.strip() == "0":
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    wait = max(wait or 0.0, reset)
+        if wait:
+            self.blocked_until[url] = max(self.blocked_until.get(url, 0.0), time.monotonic() + wait)
+            logger.warning("⏳ Лимит запросов LLM исчерпан, пауза %.2fс", wait)
+
+    async def _wait_rate_limit(self, url: str, deadline: float):
+        delay = self.blocked_until.get(url, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0.0)))
+
+    # --- Повторы ---
+
+    def _backoff(self, url: str, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Задержка перед повтором: full jitter, но не меньше retry-after"""
+        cap = min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+        delay = random.uniform(0, cap)
+        if response is not None and response.status_code == 429:
+            delay = max(delay, self.blocked_until.get(url, 0.0) - time.monotonic())
+        return delay
+
+    # --- Дублирование ---
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 времени до ответа или None, если данных мало"""
+        if not config.LLM_HEDGING_ENABLED or len(self.latencies) < config.LLM_HEDGING_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def _timed(self, opener: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        started_at = time.monotonic()
+        response = await opener()
+        if response.status_code < 500:
+            self.latencies.append(time.monotonic() - started_at)
+        return response
+
+    async def _hedged(self, opener: Callable[[], Awaitable[httpx.Response]],
+                      close: Callable[[httpx.Response], Awaitable[Any]]) -> httpx.Response:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._timed(opener)
+
+        primary = asyncio.ensure_future(self._timed(opener))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.stats["hedged"] += 1
+            metrics.increment("llm_hedged_total")
+            hedge = asyncio.ensure_future(self._timed(opener))
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+            # Оба запроса завершились ошибкой
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                # Проигравший мог успеть получить ответ - закрываем соединение
+                task.add_done_callback(
+                    lambda t: asyncio.ensure_future(close(t.result()))
+                    if not t.cancelled() and t.exception() is None else None
+                )
+
+    # --- Выполнение ---
+
+    async def _execute(self, url: str, opener: Callable[[], Awaitable[httpx.Response]],
+                       close: Callable[[httpx.Response], Awaitable[Any]],
+                       max_retries: Optional[int] = None) -> httpx.Response:
+        """Попытки запроса с повторами в пределах LLM_LATENCY_BUDGET"""
+        if max_retries is None:
+            max_retries = config.LLM_MAX_RETRIES
+        deadline = time.monotonic() + config.LLM_LATENCY_BUDGET
+        self.stats["requests"] += 1
+        attempt = 0
+        while True:
+            await self._wait_rate_limit(url, deadline)
+            response, error = None, None
+            try:
+                response = await self._hedged(opener, close)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error = e
+            else:
+                self._update_rate_limits(url, response)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    return response
+
+            attempt += 1
+            delay = self._backoff(url, attempt, response)
+            if attempt > max_retries or time.monotonic() + delay >= deadline:
+                self.stats["failed"] += 1
+                if response is not None:
+                    return response
+                raise error
+
+            reason = response.status_code if response is not None else type(error).__name__
+            logger.warning("🔁 Повтор запроса к LLM через %.2fс (попытка %s, %s)", delay, attempt + 1, reason)
+            self.stats["retries"] += 1
+            metrics.increment("llm_retries_total")
+            if response is not None:
+                await close(response)
+            await asyncio.sleep(delay)
+
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                        priority: int = PRIORITY_MANUAL, max_retries: Optional[int] = None) -> httpx.Response:
+        """POST с JSON телом через планировщик.
+
+        max_retries переопределяет LLM_MAX_RETRIES (например, 0, когда
+        вызывающий код может сразу переключиться на другой endpoint).
+        """
+        async def close(response: httpx.Response):
+            pass  # тело уже прочитано
+
+        async with self.slots.acquire(priority):
+            return await self._execute(url, lambda: http_client.post_json(url, headers, payload), close, max_retries)
+
+    @asynccontextmanager
+    async def stream_post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                          priority: int = PRIORITY_MANUAL,
+                          max_retries: Optional[int] = None) -> AsyncIterator[httpx.Response]:
+        """Потоковый POST через планировщик; слот занят до конца чтения ответа"""
+        async def close(response: httpx.Response):
+            await response.aclose()
+
+        async with self.slots.acquire(priority):
+            response = await self._execute(url, lambda: http_client.open_stream(url, headers, payload), close, max_retries)
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    def get_stats(self) -> dict:
+        hedge_delay = self.hedge_delay()
+        return {
+            "active": self.slots.active,
+            "waiting": self.slots.waiting,
+            "max_concurrency": self.slots.limit,
+            "rate_limited_for": round(max(0.0, max(self.blocked_until.values(), default=0.0) - time.monotonic()), 2),
+            "hedge_delay": round(hedge_delay, 3) if hedge_delay is not None else None,
+            **self.stats
+        }
+
+
+# Глобальный планировщик LLM запросов
+llm_scheduler = LLMScheduler()
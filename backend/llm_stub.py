@@ -0,0 +1,176 @@
+"""
+Локальный OpenAI-совместимый сервер-заглушка для тестов и бенчмарков.
+
+Отвечает на /chat/completions (обычный и stream: true) с настраиваемой
+задержкой первого токена, скоростью выдачи токенов и долей ошибок.
+
+Пример:
+    python llm_stub.py --port 8099 --latency 0.3 --tokens-per-second 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class StubSettings:
+    latency: float = 0.3  # секунд до первого токена
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+    error_rate: float = 0.0  # доля запросов, завершающихся ошибкой
+    error_status: int = 500
+    model: str = "stub-model"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+    settings: StubSettings = StubSettings()
+    stats = {"requests": 0, "errors": 0}
+
+    def log_message(self, format, *args):
+        pass  # не засоряем вывод бенчмарка
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _answer_tokens(self, question: str):
+        words = (question or "ответ").split() or ["ответ"]
+        return [f"{words[i % len(words)]} " for i in range(self.settings.answer_tokens)]
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("health"):
+            self._send_json(200, {"status": "ok", **self.stats})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        settings = self.settings
+        self.stats["requests"] += 1
+        time.sleep(settings.latency)
+
+        if settings.error_rate and random.random() < settings.error_rate:
+            self.stats["errors"] += 1
+            self._send_json(settings.error_status, {"error": {"message": "stub error"}})
+            return
+
+        messages = request.get("messages") or [{}]
+        tokens = self._answer_tokens(messages[-1].get("content", ""))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        delay = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+        if not request.get("stream"):
+            time.sleep(delay * len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": settings.model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}]
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(delay)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": settings.model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # клиент отменил запрос
+
+
+class LLMStubServer:
+    """Сервер-заглушка в фоновом потоке"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: Optional[StubSettings] = None):
+        handler = type("StubHandler", (_StubHandler,), {
+            "settings": settings or StubSettings(),
+            "stats": {"requests": 0, "errors": 0}
+        })
+        self.handler = handler
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def settings(self) -> StubSettings:
+        return self.handler.settings
+
+    @property
+    def stats(self) -> dict:
+        return self.handler.stats
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "LLMStubServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="LLMStub")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка LLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.3, help="Задержка первого токена, с")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    server = LLMStubServer(args.host, args.port, StubSettings(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    ))
+    print(f"LLM заглушка: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
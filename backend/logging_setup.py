@@ -0,0 +1,215 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from colorama import Fore, Style
+
+from config import config
+
+# Категория записи задается через extra={"category": ...}, иначе - имя логгера
+CATEGORY_ATTR = "category"
+
+# Стандартные атрибуты LogRecord, которые не попадают в JSON как extra-поля
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", CATEGORY_ATTR}
+
+
+def record_category(record: logging.LogRecord) -> str:
+    return getattr(record, CATEGORY_ATTR, None) or record.name
+
+
+def record_to_dict(record: logging.LogRecord) -> dict:
+    """Структурированное представление записи (сообщение форматируется здесь, в фоне)"""
+    data = {
+        "ts": round(record.created, 6),
+        "level": record.levelname,
+        "logger": record.name,
+        "category": record_category(record),
+        "thread": record.threadName,
+        "message": record.getMessage()
+    }
+    for key, value in vars(record).items():
+        if key not in _RECORD_ATTRS and not key.startswith("_"):
+            data[key] = value
+    if record.exc_info:
+        data["exception"] = logging.Formatter().formatException(record.exc_info)
+    return data
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record_to_dict(record), ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту записей по категориям (token bucket).
+
+    Отброшенные записи подсчитываются; их число добавляется к следующей
+    пропущенной записи категории в поле suppressed. Предупреждения и
+    ошибки не ограничиваются.
+    """
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        self.limits = dict(limits)
+        self._buckets: Dict[str, list] = {}  # категория -> [токены, время, отброшено с прошлой записи, отброшено всего]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        category = record_category(record)
+        rate = self.limits.get(category)
+        if not rate:
+            return True
+
+        now = time.monotonic()
+        burst = max(1.0, rate)
+        with self._lock:
+            bucket = self._buckets.setdefault(category, [burst, now, 0, 0])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                bucket[3] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {category: bucket[3] for category, bucket in self._buckets.items()}
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() форматирует сообщение до постановки в очередь;
+    здесь запись передается как есть, а msg % args выполняется уже в
+    фоновом потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+class RingBufferHandler(logging.Handler):
+    """Последние записи журнала в памяти для запросов по WebSocket"""
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.records.append(record_to_dict(record))
+        except Exception:
+            self.handleError(record)
+
+    def query(self, level: Optional[str] = None, category: Optional[str] = None,
+              since: Optional[float] = None, limit: int = 100) -> List[dict]:
+        min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(min_level, int):
+            min_level = logging.NOTSET
+        result = []
+        for item in reversed(list(self.records)):
+            if since is not None and item["ts"] <= since:
+                break
+            if logging.getLevelName(item["level"]) < min_level:
+                continue
+            if category and item["category"] != category:
+                continue
+            result.append(item)
+            if len(result) >= limit:
+                break
+        result.reverse()
+        return result
+
+
+class _LogState:
+    listener: Optional[logging.handlers.QueueListener] = None
+    ring_buffer: Optional[RingBufferHandler] = None
+    rate_limit: Optional[RateLimitFilter] = None
+    records: Optional[queue.SimpleQueue] = None
+
+
+_state = _LogState()
+
+
+def setup_logging() -> RingBufferHandler:
+    """Переводит журналирование на фоновый поток.
+
+    Корневой логгер получает только LazyQueueHandler; консоль, JSON-файл и
+    кольцевой буфер обслуживает QueueListener. Повторный вызов ничего не
+    меняет.
+    """
+    if _state.listener is not None:
+        return _state.ring_buffer
+
+    if config.LOG_FORMAT == "json":
+        console_formatter = JSONLinesFormatter()
+    else:
+        console_formatter = logging.Formatter(
+            f'{Fore.CYAN}%(asctime)s{Style.RESET_ALL} - %(levelname)s - %(message)s'
+        )
+    console = logging.StreamHandler()
+    console.setFormatter(console_formatter)
+    handlers: List[logging.Handler] = [console]
+
+    if config.LOG_FILE:
+        file_handler = logging.FileHandler(config.LOG_FILE, encoding="utf-8")
+        file_handler.setFormatter(JSONLinesFormatter())
+        handlers.append(file_handler)
+
+    _state.ring_buffer = RingBufferHandler(config.LOG_RING_SIZE)
+    handlers.append(_state.ring_buffer)
+
+    _state.records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(_state.records)
+    _state.rate_limit = RateLimitFilter(config.LOG_RATE_LIMITS)
+    queue_handler.addFilter(_state.rate_limit)
+
+    root = logging.getLogger()
+    # basicConfig в отдельных модулях мог уже повесить синхронный StreamHandler
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.LOG_LEVEL)
+
+    _state.listener = logging.handlers.QueueListener(_state.records, *handlers, respect_handler_level=True)
+    _state.listener.start()
+    atexit.register(stop_logging)
+    return _state.ring_buffer
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает фоновый поток журналирования"""
+    if _state.listener is not None:
+        _state.listener.stop()
+        _state.listener = None
+
+
+def query_logs(**filters) -> List[dict]:
+    if _state.ring_buffer is None:
+        return []
+    return _state.ring_buffer.query(**filters)
+
+
+def get_logging_stats() -> dict:
+    return {
+        "background": _state.listener is not None,
+        "format": config.LOG_FORMAT,
+        "buffered": len(_state.ring_buffer.records) if _state.ring_buffer else 0,
+        "suppressed": _state.rate_limit.get_stats() if _state.rate_limit else {}
+    }
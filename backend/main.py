@@ -5,9 +5,11 @@ import threading
 import time
 import os
 import sys
+import uuid
+from urllib.parse import parse_qs, urlparse
 import psutil
 import keyboard
-from typing import Set, Optional
+from typing import Dict, Iterable, Set, Optional
 import websockets
 from colorama import init, Fore, Style
 
@@ -16,43 +18,147 @@ init()
 
 # Импорт наших модулей
 from config import config
-from ai_responder import AIResponder
+from http_client import http_client
+from llm_scheduler import llm_scheduler, PRIORITY_MANUAL, PRIORITY_AUTO
+from llm_router import llm_router
+from knowledge_base import knowledge_base
 from speech_processor import SpeechProcessor, MockSpeechProcessor
+from speech_worker import SpeechWorkerSupervisor
+from sessions import SessionManager, Session, TOPIC_SPEECH
+from question_segmenter import QuestionSegmenter
+from partial_transcript import PartialTranscriptTracker
+from audio_sources import create_audio_source
+from audio_stream import WebSocketAudioSource, AudioStreamError
+from metrics import metrics, start_metrics_http_server
+from client_channel import ClientChannel, summarize_channels
+from event_bridge import LoopEventBridge, SpeechEvent, EVENT_TRANSCRIPT, EVENT_PARTIAL, EVENT_STATUS
+from logging_setup import setup_logging, stop_logging, query_logs, get_logging_stats
 
-logging.basicConfig(
-    level=logging.INFO,
-    format=f'{Fore.CYAN}%(asctime)s{Style.RESET_ALL} - %(levelname)s - %(message)s'
-)
+# Запись журнала идет в фоновом потоке, event loop не ждет консоль
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Категории частых записей (ограничиваются config.LOG_RATE_LIMITS)
+LOG_TRANSCRIPT = {"category": "transcript"}
+LOG_BROADCAST = {"category": "broadcast"}
+
 class StealthAssistant:
-    def __init__(self):
+    def __init__(self, audio_source=None):
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.ai_responder = AIResponder()
+        # Очереди исходящих сообщений клиентов (у каждой своя задача записи)
+        self.channels: Dict[websockets.WebSocketServerProtocol, ClientChannel] = {}
+        # Профиль, история и вопросы в работе - свои у каждой сессии
+        self.sessions = SessionManager(self._process_ai_question)
+        self.eviction_task: Optional[asyncio.Task] = None
+        self.question_segmenter = QuestionSegmenter(self._on_question_ready)
+        # События из потоков распознавания доставляются в loop пачками
+        self.speech_events = LoopEventBridge(self._on_speech_events)
+        # Промежуточная транскрипция: устойчивый префикс и хвост, диффами
+        self.partial_tracker = PartialTranscriptTracker()
+        self._partial_flush: Optional[asyncio.TimerHandle] = None
+        self._recording_started_at: Optional[float] = None
         self.speech_processor = None
+        # None - источник из config.AUDIO_INPUT
+        self.audio_source = audio_source if audio_source is not None else create_audio_source()
         self.is_running = False
         self.server = None
         self.security_monitor = None
+        self.metrics_server = None
         self.loop = None
         
+        # Модели распознавания загружаются в фоне после запуска сервера
+        self.speech_state = "loading"  # loading, ready, failed
+        self.speech_load_time: Optional[float] = None
+        self.warmup_task: Optional[asyncio.Task] = None
+        self._listen_requested = False
+        
+        # Настраиваем kill-switch
+        self._setup_kill_switch()
+    
+    def _create_speech_processor(self):
+        """Создает процессор речи (блокирующая загрузка моделей)"""
         # Пытаемся создать реальный процессор речи
         try:
-            self.speech_processor = SpeechProcessor()
-            logger.info(f"🎤 Используется реальный SpeechProcessor")
+            if config.SPEECH_WORKER_ENABLED:
+                # Модели и VAD в дочернем процессе, интерфейс тот же
+                processor = SpeechWorkerSupervisor(self.audio_source)
+                logger.info(f"🎤 Используется SpeechProcessor в отдельном процессе")
+            else:
+                processor = SpeechProcessor(self.audio_source)
+                logger.info(f"🎤 Используется реальный SpeechProcessor")
         except Exception as e:
             logger.warning(f"❌ Не удалось создать реальный процессор речи: {e}")
             logger.info("🎭 Используем mock процессор для тестирования")
-            self.speech_processor = MockSpeechProcessor()
+            processor = MockSpeechProcessor()
         
         # Проверяем тип процессора
-        processor_type = type(self.speech_processor).__name__
+        processor_type = type(processor).__name__
         logger.info(f"🔧 Тип процессора: {processor_type}")
         
         # Устанавливаем callback для обработки речи
-        self.speech_processor.set_text_callback(self._on_speech_recognized_sync)
+        processor.set_text_callback(self._on_speech_recognized_sync)
+        processor.set_status_callback(self._on_speech_status_sync)
+        if config.SPECULATIVE_ENABLED or config.PARTIAL_TRANSCRIPTS_ENABLED:
+            processor.set_partial_callback(self._on_partial_speech_sync)
         
-        # Настраиваем kill-switch
-        self._setup_kill_switch()
+        # Прогрев: первый настоящий фрагмент не должен платить за JIT и аллокации
+        # (процесс распознавания прогревается сам при каждом запуске)
+        if config.WARMUP_ENABLED and hasattr(processor, 'warm_up'):
+            processor.warm_up()
+        
+        return processor
+    
+    async def _warm_up_speech(self):
+        """Фоновая загрузка и прогрев моделей распознавания речи"""
+        started_at = time.time()
+        logger.info(f"{Fore.YELLOW}⏳ Загружаем модели распознавания речи в фоне...{Style.RESET_ALL}")
+        
+        try:
+            self.speech_processor = await asyncio.to_thread(self._create_speech_processor)
+            self.speech_state = "ready"
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки процессора речи: {e}")
+            self.speech_processor = MockSpeechProcessor()
+            self.speech_processor.set_text_callback(self._on_speech_recognized_sync)
+            self.speech_processor.set_status_callback(self._on_speech_status_sync)
+            self.speech_state = "failed"
+        
+        self.speech_load_time = time.time() - started_at
+        logger.info(f"{Fore.GREEN}✅ Распознавание речи готово за {self.speech_load_time:.1f}с{Style.RESET_ALL}")
+        
+        await self._broadcast_message({
+            "type": "ready",
+            "speech_state": self.speech_state,
+            "load_time": round(self.speech_load_time, 2),
+            "timestamp": time.time()
+        })
+        
+        # Выполняем запрос на прослушивание, пришедший во время загрузки
+        if self._listen_requested:
+            self._listen_requested = False
+            success = await asyncio.to_thread(self.speech_processor.start_listening)
+            await self._broadcast_message({
+                "type": "listening_status",
+                "status": "started" if success else "failed"
+            })
+    
+    def _on_knowledge_loaded(self, future: asyncio.Future):
+        """Индексация корпусов идет в пуле потоков - ошибку иначе никто не увидит"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            logger.error(f"❌ Ошибка загрузки базы знаний: {error}", exc_info=error)
+    
+    def _get_speech_status(self) -> dict:
+        """Статус процессора речи с учетом фоновой загрузки"""
+        if self.speech_processor is None:
+            return {
+                "is_listening": False,
+                "state": self.speech_state,
+                "listen_requested": self._listen_requested
+            }
+        return {**self.speech_processor.get_status(), "state": self.speech_state}
     
     def _setup_kill_switch(self):
         """Настраивает глобальный kill-switch"""
@@ -73,201 +179,539 @@ class StealthAssistant:
         sys.exit(0)
     
     def _on_speech_recognized_sync(self, text: str):
-        """Синхронная обертка для обработки речи"""
-        logger.info(f"🎯 Получен текст из SpeechProcessor: '{text}'")
-        
-        if self.loop and self.loop.is_running():
-            # Создаем задачу в основном цикле событий
-            logger.info(f"🔄 Добавляем задачу в основной event loop")
-            asyncio.run_coroutine_threadsafe(
-                self._on_speech_recognized(text),
-                self.loop
-            )
-        else:
-            # Если цикл не запущен, используем новый цикл
-            logger.info(f"🔄 Запускаем новый event loop")
-            asyncio.run(self._on_speech_recognized(text))
+        """Передает распознанный текст в event loop (поток прослушивания)"""
+        self.speech_events.post(SpeechEvent(EVENT_TRANSCRIPT, text))
+    
+    def _on_partial_speech_sync(self, text: str):
+        """Передает промежуточную транскрипцию в event loop (поток прослушивания)"""
+        self.speech_events.post(SpeechEvent(EVENT_PARTIAL, text))
+    
+    def _on_speech_status_sync(self, status: str):
+        """Передает смену состояния записи в event loop (поток прослушивания)"""
+        self.speech_events.post(SpeechEvent(EVENT_STATUS, data={"status": status}))
+    
+    def _on_speech_events(self, events):
+        """Разбирает пачку событий распознавания (в event loop)"""
+        for event in events:
+            if event.kind == EVENT_TRANSCRIPT:
+                # Фраза закончена: финальный текст заменяет промежуточный
+                if self._partial_flush is not None:
+                    self._partial_flush.cancel()
+                    self._partial_flush = None
+                self.partial_tracker.reset()
+                self.loop.create_task(self._on_speech_recognized(event.text))
+            elif event.kind == EVENT_PARTIAL:
+                for session in self.sessions.subscribed(TOPIC_SPEECH):
+                    if session.speculative:
+                        session.speculative.on_partial(event.text)
+                if config.PARTIAL_TRANSCRIPTS_ENABLED:
+                    self.partial_tracker.update(event.text)
+                    if self._partial_flush is None:
+                        self._flush_partial()
+            elif event.kind == EVENT_STATUS:
+                if event.data.get("status") == "recording":
+                    self._recording_started_at = event.timestamp
+                self.loop.create_task(self._publish(TOPIC_SPEECH, {
+                    "type": "speech_status",
+                    **event.data,
+                    "timestamp": event.timestamp
+                }))
+    
+    def _flush_partial(self):
+        """Отправляет изменения промежуточной транскрипции не чаще PARTIAL_MIN_INTERVAL"""
+        self._partial_flush = None
+        delay = self.partial_tracker.due_in()
+        if delay > 0:
+            self._partial_flush = self.loop.call_later(delay, self._flush_partial)
+            return
+        
+        message = self.partial_tracker.diff()
+        if not message:
+            return
+        metrics.increment("speech_partial_updates_total")
+        if message["seq"] == 1 and self._recording_started_at is not None:
+            metrics.observe("speech_first_partial_seconds", message["timestamp"] - self._recording_started_at,
+                            "От начала записи фразы до первого промежуточного текста у клиента")
+        self.loop.create_task(self._publish(TOPIC_SPEECH, message))
     
     async def _on_speech_recognized(self, text: str):
         """Обрабатывает распознанную речь"""
-        logger.info(f"🎤 Распознана речь: '{text}'")
+        logger.info("🎤 Распознана речь: '%s'", text, extra=LOG_TRANSCRIPT)
         
-        # Отправляем транскрипцию всем подключенным клиентам
+        for session in self.sessions.subscribed(TOPIC_SPEECH):
+            if session.speculative:
+                session.speculative.on_final(text)
+        
+        # Отправляем транскрипцию сессиям, подписанным на речь
         message = {
             "type": "speech_transcription",
             "text": text,
             "timestamp": time.time()
         }
-        logger.info(f"📤 Отправляем транскрипцию всем клиентам")
-        await self._broadcast_message(message)
+        await self._publish(TOPIC_SPEECH, message)
+        
+        # Склеиваем фрагменты в законченный вопрос
+        self.question_segmenter.add_fragment(text)
+    
+    async def _on_question_ready(self, question: str, info: dict):
+        """Обрабатывает вопрос, собранный сегментатором из фрагментов речи"""
+        message = {
+            "type": "question_ready",
+            "text": question,
+            "fragments": info["fragments"],
+            "reason": info["reason"],
+            "auto_asked": config.SEGMENTER_AUTO_ASK,
+            "timestamp": time.time()
+        }
+        await self._publish(TOPIC_SPEECH, message)
+        
+        if config.SEGMENTER_AUTO_ASK:
+            # У каждой сессии свой профиль и история - и свой ответ
+            for session in self.sessions.subscribed(TOPIC_SPEECH):
+                session.request_manager.submit("speech", question, PRIORITY_AUTO)
     
-    async def _process_ai_question(self, question: str):
-        """Обрабатывает вопрос для AI"""
-        logger.info(f"🤖 Начинаем обработку вопроса для AI: '{question}'")
+    async def _process_ai_question(self, session: Session, question: str, priority: int = PRIORITY_MANUAL):
+        """Обрабатывает вопрос для AI в контексте сессии"""
+        logger.info("🤖 Начинаем обработку вопроса для AI: '%s' (сессия %s)", question, session.id[:8])
         
-        # Получаем ответ от AI
-        logger.info(f"📡 Отправляем запрос к AI...")
-        response = await self.ai_responder.get_response(question)
+        speculative = session.speculative.take(question) if session.speculative else None
+        
+        # Подготовленный ответ из локального корпуса - без сетевых запросов
+        local = session.ai_responder.local_answer(question)
+        if local:
+            if speculative:
+                speculative.cancel()
+            await self._send_to_session(session, {
+                "type": "ai_response",
+                "question": question,
+                "answer": local.entry.answer,
+                "source": "local",
+                "score": round(local.score, 3),
+                "timestamp": time.time()
+            })
+            return
+        
+        if speculative is None:
+            # Тот же вопрос в том же контексте у другой сессии - один запрос на всех
+            speculative = self.sessions.shared_requests.join(session.ai_responder, question, priority)
+        
+        if config.AI_STREAMING:
+            await self._process_ai_question_streaming(session, question, speculative, priority)
+            return
+        
+        response = await speculative.result()
+        if response:
+            session.ai_responder.commit_answer(question, response)
+        elif speculative.cancelled:
+            # Буферизованный запрос отменен не нами - спрашиваем заново.
+            # Ошибку не повторяем: повторы по ней уже сделал планировщик
+            logger.info("📡 Отправляем запрос к AI...")
+            response = await session.ai_responder.get_response(question, priority)
         
         if response:
-            logger.info(f"✅ Получен ответ от AI (длина: {len(response)} символов)")
-            logger.info(f"👥 Количество подключенных клиентов: {len(self.clients)}")
+            logger.info("✅ Получен ответ от AI (длина: %s символов)", len(response))
             
-            # Отправляем ответ всем подключенным клиентам
+            # Ответ получают только клиенты этой сессии
             message = {
                 "type": "ai_response",
                 "question": question,
                 "answer": response,
+                "source": "llm",
                 "timestamp": time.time()
             }
-            logger.info(f"📤 Отправляем ответ AI всем клиентам")
-            await self._broadcast_message(message)
+            await self._send_to_session(session, message)
         else:
-            logger.warning(f"❌ AI не вернул ответ на вопрос: '{question}'")
+            logger.warning("❌ AI не вернул ответ на вопрос: '%s'", question)
     
-    async def _broadcast_message(self, message: dict):
-        """Отправляет сообщение всем подключенным клиентам"""
-        if self.clients:
-            message_str = json.dumps(message, ensure_ascii=False)
-            logger.info(f"📻 Отправляем сообщение {len(self.clients)} клиентам: {message['type']}")
-            
-            # Создаем задачи для отправки всем клиентам
-            tasks = []
-            for client in self.clients.copy():
-                tasks.append(self._send_to_client(client, message_str))
-            
-            # Выполняем все задачи параллельно
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Проверяем результаты
-            successful = sum(1 for r in results if not isinstance(r, Exception))
-            failed = len(results) - successful
-            logger.info(f"📊 Результат отправки: {successful} успешно, {failed} ошибок")
+    async def _process_ai_question_streaming(self, session: Session, question: str, speculative=None,
+                                             priority: int = PRIORITY_MANUAL):
+        """Потоково пересылает ответ AI клиентам сессии (ai_response_delta + ai_response_done)"""
+        request_id = uuid.uuid4().hex
+        started_at = time.time()
+        first_token_at = None
+        parts = []
+        error = None
+        
+        if speculative:
+            # Ответ уже буферизуется (спекулятивный или общий с другими сессиями запрос) -
+            # досылаем накопленное и продолжаем поток
+            source = speculative.deltas()
         else:
-            logger.warning(f"❌ Нет подключенных клиентов для отправки сообщения: {message['type']}")
-    
-    async def _send_to_client(self, client: websockets.WebSocketServerProtocol, message: str):
-        """Отправляет сообщение конкретному клиенту"""
+            logger.info("📡 Отправляем потоковый запрос к AI (request_id=%s)...", request_id)
+            source = session.ai_responder.stream_response(question, priority=priority)
+        
         try:
-            await client.send(message)
-            logger.debug(f"✅ Сообщение отправлено клиенту: {client.remote_address}")
+            async for delta in source:
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    logger.info("⚡ Первый токен через %.2fс", first_token_at - started_at)
+                parts.append(delta)
+                await self._send_to_session(session, {
+                    "type": "ai_response_delta",
+                    "request_id": request_id,
+                    "question": question,
+                    "delta": delta,
+                    "timestamp": time.time()
+                })
+        except asyncio.CancelledError:
+            # Вопрос отменен более новым - сообщаем клиентам и прекращаем работу
+            if speculative:
+                speculative.cancel()
+            logger.info("🚫 Потоковый ответ отменен (request_id=%s)", request_id)
+            await self._send_to_session(session, {
+                "type": "ai_response_done",
+                "request_id": request_id,
+                "question": question,
+                "answer": "".join(parts).strip(),
+                "success": False,
+                "cancelled": True,
+                "timestamp": time.time()
+            })
+            raise
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке сообщения клиенту {client.remote_address}: {e}")
-            self.clients.discard(client)
+            error = e
+            logger.error("❌ Ошибка потокового ответа AI: %s", e)
+        
+        if speculative:
+            if speculative.cancelled:
+                # Буферизованный запрос отменен не нами - обычный запрос
+                await self._process_ai_question_streaming(session, question, priority=priority)
+                return
+            error = error or speculative.error
+        
+        answer = "".join(parts).strip()
+        if error:
+            # Оборванный ответ не сохраняем ни в истории, ни в кэше
+            answer = ""
+        elif speculative and answer:
+            session.ai_responder.commit_answer(question, answer)
+        
+        if not answer:
+            logger.warning("❌ AI не вернул ответ на вопрос: '%s'", question)
+        else:
+            logger.info("✅ Потоковый ответ от AI завершен (длина: %s символов)", len(answer))
+        
+        await self._send_to_session(session, {
+            "type": "ai_response_done",
+            "request_id": request_id,
+            "question": question,
+            "answer": answer,
+            "success": bool(answer),
+            "ttft": (first_token_at - started_at) if first_token_at else None,
+            "timestamp": time.time()
+        })
+    
+    def _deliver(self, clients: Iterable[websockets.WebSocketServerProtocol], message: dict):
+        """Ставит сообщение в очереди указанных клиентов.
+        
+        Не ждет отправки: каждую очередь разбирает своя задача записи,
+        поэтому медленный клиент не задерживает остальных.
+        """
+        channels = [self.channels[client] for client in clients if client in self.channels]
+        if channels:
+            with metrics.timer("json_encode_seconds", "Сериализация исходящих сообщений"):
+                message_str = json.dumps(message, ensure_ascii=False)
+            logger.debug("📻 Отправляем сообщение %d клиентам: %s", len(channels), message['type'],
+                         extra=LOG_BROADCAST)
+            
+            for channel in channels:
+                channel.send(message, message_str)
+        else:
+            logger.info("❌ Нет подключенных клиентов для отправки сообщения: %s", message['type'],
+                        extra=LOG_BROADCAST)
+    
+    async def _broadcast_message(self, message: dict):
+        """Отправляет сообщение всем подключенным клиентам"""
+        self._deliver(list(self.channels), message)
+    
+    async def _publish(self, topic: str, message: dict):
+        """Отправляет сообщение клиентам сессий, подписанных на тему"""
+        self._deliver([client for session in self.sessions.subscribed(topic) for client in session.connections],
+                      message)
+    
+    async def _send_to_session(self, session: Session, message: dict):
+        """Отправляет сообщение клиентам одной сессии"""
+        self._deliver(list(session.connections), message)
+    
+    def _reply(self, websocket: websockets.WebSocketServerProtocol, message: dict, encoded: Optional[str] = None):
+        """Отвечает одному клиенту через его очередь, в общем порядке с рассылками"""
+        channel = self.channels.get(websocket)
+        if channel:
+            channel.send(message, encoded)
+    
+    def _on_channel_closed(self, client: websockets.WebSocketServerProtocol):
+        """Клиент отключен или не справился с потоком сообщений"""
+        self.channels.pop(client, None)
+        self.clients.discard(client)
     
     async def _handle_client_message(self, websocket: websockets.WebSocketServerProtocol, message: str):
         """Обрабатывает сообщение от клиента"""
         try:
             data = json.loads(message)
             message_type = data.get("type")
+            session = self.sessions.get(websocket)
+            session.touch()
             
             if message_type == "start_listening":
-                logger.info(f"🎤 Запрос на начало прослушивания, процессор: {type(self.speech_processor).__name__}")
-                success = self.speech_processor.start_listening()
-                logger.info(f"🎤 Результат запуска прослушивания: {'✅ Успешно' if success else '❌ Ошибка'}")
+                if self.speech_processor is None:
+                    # Модели еще загружаются - запустим прослушивание по готовности
+                    logger.info("⏳ Прослушивание будет запущено после загрузки моделей")
+                    self._listen_requested = True
+                    response = {
+                        "type": "listening_status",
+                        "status": "pending"
+                    }
+                    self._reply(websocket, response)
+                    return
+                
+                logger.info("🎤 Запрос на начало прослушивания, процессор: %s", type(self.speech_processor).__name__)
+                # Процесс распознавания отвечает не мгновенно - не блокируем event loop
+                success = await asyncio.to_thread(self.speech_processor.start_listening)
+                logger.info("🎤 Результат запуска прослушивания: %s", '✅ Успешно' if success else '❌ Ошибка')
                 
                 # Получаем статус процессора
                 status = self.speech_processor.get_status()
-                logger.info(f"🔧 Статус процессора: {status}")
+                logger.info("🔧 Статус процессора: %s", status)
                 
                 response = {
                     "type": "listening_status",
                     "status": "started" if success else "failed"
                 }
-                await websocket.send(json.dumps(response))
+                self._reply(websocket, response)
                 
             elif message_type == "stop_listening":
-                logger.info(f"🔇 Запрос на остановку прослушивания, процессор: {type(self.speech_processor).__name__}")
-                self.speech_processor.stop_listening()
-                logger.info(f"🔇 Прослушивание остановлено")
+                self._listen_requested = False
+                if self.speech_processor is not None:
+                    logger.info("🔇 Запрос на остановку прослушивания, процессор: %s", type(self.speech_processor).__name__)
+                    await asyncio.to_thread(self.speech_processor.stop_listening)
+                    logger.info("🔇 Прослушивание остановлено")
                 
                 response = {
                     "type": "listening_status",
                     "status": "stopped"
                 }
-                await websocket.send(json.dumps(response))
+                self._reply(websocket, response)
                 
             elif message_type == "set_profile":
                 profile = data.get("profile", "general")
-                self.ai_responder.set_profile(profile)
+                session.ai_responder.set_profile(profile)
                 response = {
                     "type": "profile_changed",
                     "profile": profile
                 }
-                await websocket.send(json.dumps(response))
+                self._reply(websocket, response)
                 
             elif message_type == "clear_history":
-                self.ai_responder.clear_history()
+                # Сегментатор общий для всех сессий и не сбрасывается
+                session.reset()
                 response = {
                     "type": "history_cleared"
                 }
-                await websocket.send(json.dumps(response))
+                self._reply(websocket, response)
                 
             elif message_type == "get_status":
                 status = {
                     "type": "status",
-                    "speech_processor": self.speech_processor.get_status(),
+                    "ready": self.speech_state != "loading",
+                    "speech_processor": self._get_speech_status(),
                     "recorder_info": self.speech_processor.get_recorder_info() if hasattr(self.speech_processor, 'get_recorder_info') else {},
+                    "audio_input": self.audio_source.describe(),
                     "ai_responder": {
-                        "profile": self.ai_responder.current_profile,
-                        "history_length": len(self.ai_responder.conversation_history)
+                        "profile": session.ai_responder.current_profile,
+                        "history_length": len(session.ai_responder.conversation_history),
+                        "history": session.ai_responder.get_history_stats(),
+                        "cache": session.ai_responder.get_cache_stats(),
+                        "speculative": session.speculative.get_stats() if session.speculative else {"enabled": False},
+                        "requests": session.request_manager.get_stats(),
+                        "segmenter": self.question_segmenter.get_stats()
                     },
+                    "session": session.get_stats(),
+                    "sessions": self.sessions.get_stats(),
+                    "llm_scheduler": llm_scheduler.get_stats(),
+                    "llm_router": llm_router.get_stats(),
+                    "knowledge": knowledge_base.get_stats(),
+                    "broadcast": summarize_channels(self.channels.values()),
+                    "speech_events": self.speech_events.get_stats(),
+                    "partial_transcripts": self.partial_tracker.get_stats(),
+                    "metrics": metrics.summary(),
+                    "logging": get_logging_stats(),
                     "clients_connected": len(self.clients)
                 }
-                await websocket.send(json.dumps(status))
+                self._reply(websocket, status)
                 
+            elif message_type == "get_metrics":
+                # Гистограммы задержек по этапам: VAD, STT, LLM, отправка
+                response = {
+                    "type": "metrics",
+                    "metrics": metrics.snapshot(),
+                    "timestamp": time.time()
+                }
+                self._reply(websocket, response)
+                
+            elif message_type == "get_logs":
+                # Последние записи журнала из кольцевого буфера
+                records = query_logs(
+                    level=data.get("level"),
+                    category=data.get("category"),
+                    since=data.get("since"),
+                    limit=int(data.get("limit", 100))
+                )
+                response = {
+                    "type": "logs",
+                    "records": records,
+                    "timestamp": time.time()
+                }
+                # Записи журнала могут содержать несериализуемые значения
+                self._reply(websocket, response, json.dumps(response, ensure_ascii=False, default=str))
+
+            elif message_type == "retranscribe":
+                # Повторное распознавание последних N секунд из кольцевого буфера
+                seconds = float(data.get("seconds", 5))
+                text = None
+                if hasattr(self.speech_processor, 'retranscribe'):
+                    text = await asyncio.to_thread(self.speech_processor.retranscribe, seconds)
+                response = {
+                    "type": "speech_retranscription",
+                    "text": text or "",
+                    "seconds": seconds,
+                    "success": bool(text),
+                    "timestamp": time.time()
+                }
+                self._reply(websocket, response)
+                # По запросу сразу отправляем исправленный текст в AI
+                if text and data.get("ask"):
+                    session.request_manager.submit(websocket, text)
+
             elif message_type == "optimize_performance":
                 # Оптимизация производительности
                 if hasattr(self.speech_processor, 'optimize_performance'):
-                    result = self.speech_processor.optimize_performance()
+                    result = await asyncio.to_thread(self.speech_processor.optimize_performance,
+                                                     data.get("settings"))
                     response = {
                         "type": "performance_optimized",
                         "message": result.get("message", "Производительность оптимизирована"),
                         "status": result.get("status", "success")
                     }
-                    await websocket.send(json.dumps(response))
+                    self._reply(websocket, response)
+                
+            elif message_type == "update_recorder_settings":
+                # Изменение параметров VAD и пауз без перезагрузки моделей
+                if hasattr(self.speech_processor, 'update_settings'):
+                    result = await asyncio.to_thread(self.speech_processor.update_settings,
+                                                     data.get("settings", {}))
+                    response = {
+                        "type": "recorder_settings_updated",
+                        **result
+                    }
+                    self._reply(websocket, response)
                 
             elif message_type == "manual_question":
                 # Ручной ввод вопроса для отправки в AI
                 question = data.get("question", "")
                 if question:
-                    await self._process_ai_question(question)
+                    # Выполняем задачей, чтобы продолжать читать сообщения клиента
+                    session.request_manager.submit(websocket, question)
+                    
+            elif message_type == "audio_stream_start":
+                # Клиент будет передавать аудио бинарными кадрами
+                if not isinstance(self.audio_source, WebSocketAudioSource):
+                    self._reply(websocket, {
+                        "type": "audio_stream_error",
+                        "error": "Сервер не принимает аудио по WebSocket (AUDIO_INPUT=websocket)"
+                    })
+                    return
+                try:
+                    stream = self.audio_source.open_stream(
+                        int(data.get("stream_id", 0)),
+                        data.get("codec", "pcm16"),
+                        int(data.get("sample_rate") or config.SAMPLE_RATE),
+                        owner=websocket
+                    )
+                    response = {"type": "audio_stream_started", **stream.describe()}
+                except AudioStreamError as e:
+                    response = {"type": "audio_stream_error", "error": str(e)}
+                self._reply(websocket, response)
+                
+            elif message_type == "audio_stream_stop":
+                if isinstance(self.audio_source, WebSocketAudioSource):
+                    stats = self.audio_source.close_stream(data.get("stream_id"), owner=websocket)
+                    self._reply(websocket, {"type": "audio_stream_stopped", "stats": stats})
                     
+            elif message_type in ("subscribe", "unsubscribe"):
+                # Подписка сессии на общие события (распознанная речь)
+                topics = data.get("topics", [])
+                if message_type == "subscribe":
+                    subscriptions = session.subscribe(topics)
+                else:
+                    subscriptions = session.unsubscribe(topics)
+                response = {
+                    "type": "subscriptions",
+                    "topics": sorted(subscriptions)
+                }
+                self._reply(websocket, response)
+                
             elif message_type == "simulate_speech":
                 # Для тестирования с mock процессором
                 text = data.get("text", "")
                 if hasattr(self.speech_processor, 'simulate_speech'):
-                    self.speech_processor.simulate_speech(text)
+                    await asyncio.to_thread(self.speech_processor.simulate_speech, text)
                     
         except Exception as e:
-            logger.error(f"Ошибка при обработке сообщения от клиента: {e}")
+            logger.error("Ошибка при обработке сообщения от клиента: %s", e)
+    
+    async def _handle_audio_frame(self, websocket: websockets.WebSocketServerProtocol, frame: bytes):
+        """Передает бинарный кадр аудио в источник WebSocket"""
+        if not isinstance(self.audio_source, WebSocketAudioSource):
+            return
+        try:
+            self.audio_source.push_frame(frame, owner=websocket)
+        except AudioStreamError as e:
+            logger.warning("🎙️ Отброшен кадр аудио: %s", e, extra={"category": "audio_stream"})
+            self._reply(websocket, {"type": "audio_stream_error", "error": str(e)})
     
     async def _handle_client(self, websocket: websockets.WebSocketServerProtocol, path: str):
         """Обрабатывает подключение клиента"""
-        logger.info(f"{Fore.GREEN}🔗 Новое подключение: {websocket.remote_address}{Style.RESET_ALL}")
+        logger.info("%s🔗 Новое подключение: %s%s", Fore.GREEN, websocket.remote_address, Style.RESET_ALL)
         self.clients.add(websocket)
+        self.channels[websocket] = ClientChannel(websocket, on_closed=self._on_channel_closed)
+        # Клиент может вернуться в свою сессию: ws://host:port/?session=<id>
+        requested_session = parse_qs(urlparse(path or "").query).get("session", [None])[0]
+        session = self.sessions.attach(websocket, requested_session)
         
         try:
             # Отправляем приветственное сообщение
             welcome_message = {
                 "type": "welcome",
                 "message": "Подключено к Stealth AI Assistant",
-                "version": "1.0.0"
+                "version": "1.0.0",
+                "ready": self.speech_state != "loading",
+                "session_id": session.id,
+                "resumed": session.id == requested_session,
+                "profile": session.ai_responder.current_profile
             }
-            await websocket.send(json.dumps(welcome_message))
-            logger.info(f"{Fore.GREEN}💬 Приветственное сообщение отправлено клиенту{Style.RESET_ALL}")
+            self.channels[websocket].send(welcome_message)
+            logger.info("%s💬 Приветственное сообщение отправлено клиенту%s", Fore.GREEN, Style.RESET_ALL)
             
             # Обрабатываем сообщения от клиента
             async for message in websocket:
-                await self._handle_client_message(websocket, message)
+                if isinstance(message, bytes):
+                    await self._handle_audio_frame(websocket, message)
+                else:
+                    await self._handle_client_message(websocket, message)
                 
         except websockets.exceptions.ConnectionClosed:
-            logger.info(f"{Fore.YELLOW}🔌 Клиент отключился: {websocket.remote_address}{Style.RESET_ALL}")
+            logger.info("%s🔌 Клиент отключился: %s%s", Fore.YELLOW, websocket.remote_address, Style.RESET_ALL)
         except Exception as e:
-            logger.error(f"{Fore.RED}❌ Ошибка при обработке клиента: {e}{Style.RESET_ALL}")
+            logger.error("%s❌ Ошибка при обработке клиента: %s%s", Fore.RED, e, Style.RESET_ALL)
         finally:
+            channel = self.channels.get(websocket)
+            if channel:
+                channel.close()
             self.clients.discard(websocket)
-            logger.info(f"{Fore.CYAN}👥 Активных подключений: {len(self.clients)}{Style.RESET_ALL}")
+            self.sessions.detach(websocket)
+            if isinstance(self.audio_source, WebSocketAudioSource):
+                self.audio_source.close_stream(owner=websocket)
+            logger.info("%s👥 Активных подключений: %s%s", Fore.CYAN, len(self.clients), Style.RESET_ALL)
     
     def _monitor_security(self):
         """Мониторинг безопасности в отдельном потоке"""
@@ -300,7 +744,7 @@ class StealthAssistant:
         logger.info(f"{Fore.GREEN}🚀 Запуск Stealth AI Assistant{Style.RESET_ALL}")
         
         # Проверяем API ключ
-        if not config.PROXYAPI_KEY:
+        if not config.PROXYAPI_KEY and not config.LLM_ENDPOINTS:
             logger.error("PROXYAPI_KEY не установлен!")
             return
         logger.info(f"{Fore.YELLOW}🌐 Используем ProxyAPI.ru{Style.RESET_ALL}")
@@ -316,9 +760,17 @@ class StealthAssistant:
         self.security_monitor.start()
         logger.info(f"{Fore.GREEN}🛡️ Мониторинг безопасности активен{Style.RESET_ALL}")
         
+        # Метрики для Prometheus (опционально)
+        if config.METRICS_HTTP_PORT:
+            try:
+                self.metrics_server = start_metrics_http_server(config.WEBSOCKET_HOST, config.METRICS_HTTP_PORT)
+            except OSError as e:
+                logger.error(f"Не удалось запустить HTTP listener метрик: {e}")
+        
         # Запускаем WebSocket сервер
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
+        self.speech_events.attach(self.loop)
         
         try:
             logger.info(f"{Fore.YELLOW}🌐 Создаем WebSocket сервер на {config.WEBSOCKET_HOST}:{config.WEBSOCKET_PORT}...{Style.RESET_ALL}")
@@ -335,6 +787,11 @@ class StealthAssistant:
             
             self.loop.run_until_complete(self.server)
             logger.info(f"{Fore.GREEN}🚀 Сервер успешно запущен и готов к работе!{Style.RESET_ALL}")
+            
+            # Порт уже открыт - модели загружаются параллельно с подключением клиентов
+            self.warmup_task = self.loop.create_task(self._warm_up_speech())
+            self.eviction_task = self.loop.create_task(self.sessions.run_eviction())
+            self.loop.run_in_executor(None, knowledge_base.load).add_done_callback(self._on_knowledge_loaded)
             self.loop.run_forever()
             
         except KeyboardInterrupt:
@@ -353,6 +810,8 @@ class StealthAssistant:
         # Останавливаем прослушивание
         if self.speech_processor:
             self.speech_processor.stop_listening()
+            if isinstance(self.speech_processor, SpeechWorkerSupervisor):
+                self.speech_processor.shutdown()
         
         # Закрываем соединения с клиентами
         if self.clients:
@@ -365,14 +824,26 @@ class StealthAssistant:
                 except:
                     pass
         
+        # Дописываем на диск отложенные изменения кэша ответов
+        if self.sessions.answer_cache:
+            self.sessions.answer_cache.flush()
+        
+        # Закрываем пул HTTP соединений синхронных вызовов
+        http_client.close_sync()
+        
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server = None
+        
         logger.info("Сервер остановлен")
+        stop_logging()
 
 def main():
     """Основная функция"""
     try:
         # Проверяем, что переменная окружения установлена
-        if not os.getenv("PROXYAPI_KEY"):
-            print(f"{Fore.RED}❌ Установите переменную окружения PROXYAPI_KEY{Style.RESET_ALL}")
+        if not config.PROXYAPI_KEY and not config.LLM_ENDPOINTS:
+            print(f"{Fore.RED}❌ Установите переменную окружения PROXYAPI_KEY или LLM_ENDPOINTS{Style.RESET_ALL}")
             print(f"{Fore.YELLOW}Например: set PROXYAPI_KEY=sk-yseNQGJXYUnn4YjrnwNJnwW7bsnwFg8K{Style.RESET_ALL}")
             return
         
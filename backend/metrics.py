@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: от 100 мкс до ~105 с, шаг x2
+DEFAULT_BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+
+class Histogram:
+    """Гистограмма с фиксированным набором корзин (память не растет)"""
+
+    def __init__(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина - +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля по корзинам (линейная интерполяция внутри корзины)"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            cumulative = 0
+            for i, bucket_count in enumerate(self.counts):
+                if cumulative + bucket_count >= target and bucket_count:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) else self.max
+                    fraction = (target - cumulative) / bucket_count
+                    return min(lower + (upper - lower) * fraction, self.max)
+                cumulative += bucket_count
+            return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+    def export(self) -> dict:
+        """Сырые данные для передачи в другой процесс (см. merge)"""
+        with self._lock:
+            return {"help": self.help_text, "buckets": list(self.buckets), "counts": list(self.counts),
+                    "count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+
+    def merge(self, data: dict):
+        """Добавляет наблюдения, экспортированные такой же гистограммой"""
+        if tuple(data["buckets"]) != self.buckets:
+            logger.warning(f"Гистограмма {self.name}: другие корзины, данные пропущены")
+            return
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+            self.count += data["count"]
+            self.sum += data["sum"]
+            if data["min"] is not None:
+                self.min = data["min"] if self.min is None else min(self.min, data["min"])
+                self.max = data["max"] if self.max is None else max(self.max, data["max"])
+
+    def prometheus_lines(self) -> List[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total, total_sum = self.count, self.sum
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f"{self.name}_sum {total_sum}")
+        lines.append(f"{self.name}_count {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики задержек по этапам конвейера: гистограммы и счетчики"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str = "") -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(name, help_text))
+        return histogram
+
+    def observe(self, name: str, value: float, help_text: str = ""):
+        if not self.enabled:
+            return
+        self.histogram(name, help_text).observe(value)
+
+    def increment(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, help_text: str = ""):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, help_text)
+
+    def snapshot(self) -> dict:
+        """Полные данные: сводки гистограмм, корзины и счетчики"""
+        return {
+            "histograms": {
+                name: {**h.summary(), "buckets": list(h.buckets), "counts": list(h.counts)}
+                for name, h in list(self.histograms.items())
+            },
+            "counters": dict(self.counters)
+        }
+
+    def drain(self) -> dict:
+        """Забирает накопленное и начинает счет заново.
+
+        Так дочерний процесс пересылает родителю только новые наблюдения,
+        и перезапуск процесса не сбрасывает уже переданное.
+        """
+        with self._lock:
+            histograms, self.histograms = self.histograms, {}
+            counters, self.counters = self.counters, {}
+        return {
+            "histograms": {name: h.export() for name, h in histograms.items() if h.count},
+            "counters": counters
+        }
+
+    def merge(self, data: dict):
+        """Добавляет данные drain() другого процесса"""
+        if not self.enabled or not data:
+            return
+        for name, histogram in data.get("histograms", {}).items():
+            self.histogram(name, histogram["help"]).merge(histogram)
+        for name, value in data.get("counters", {}).items():
+            self.increment(name, value)
+
+    def summary(self) -> dict:
+        """Краткая сводка (p50/p95 по этапам) для get_status"""
+        result = {}
+        for name, h in list(self.histograms.items()):
+            if h.count:
+                p50, p95 = h.percentile(0.5), h.percentile(0.95)
+                result[name] = {"count": h.count, "p50": round(p50, 4), "p95": round(p95, 4)}
+        return result
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for h in list(self.histograms.values()):
+            lines.extend(h.prometheus_lines())
+        for name, value in dict(self.counters).items():
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry(enabled=config.METRICS_ENABLED)
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_http_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Запускает HTTP listener метрик в формате Prometheus в фоновом потоке"""
+    httpd = ThreadingHTTPServer((host, port), _PrometheusHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="MetricsHTTP").start()
+    logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+    return httpd
@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelInUseError(RuntimeError):
+    """Рекордер уже занят другим потребителем"""
+
+
+class RecorderGuard:
+    """Не дает создать второй рекордер в процессе.
+
+    Модели между рекордерами не делятся: RealtimeSTT загружает Whisper и
+    VAD сам (финальную модель - в своем процессе транскрипции) и не
+    принимает готовые, а микрофон, буфер и колбэки у рекордера одни.
+    Второй рекордер означал бы повторную загрузку моделей и борьбу за
+    микрофон, поэтому он не создается - ModelInUseError. Распознавание
+    в нескольких процессах - через speech_worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key: Optional[Hashable] = None
+        self._instance: Any = None
+        self._load_time = 0.0
+
+    def acquire(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Создает рекордер, если в процессе его еще нет"""
+        with self._lock:
+            if self._key is not None:
+                raise ModelInUseError(f"Рекордер {self._key} уже используется")
+            started_at = time.time()
+            instance = factory()
+            self._key, self._instance = key, instance
+            self._load_time = time.time() - started_at
+            return instance
+
+    def release(self, close: Optional[Callable[[Any], None]] = None):
+        """Освобождает рекордер и закрывает его через close"""
+        with self._lock:
+            if self._key is None:
+                return
+            instance = self._instance
+            self._key = self._instance = None
+
+        if close is not None:
+            try:
+                close(instance)
+            except Exception as e:
+                logger.error(f"Ошибка при выгрузке моделей: {e}")
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {"key": str(self._key) if self._key else None, "load_time": round(self._load_time, 2)}
+
+
+# Единственный рекордер процесса
+recorder_guard = RecorderGuard()
@@ -0,0 +1,107 @@
+import os
+import re
+import time
+from collections import deque
+from typing import List, Optional
+
+from config import config
+
+_PUNCTUATION = re.compile(r"[^\w]+")
+
+
+def _normalize_word(word: str) -> str:
+    """Слово для сравнения гипотез: регистр и пунктуация не важны"""
+    return _PUNCTUATION.sub("", word.lower().replace("ё", "е"))
+
+
+def _agreed_length(hypotheses: List[List[str]]) -> int:
+    """Длина общего префикса слов всех гипотез"""
+    length = 0
+    for words in zip(*hypotheses):
+        first = _normalize_word(words[0])
+        if any(_normalize_word(word) != first for word in words[1:]):
+            break
+        length += 1
+    return length
+
+
+class PartialTranscriptTracker:
+    """Устойчивый префикс и изменчивый хвост промежуточной транскрипции.
+
+    Realtime модель на каждом шаге заново распознает всю фразу, и конец
+    гипотезы постоянно меняется. Слово фиксируется, когда PARTIAL_AGREEMENT
+    последовательных гипотез совпадают на нем и на всем, что перед ним
+    (local agreement). Зафиксированный префикс только растет до конца
+    фразы, хвост - остаток последней гипотезы.
+
+    Клиенту уходят диффы к последнему отправленному тексту фразы: сколько
+    символов оставить (keep) и что дописать (append), не чаще раза в
+    PARTIAL_MIN_INTERVAL. base - номер состояния, к которому применяется
+    дифф; при keep == 0 дифф применим к любому состоянию.
+    """
+
+    def __init__(self, agreement: int = None, min_interval: float = None):
+        self.agreement = max(1, agreement or config.PARTIAL_AGREEMENT)
+        self.min_interval = config.PARTIAL_MIN_INTERVAL if min_interval is None else min_interval
+        self.utterance = 0
+        self.stats = {"hypotheses": 0, "updates": 0, "committed_words": 0}
+        self.reset()
+
+    def reset(self):
+        """Начинает новую фразу (после финальной транскрипции)"""
+        self.utterance += 1
+        self.seq = 0
+        self.committed: List[str] = []
+        self.tail: List[str] = []
+        self._history = deque(maxlen=self.agreement)
+        self._sent_text = ""
+        self._sent_at = 0.0
+
+    def update(self, text: str):
+        """Учитывает очередную гипотезу realtime модели"""
+        words = text.split()
+        self.stats["hypotheses"] += 1
+        self._history.append(words)
+
+        committed = len(self.committed)
+        if len(self._history) == self.agreement:
+            agreed = _agreed_length(list(self._history))
+            # Фиксируем, только если гипотезы не пересмотрели уже показанный префикс
+            if agreed > committed and _agreed_length([self.committed, words[:committed]]) == committed:
+                self.committed.extend(words[committed:agreed])
+                self.stats["committed_words"] += agreed - committed
+                committed = agreed
+        self.tail = words[committed:]
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.committed + self.tail)
+
+    def due_in(self) -> float:
+        """Сколько ждать до следующей отправки, секунд"""
+        return max(0.0, self._sent_at + self.min_interval - time.monotonic())
+
+    def diff(self) -> Optional[dict]:
+        """Сообщение с изменениями с прошлой отправки или None"""
+        text = self.text
+        if text == self._sent_text:
+            return None
+        keep = len(os.path.commonprefix([self._sent_text, text]))
+        message = {
+            "type": "speech_transcription_partial",
+            "utterance": self.utterance,
+            "seq": self.seq + 1,
+            "base": self.seq,
+            "keep": keep,
+            "append": text[keep:],
+            "stable_length": len(" ".join(self.committed)),
+            "timestamp": time.time()
+        }
+        self.seq += 1
+        self._sent_text = text
+        self._sent_at = time.monotonic()
+        self.stats["updates"] += 1
+        return message
+
+    def get_stats(self) -> dict:
+        return {"agreement": self.agreement, "utterance": self.utterance, **self.stats}
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Слова, указывающие на вопрос или просьбу рассказать
+INTERROGATIVE_CUES = {
+    "что", "как", "какой", "какая", "какое", "какие", "каким", "какую", "почему",
+    "зачем", "когда", "где", "куда", "откуда", "кто", "чем", "сколько", "ли",
+    "расскажите", "расскажи", "объясните", "объясни", "опишите", "опиши",
+    "назовите", "приведите", "можете", "могли",
+    "what", "how", "why", "when", "where", "who", "which", "explain", "describe", "tell"
+}
+
+# Окончания фразы, после которых речь явно продолжится
+CONTINUATION_ENDINGS = {
+    "и", "а", "но", "или", "что", "чтобы", "если", "как", "когда", "потому",
+    "который", "которая", "которые", "в", "на", "с", "по", "для", "про", "о", "об",
+    "and", "or", "but", "the", "a", "of", "to", "with"
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Причины завершения вопроса
+REASON_QUESTION_MARK = "question_mark"
+REASON_COMPLETE_SENTENCE = "complete_sentence"
+REASON_PAUSE = "pause"
+REASON_MAX_LENGTH = "max_length"
+REASON_PASSTHROUGH = "passthrough"
+
+
+class QuestionSegmenter:
+    """Склеивает фрагменты речи в законченные вопросы.
+
+    RealtimeSTT режет речь на каждой паузе, поэтому один вопрос часто
+    приходит несколькими транскрипциями. Фрагменты копятся в буфере, пока
+    пунктуация, длина паузы и вопросительные слова не укажут на конец
+    вопроса; после этого вызывается on_question с единым текстом.
+    Все методы вызываются из event loop.
+    """
+
+    def __init__(self, on_question: Callable[[str, dict], Awaitable[None]]):
+        self.on_question = on_question
+        self.enabled = config.SEGMENTER_ENABLED
+        self._fragments: List[str] = []
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"fragments": 0, "questions": 0}
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return _WORD_RE.findall(text.lower())
+
+    def _has_cue(self, text: str) -> bool:
+        return any(word in INTERROGATIVE_CUES for word in self._words(text))
+
+    def _completion_delay(self, text: str) -> Optional[float]:
+        """Через сколько секунд тишины считать вопрос законченным (None - сразу)"""
+        stripped = text.rstrip()
+        words = self._words(stripped)
+
+        if stripped.endswith("?"):
+            return None
+        if stripped.endswith((",", ":", "-", "—", "...", "…")) or (words and words[-1] in CONTINUATION_ENDINGS):
+            return config.SEGMENTER_MAX_PAUSE
+        if stripped.endswith((".", "!")) and self._has_cue(text):
+            return config.SEGMENTER_COMPLETE_PAUSE
+        return config.SEGMENTER_MAX_PAUSE
+
+    def add_fragment(self, text: str):
+        """Добавляет очередную транскрипцию"""
+        text = text.strip()
+        if not text:
+            return
+
+        self.stats["fragments"] += 1
+        if not self.enabled:
+            self._emit([text], REASON_PASSTHROUGH)
+            return
+
+        now = time.time()
+        if self._fragments and now - self._last_at > config.SEGMENTER_MAX_GAP:
+            # Слишком длинная пауза - предыдущий буфер это отдельная реплика
+            self._flush(REASON_PAUSE)
+
+        if not self._fragments:
+            self._first_at = now
+        self._fragments.append(text)
+        self._last_at = now
+
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        combined = " ".join(self._fragments)
+        if len(self._words(combined)) >= config.SEGMENTER_MAX_WORDS:
+            self._flush(REASON_MAX_LENGTH)
+            return
+
+        delay = self._completion_delay(combined)
+        if delay is None:
+            self._flush(REASON_QUESTION_MARK)
+            return
+
+        reason = REASON_COMPLETE_SENTENCE if delay == config.SEGMENTER_COMPLETE_PAUSE else REASON_PAUSE
+        self._flush_timer = asyncio.get_running_loop().call_later(delay, self._flush, reason)
+
+    def _flush(self, reason: str):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._fragments:
+            return
+
+        fragments, self._fragments = self._fragments, []
+        self._emit(fragments, reason)
+
+    def _emit(self, fragments: List[str], reason: str):
+        text = " ".join(fragments)
+        self.stats["questions"] += 1
+        info = {
+            "fragments": len(fragments),
+            "reason": reason,
+            "duration": round(self._last_at - self._first_at, 3) if len(fragments) > 1 else 0.0
+        }
+        logger.info("❓ Вопрос собран из %s фрагментов (%s): '%s'", len(fragments), reason, text)
+        task = asyncio.get_running_loop().create_task(self.on_question(text, info))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def reset(self):
+        """Сбрасывает накопленные фрагменты"""
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._fragments = []
+
+    def get_stats(self) -> dict:
+        return {"enabled": self.enabled, "buffered_fragments": len(self._fragments), **self.stats}
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from config import config
+from answer_cache import normalize_question
+from llm_scheduler import PRIORITY_MANUAL
+from speculative import SpeculativeRequest
+
+logger = logging.getLogger(__name__)
+
+# Политики обработки нового вопроса от сессии, у которой уже есть вопросы в работе
+POLICY_PARALLEL = "parallel"    # старые вопросы продолжают выполняться
+POLICY_SUPERSEDE = "supersede"  # новый вопрос отменяет старые
+REQUEST_POLICIES = (POLICY_PARALLEL, POLICY_SUPERSEDE)
+
+
+@dataclass
+class InflightRequest:
+    question: str
+    task: asyncio.Task
+    sessions: Set[Hashable] = field(default_factory=set)
+
+
+class AIRequestManager:
+    """Управляет выполняющимися вопросами к AI.
+
+    - одинаковые одновременные вопросы используют один запрос (single-flight);
+    - новый вопрос сессии может отменять ее старые вопросы (политика);
+    - вопросы выполняются задачами, не блокируя чтение сокета.
+
+    Отмена задачи прерывает потоковое чтение ответа, и соединение сразу
+    возвращается в пул (см. http_client.stream_post).
+    """
+
+    def __init__(self, ai_responder, handler: Callable[[str, int], Awaitable[Any]], policy: str = None):
+        self.ai_responder = ai_responder
+        self.handler = handler
+        self.policy = policy or config.AI_REQUEST_POLICY
+        if self.policy not in REQUEST_POLICIES:
+            logger.warning("Неизвестная политика запросов: %s, используем %s", self.policy, POLICY_SUPERSEDE)
+            self.policy = POLICY_SUPERSEDE
+
+        self._inflight: Dict[Tuple[str, str], InflightRequest] = {}
+        self.stats = {"submitted": 0, "deduplicated": 0, "superseded": 0, "cancelled": 0}
+
+    def _key(self, question: str) -> Tuple[str, str]:
+        return (self.ai_responder.current_profile, normalize_question(question))
+
+    def submit(self, session: Hashable, question: str, priority: int = PRIORITY_MANUAL) -> asyncio.Task:
+        """Ставит вопрос в работу и возвращает задачу, которая его обрабатывает"""
+        key = self._key(question)
+        self.stats["submitted"] += 1
+
+        existing = self._inflight.get(key)
+        if existing is not None:
+            existing.sessions.add(session)
+            self.stats["deduplicated"] += 1
+            logger.info("🔗 Вопрос уже обрабатывается, присоединяемся: '%s'", question[:60])
+            return existing.task
+
+        if self.policy == POLICY_SUPERSEDE:
+            superseded = self._detach_session(session)
+            self.stats["superseded"] += superseded
+
+        task = asyncio.create_task(self.handler(question, priority))
+        self._inflight[key] = InflightRequest(question=question, task=task, sessions={session})
+        task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        return task
+
+    def _detach_session(self, session: Hashable) -> int:
+        """Отвязывает сессию от ее вопросов; вопросы без сессий отменяются"""
+        cancelled = 0
+        for request in list(self._inflight.values()):
+            if session not in request.sessions:
+                continue
+            request.sessions.discard(session)
+            if not request.sessions and not request.task.done():
+                logger.info("🚫 Отменяем устаревший вопрос: '%s'", request.question[:60])
+                request.task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def _on_done(self, key: Tuple[str, str], task: asyncio.Task):
+        request = self._inflight.get(key)
+        if request is not None and request.task is task:
+            del self._inflight[key]
+
+        if task.cancelled():
+            self.stats["cancelled"] += 1
+        elif task.exception() is not None:
+            logger.error("❌ Ошибка при обработке вопроса: %s", task.exception())
+
+    def cancel_session(self, session: Hashable):
+        """Отменяет вопросы отключившейся сессии"""
+        self._detach_session(session)
+
+    def cancel_all(self):
+        """Отменяет все выполняющиеся вопросы"""
+        for request in list(self._inflight.values()):
+            request.task.cancel()
+
+    def get_stats(self) -> dict:
+        return {"policy": self.policy, "in_flight": len(self._inflight), **self.stats}
+
+
+class SharedAnswer:
+    """Подписка сессии на общий запрос; интерфейс как у SpeculativeRequest.
+
+    cancel() отписывает сессию - сам запрос отменяется, только когда
+    отписались все.
+    """
+
+    def __init__(self, registry: "SharedRequests", request: SpeculativeRequest):
+        self.registry = registry
+        self.request = request
+        self.question = request.question
+        self._released = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.request.cancelled
+
+    @property
+    def error(self) -> Optional[Exception]:
+        return self.request.error
+
+    def deltas(self) -> AsyncIterator[str]:
+        return self.request.deltas()
+
+    async def result(self) -> Optional[str]:
+        """Дожидается ответа; отмена ожидающего не прерывает запрос других сессий"""
+        try:
+            async for _ in self.request.deltas():
+                pass
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        return None if self.request.error else self.request.answer or None
+
+    def cancel(self):
+        if not self._released:
+            self._released = True
+            self.registry._release(self.request)
+
+
+class SharedRequests:
+    """Запросы к AI, общие для всех сессий (single-flight между сессиями).
+
+    Сессии с одинаковым профилем и историей (AIResponder.context_key) на
+    одинаковый вопрос получают одинаковый ответ, поэтому при
+    SEGMENTER_AUTO_ASK N подписанных сессий делают один запрос, а не N.
+    Ответ буферизуется (SpeculativeRequest), и каждая сессия воспроизводит
+    его с начала и сохраняет в свою историю сама.
+    """
+
+    def __init__(self):
+        self._requests: Dict[Tuple[str, str], SpeculativeRequest] = {}
+        self._consumers: Dict[SpeculativeRequest, int] = {}
+        self.stats = {"started": 0, "joined": 0}
+
+    def join(self, ai_responder, question: str, priority: int = PRIORITY_MANUAL) -> SharedAnswer:
+        """Подписывает сессию на идущий запрос с тем же ключом или начинает новый"""
+        key = (ai_responder.context_key(), normalize_question(question))
+        request = self._requests.get(key)
+        # Неудавшийся запрос не переиспользуем - повтор должен уйти заново
+        if request is None or (request.finished and not request.answer):
+            request = SpeculativeRequest(ai_responder, question, priority)
+            self._requests[key] = request
+            self._consumers[request] = 0
+            request.add_done_callback(lambda r, k=key: self._on_done(k, r))
+            self.stats["started"] += 1
+        else:
+            self.stats["joined"] += 1
+            logger.info("🔗 Вопрос уже задан другой сессией, присоединяемся: '%s'", question[:60])
+        self._consumers[request] += 1
+        return SharedAnswer(self, request)
+
+    def _release(self, request: SpeculativeRequest):
+        if request not in self._consumers:
+            return
+        self._consumers[request] -= 1
+        if self._consumers[request] <= 0 and not request.finished:
+            request.cancel()
+
+    def _on_done(self, key: Tuple[str, str], request: SpeculativeRequest):
+        self._consumers.pop(request, None)
+        if self._requests.get(key) is request:
+            del self._requests[key]
+
+    def get_stats(self) -> dict:
+        return {"in_flight": len(self._requests), **self.stats}
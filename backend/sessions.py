@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from config import config
+from ai_responder import AIResponder
+from answer_cache import AnswerCache
+from request_manager import AIRequestManager, SharedRequests
+from speculative import SpeculativeAnswerer
+
+logger = logging.getLogger(__name__)
+
+# Темы, на которые подписывается сессия. Ответы AI сессия получает всегда,
+# а распознанная речь общая для сервера и приходит только подписчикам.
+TOPIC_SPEECH = "speech"  # транскрипции, статус записи, собранные вопросы
+TOPICS = (TOPIC_SPEECH,)
+
+
+class Session:
+    """Состояние одного пользователя: профиль, история, вопросы в работе, подписки.
+
+    К сессии может быть подключено несколько соединений (например, после
+    переподключения с тем же session_id); ответы получают все они.
+    """
+
+    def __init__(self, session_id: str, handler: Callable[["Session", str, int], Awaitable[Any]],
+                 answer_cache: Optional[AnswerCache] = None):
+        self.id = session_id
+        self.ai_responder = AIResponder(answer_cache)
+        self.speculative = SpeculativeAnswerer(self.ai_responder) if config.SPECULATIVE_ENABLED else None
+        self.request_manager = AIRequestManager(self.ai_responder, functools.partial(handler, self))
+        self.connections: Set[Hashable] = set()
+        self.subscriptions: Set[str] = set(config.SESSION_DEFAULT_TOPICS)
+        self.created_at = time.time()
+        self.last_active = self.created_at
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def subscribe(self, topics: Iterable[str]) -> Set[str]:
+        self.subscriptions |= {topic for topic in topics if topic in TOPICS}
+        return self.subscriptions
+
+    def unsubscribe(self, topics: Iterable[str]) -> Set[str]:
+        self.subscriptions -= set(topics)
+        return self.subscriptions
+
+    def reset(self):
+        """Очищает историю диалога и спекулятивные запросы"""
+        self.ai_responder.clear_history()
+        if self.speculative:
+            self.speculative.reset()
+
+    def close(self):
+        """Освобождает ресурсы вытесняемой сессии"""
+        self.request_manager.cancel_all()
+        self.reset()
+
+    def get_stats(self) -> dict:
+        return {
+            "id": self.id,
+            "profile": self.ai_responder.current_profile,
+            "connections": len(self.connections),
+            "subscriptions": sorted(self.subscriptions),
+            "history_length": len(self.ai_responder.conversation_history),
+            "idle": round(time.time() - self.last_active, 1)
+        }
+
+
+class SessionManager:
+    """Сессии по session_id и соединениям, с вытеснением простаивающих"""
+
+    def __init__(self, handler: Callable[[Session, str, int], Awaitable[Any]]):
+        self.handler = handler
+        # Кэш ответов один на сервер, ключ - профиль и вопрос
+        self.answer_cache = AnswerCache() if config.ANSWER_CACHE_ENABLED else None
+        # Одинаковые вопросы сессий с одинаковым контекстом - один запрос к AI
+        self.shared_requests = SharedRequests()
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._by_connection: Dict[Hashable, Session] = {}
+        self.stats = {"created": 0, "resumed": 0, "evicted": 0}
+
+    def attach(self, connection: Hashable, session_id: Optional[str] = None) -> Session:
+        """Привязывает соединение к сессии (существующей или новой)"""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None:
+            self.stats["resumed"] += 1
+            self.sessions.move_to_end(session.id)
+        else:
+            self._evict_overflow()
+            session = Session(uuid.uuid4().hex, self.handler, self.answer_cache)
+            self.sessions[session.id] = session
+            self.stats["created"] += 1
+
+        session.connections.add(connection)
+        session.touch()
+        self._by_connection[connection] = session
+        return session
+
+    def detach(self, connection: Hashable) -> Optional[Session]:
+        """Отвязывает закрытое соединение; сессия остается до вытеснения"""
+        session = self._by_connection.pop(connection, None)
+        if session is None:
+            return None
+        session.connections.discard(connection)
+        session.request_manager.cancel_session(connection)
+        session.touch()
+        return session
+
+    def get(self, connection: Hashable) -> Optional[Session]:
+        return self._by_connection.get(connection)
+
+    def subscribed(self, topic: str) -> List[Session]:
+        """Сессии с подключенными клиентами, подписанные на тему"""
+        return [s for s in self.sessions.values() if s.connections and topic in s.subscriptions]
+
+    def _remove(self, session: Session):
+        session.close()
+        del self.sessions[session.id]
+        self.stats["evicted"] += 1
+
+    def _evict_overflow(self):
+        """Освобождает место под новую сессию, вытесняя самые старые без соединений"""
+        while len(self.sessions) >= config.SESSION_MAX_COUNT:
+            idle = [s for s in self.sessions.values() if not s.connections]
+            if not idle:
+                break
+            oldest = min(idle, key=lambda s: s.last_active)
+            logger.info(f"🧹 Вытесняем сессию {oldest.id[:8]} (предел {config.SESSION_MAX_COUNT})")
+            self._remove(oldest)
+
+    def evict_idle(self) -> int:
+        """Удаляет сессии без соединений, простаивающие дольше SESSION_IDLE_TIMEOUT"""
+        deadline = time.time() - config.SESSION_IDLE_TIMEOUT
+        expired = [s for s in self.sessions.values() if not s.connections and s.last_active < deadline]
+        for session in expired:
+            logger.info(f"🧹 Сессия {session.id[:8]} простаивала - удаляем")
+            self._remove(session)
+        return len(expired)
+
+    async def run_eviction(self):
+        """Периодически вытесняет простаивающие сессии"""
+        while True:
+            await asyncio.sleep(config.SESSION_EVICT_INTERVAL)
+            self.evict_idle()
+
+    def get_stats(self) -> dict:
+        return {
+            "active": len(self.sessions),
+            "connected": sum(1 for s in self.sessions.values() if s.connections),
+            "max": config.SESSION_MAX_COUNT,
+            "shared_requests": self.shared_requests.get_stats(),
+            **self.stats
+        }
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from difflib import SequenceMatcher
+from typing import AsyncIterator, Callable, List, Optional
+
+from config import config
+from answer_cache import normalize_question
+from llm_scheduler import PRIORITY_AUTO
+
+logger = logging.getLogger(__name__)
+
+
+def texts_match(a: str, b: str, threshold: float = None) -> bool:
+    """Проверяет, что два текста совпадают с точностью до мелких правок"""
+    threshold = threshold if threshold is not None else config.SPECULATIVE_MATCH_THRESHOLD
+    a, b = normalize_question(a), normalize_question(b)
+    if a == b:
+        return True
+    if not a or not b:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+class SpeculativeRequest:
+    """Запрос к AI, начатый до получения финальной транскрипции.
+
+    Дельты ответа накапливаются в буфере, поэтому потребитель может
+    подключиться в любой момент и получить ответ с начала.
+    """
+
+    def __init__(self, ai_responder, question: str, priority: int = PRIORITY_AUTO):
+        self.question = question
+        self.priority = priority
+        # Профиль и история, с которыми готовится ответ
+        self.context = ai_responder.context_key()
+        self.started_at = time.time()
+        self.parts: List[str] = []
+        self.finished = False
+        self.cancelled = False
+        # Ошибка, прервавшая ответ: накопленные дельты - не ответ
+        self.error: Optional[Exception] = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(ai_responder))
+
+    async def _run(self, ai_responder):
+        try:
+            async for delta in ai_responder.stream_response(self.question, commit=False, priority=self.priority):
+                self.parts.append(delta)
+                self._changed.set()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        except Exception as e:
+            self.error = e
+            logger.error("❌ Ошибка спекулятивного запроса: %s", e)
+        finally:
+            self.finished = True
+            self._changed.set()
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.parts).strip()
+
+    def cancel(self):
+        self._task.cancel()
+
+    def add_done_callback(self, callback: Callable[["SpeculativeRequest"], None]):
+        """Вызывает callback(request) по завершении или отмене запроса"""
+        self._task.add_done_callback(lambda _: callback(self))
+
+    async def deltas(self) -> AsyncIterator[str]:
+        """Отдает накопленные и последующие дельты ответа"""
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.finished:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def result(self) -> Optional[str]:
+        """Дожидается завершения и возвращает полный ответ"""
+        try:
+            await asyncio.shield(self._task)
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                # Отменен ожидающий, а не сам запрос
+                self.cancel()
+                raise
+            return None
+        return None if self.error else self.answer or None
+
+
+class SpeculativeAnswerer:
+    """Запускает запрос к AI по стабилизировавшейся промежуточной транскрипции.
+
+    Промежуточный текст считается стабильным, если не менялся
+    SPECULATIVE_STABLE_WINDOW секунд. Если финальная транскрипция заметно
+    отличается от спекулятивного текста, запрос отменяется и
+    перезапускается уже с финальным текстом. Все методы вызываются из
+    event loop.
+    """
+
+    def __init__(self, ai_responder):
+        self.ai_responder = ai_responder
+        self.current: Optional[SpeculativeRequest] = None
+        self._partial_text = ""
+        self._stability_timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"started": 0, "adopted": 0, "cancelled": 0, "reissued": 0, "local": 0}
+
+    def on_partial(self, text: str):
+        """Обрабатывает промежуточную транскрипцию"""
+        if normalize_question(text) == normalize_question(self._partial_text):
+            return
+
+        self._partial_text = text
+        if self._stability_timer:
+            self._stability_timer.cancel()
+        self._stability_timer = asyncio.get_running_loop().call_later(
+            config.SPECULATIVE_STABLE_WINDOW, self._on_stable
+        )
+
+    def _on_stable(self):
+        self._stability_timer = None
+        text = self._partial_text.strip()
+        if len(text.split()) < config.SPECULATIVE_MIN_WORDS:
+            return
+        self._start(text)
+
+    def _start(self, text: str):
+        if self.current and texts_match(self.current.question, text):
+            return
+        self._cancel_current()
+        # На подготовленный вопрос ответит локальная база - платный запрос не нужен
+        if self.ai_responder.local_answer(text, commit=False):
+            self.stats["local"] += 1
+            return
+        logger.info("🔮 Спекулятивный запрос к AI: '%s'", text)
+        self.current = SpeculativeRequest(self.ai_responder, text)
+        self.stats["started"] += 1
+
+    def _cancel_current(self):
+        if self.current and not self.current.finished:
+            self.current.cancel()
+            self.stats["cancelled"] += 1
+        self.current = None
+
+    def on_final(self, text: str):
+        """Сверяет финальную транскрипцию со спекулятивным запросом"""
+        if self._stability_timer:
+            self._stability_timer.cancel()
+            self._stability_timer = None
+        self._partial_text = ""
+
+        if not self.current or texts_match(self.current.question, text):
+            return
+
+        logger.info("🔮 Финальный текст отличается, перезапускаем запрос: '%s'", text)
+        self.stats["reissued"] += 1
+        self._start(text)
+
+    def take(self, question: str) -> Optional[SpeculativeRequest]:
+        """Забирает спекулятивный запрос, если он подходит к вопросу"""
+        request = self.current
+        if not request:
+            return None
+        if request.context != self.ai_responder.context_key() or not texts_match(request.question, question):
+            return None
+        self.current = None
+        self.stats["adopted"] += 1
+        logger.info("🔮 Используем спекулятивный ответ (запущен %.2fс назад)", time.time() - request.started_at)
+        return request
+
+    def reset(self):
+        """Отменяет все незавершенные спекулятивные запросы"""
+        if self._stability_timer:
+            self._stability_timer.cancel()
+            self._stability_timer = None
+        self._partial_text = ""
+        self._cancel_current()
+
+    def get_stats(self) -> dict:
+        return {"enabled": True, **self.stats}
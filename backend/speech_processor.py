@@ -1,80 +1,167 @@
 import logging
 import threading
 import time
-import queue
+from contextlib import nullcontext
 from typing import Optional, Callable
-from collections import deque
 import numpy as np
 
-try:
-    from RealtimeSTT import AudioToTextRecorder
-except ImportError:
-    print("RealtimeSTT не установлен. Используйте: pip install RealtimeSTT")
-    AudioToTextRecorder = None
-
 from config import config
+from stt_engine import create_stt_engine
+from model_registry import ModelInUseError
+from audio_sources import AudioSource, create_audio_source
+from audio_frontend import AudioFrontEnd
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SpeechProcessor:
-    def __init__(self):
+    def __init__(self, audio_source: Optional[AudioSource] = None):
         self.recorder = None
         self.is_listening = False
         self.listening_thread = None
+        self.feed_thread = None
+        self.audio_source = audio_source or create_audio_source()
+        # Предобработка и кольцевой буфер последних AUDIO_BUFFER_DURATION секунд
+        self.frontend = AudioFrontEnd(source_rate=self.audio_source.sample_rate)
         self.text_callback: Optional[Callable[[str], None]] = None
+        self.partial_callback: Optional[Callable[[str], None]] = None
+        self.status_callback: Optional[Callable[[str], None]] = None
         self.should_stop = False
+        # Отметки времени текущей фразы для метрик этапов (perf_counter)
+        self._recording_started_at: Optional[float] = None
+        self._recording_stopped_at: Optional[float] = None
+        self._last_partial_at: Optional[float] = None
+        self.engine = create_stt_engine(use_microphone=self.audio_source.uses_microphone)
         
         self._setup_recorder()
     
     def _setup_recorder(self):
         """Настраивает рекордер для распознавания речи"""
-        if AudioToTextRecorder is None:
+        if not self.engine.is_available():
             logger.error("RealtimeSTT не доступен")
             return
         
         try:
-            # Правильная инициализация RealtimeSTT
-            self.recorder = AudioToTextRecorder(
-                model=config.WHISPER_MODEL,
-                language=config.WHISPER_LANGUAGE,
-                enable_realtime_transcription=True,
-                use_microphone=True,
-                # Контроль размера очереди и задержек
-                min_length_of_recording=config.RTT_MIN_RECORDING_LENGTH,
-                min_gap_between_recordings=config.RTT_MIN_GAP_BETWEEN_RECORDINGS,
-                post_speech_silence_duration=config.RTT_POST_SPEECH_SILENCE,
-                # Производительность
-                silero_sensitivity=config.RTT_SILERO_SENSITIVITY,
-                webrtc_sensitivity=config.RTT_WEBRTC_SENSITIVITY,
-                silero_use_onnx=False
+            # Рекордер в процессе один; второй не создается (ModelInUseError)
+            self.recorder = self.engine.acquire_recorder(
+                # Промежуточные результаты realtime транскрипции
+                on_realtime_transcription_update=self._realtime_update_callback,
+                # Границы фраз по VAD для метрик задержек
+                on_recording_start=self._recording_start_callback,
+                on_recording_stop=self._recording_stop_callback,
+                # Микрофон рекордера: копим записанное для повторного распознавания
+                on_recorded_chunk=self._recorded_chunk_callback if self.audio_source.uses_microphone else None
             )
             
             logger.info("Рекордер настроен успешно")
+            settings = self.engine.settings
             logger.info(f"Параметры RealtimeSTT:")
-            logger.info(f"  - Модель: {config.WHISPER_MODEL}")
-            logger.info(f"  - Язык: {config.WHISPER_LANGUAGE}")
+            logger.info(f"  - Модель: {settings.final.model} (realtime: {settings.realtime.model})")
+            logger.info(f"  - Язык: {settings.language}")
+            logger.info(f"  - Устройство: {settings.device}, compute_type: {settings.compute_type}")
+            logger.info(f"  - Beam size: {settings.final.beam_size} (realtime: {settings.realtime.beam_size})")
             logger.info(f"  - Мин. длина записи: {config.RTT_MIN_RECORDING_LENGTH}с")
             logger.info(f"  - Мин. интервал: {config.RTT_MIN_GAP_BETWEEN_RECORDINGS}с")
             logger.info(f"  - Тишина после речи: {config.RTT_POST_SPEECH_SILENCE}с")
             
+        except ModelInUseError:
+            # Чужой рекордер не подменяем на mock молча - ошибка создания процессора
+            raise
         except Exception as e:
             logger.error(f"Ошибка при настройке рекордера: {e}")
             # Используем mock процессор при ошибке
             logger.info("Переключаемся на mock процессор")
             self.recorder = "mock"
     
+    def warm_up(self):
+        """Прогревает модели распознавания на синтетическом аудио.
+        
+        Первый проход Whisper выделяет память и инициализирует ядра
+        CTranslate2; делаем это заранее, а не на первой реплике.
+        """
+        if not self.recorder or self.recorder == "mock":
+            return
+        
+        started_at = time.time()
+        # Слабый шум вместо тишины, чтобы декодер прошел полный цикл
+        rng = np.random.default_rng(0)
+        samples = int(config.SAMPLE_RATE * config.WARMUP_AUDIO_SECONDS)
+        dummy_audio = (rng.standard_normal(samples) * 0.01).astype(np.float32)
+        language = config.WHISPER_LANGUAGE
+        
+        # Realtime модель живет в этом процессе
+        realtime_model = getattr(self.recorder, "realtime_model_type", None)
+        if hasattr(realtime_model, "transcribe"):
+            try:
+                segments, _ = realtime_model.transcribe(dummy_audio, language=language, beam_size=1)
+                list(segments)
+            except Exception as e:
+                logger.warning(f"Не удалось прогреть realtime модель: {e}")
+        
+        # Финальная модель работает в процессе транскрипции RealtimeSTT
+        pipe = getattr(self.recorder, "parent_transcription_pipe", None)
+        if pipe is not None:
+            try:
+                pipe.send((dummy_audio, language))
+                if pipe.poll(config.WARMUP_TIMEOUT):
+                    pipe.recv()
+                else:
+                    logger.warning("Прогрев финальной модели не завершился вовремя")
+            except Exception as e:
+                logger.warning(f"Не удалось прогреть финальную модель: {e}")
+        
+        logger.info(f"🔥 Модели прогреты за {time.time() - started_at:.2f}с")
+    
+    def _recording_start_callback(self):
+        self._recording_started_at = time.perf_counter()
+        self._recording_stopped_at = None
+        self._last_partial_at = None
+        if self.status_callback:
+            self.status_callback("recording")
+    
+    def _recording_stop_callback(self):
+        """VAD закрыл фразу: меряем, сколько заняло определение конца речи"""
+        self._recording_stopped_at = time.perf_counter()
+        metrics.increment("vad_segments_total")
+        if self._last_partial_at is not None:
+            metrics.observe("vad_speech_end_seconds", self._recording_stopped_at - self._last_partial_at,
+                            "От последнего промежуточного результата до конца фразы по VAD")
+        if self.status_callback:
+            self.status_callback("transcribing")
+    
+    def _recorded_chunk_callback(self, chunk: bytes):
+        self.frontend.append(np.frombuffer(chunk, dtype=np.int16))
+    
+    def _observe_decode(self):
+        """Время финального декодирования и real-time factor"""
+        stopped_at = self._recording_stopped_at
+        if stopped_at is None:
+            return
+        decode_time = time.perf_counter() - stopped_at
+        metrics.observe("stt_decode_seconds", decode_time, "Финальное декодирование Whisper")
+        if self._recording_started_at is not None and stopped_at > self._recording_started_at:
+            metrics.observe("stt_rtf", decode_time / (stopped_at - self._recording_started_at),
+                            "Real-time factor финального декодирования")
+        self._recording_stopped_at = None
+    
     def _text_detected_callback(self, text: str):
         """Callback для обработки распознанного текста"""
+        self._observe_decode()
         if text and text.strip():
-            logger.info(f"🗣️ Распознан текст: '{text}'")
+            logger.debug("🗣️ Распознан текст: '%s'", text, extra={"category": "transcript"})
             if self.text_callback:
-                logger.info(f"📞 Вызываем callback с текстом: '{text}'")
                 self.text_callback(text)
             else:
                 logger.warning("❌ Callback не установлен - текст не будет обработан!")
         else:
-            logger.debug(f"🤐 Пропускаем пустой текст: '{text}'")
+            logger.debug("🤐 Пропускаем пустой текст: '%s'", text)
+    
+    def _realtime_update_callback(self, text: str):
+        """Callback для промежуточных результатов realtime транскрипции"""
+        self._last_partial_at = time.perf_counter()
+        if self.partial_callback and text and text.strip():
+            self.partial_callback(text)
     
     def _listening_loop(self):
         """Основной цикл прослушивания в отдельном потоке"""
@@ -95,11 +182,38 @@ class SpeechProcessor:
                 
         logger.info("Цикл прослушивания завершен")
     
+    def _feed_loop(self):
+        """Подает аудио из внешнего источника в рекордер (файл, поток PCM)"""
+        logger.info(f"Запущена подача аудио: {self.audio_source.describe()}")
+        fed_seconds = 0.0
+        
+        try:
+            for chunk in self.audio_source.paced_chunks(lambda: self.should_stop):
+                if not len(chunk):
+                    continue
+                # Рекордер дописывает буфер в свой bytearray - отдаем view без копии
+                processed = self.frontend.process(chunk)
+                self.recorder.feed_audio(processed.data, original_sample_rate=self.frontend.target_rate)
+                fed_seconds += len(chunk) / self.audio_source.sample_rate
+        except Exception as e:
+            logger.error(f"Ошибка подачи аудио: {e}")
+        
+        logger.info(f"Подача аудио завершена ({fed_seconds:.1f}с аудио)")
+    
     def set_text_callback(self, callback: Callable[[str], None]):
         """Устанавливает колбэк для обработки распознанного текста"""
         self.text_callback = callback
         logger.info("Callback для обработки текста установлен")
     
+    def set_partial_callback(self, callback: Callable[[str], None]):
+        """Устанавливает колбэк для промежуточных результатов транскрипции"""
+        self.partial_callback = callback
+        logger.info("Callback для промежуточной транскрипции установлен")
+    
+    def set_status_callback(self, callback: Callable[[str], None]):
+        """Устанавливает колбэк смены состояния записи (recording, transcribing)"""
+        self.status_callback = callback
+    
     def start_listening(self):
         """Начинает прослушивание"""
         if not self.recorder:
@@ -127,6 +241,15 @@ class SpeechProcessor:
             )
             self.listening_thread.start()
             
+            # Для файлов и потоков PCM аудио подаем сами
+            if not self.audio_source.uses_microphone:
+                self.feed_thread = threading.Thread(
+                    target=self._feed_loop,
+                    daemon=True,
+                    name="SpeechAudioFeed"
+                )
+                self.feed_thread.start()
+            
             logger.info("✅ Прослушивание начато успешно")
             return True
             
@@ -146,6 +269,9 @@ class SpeechProcessor:
         self.should_stop = True
         self.is_listening = False
         
+        if self.feed_thread and self.feed_thread.is_alive():
+            self.feed_thread.join(timeout=2)
+        
         # Ждем завершения потока
         if self.listening_thread and self.listening_thread.is_alive():
             self.listening_thread.join(timeout=2)
@@ -169,12 +295,48 @@ class SpeechProcessor:
 
     def simulate_speech(self, text: str):
         """Имитирует распознавание речи для тестирования"""
-        logger.info(f"🎭 Симуляция речи: '{text}'")
+        logger.info("🎭 Симуляция речи: '%s'", text)
         if self.text_callback:
             self.text_callback(text)
         else:
             logger.warning("Callback не установлен для симуляции")
 
+    def retranscribe(self, seconds: float) -> Optional[str]:
+        """Повторно распознает последние seconds секунд из кольцевого буфера финальной моделью"""
+        if not self.recorder or self.recorder == "mock":
+            return None
+        
+        seconds = min(seconds, config.AUDIO_RETRANSCRIBE_MAX_SECONDS)
+        audio = self.frontend.last_seconds(seconds)
+        if audio is None:
+            logger.warning("Кольцевой буфер пуст - нечего распознавать")
+            return None
+        
+        # Финальная модель работает в процессе транскрипции RealtimeSTT;
+        # канал к нему общий с рекордером, поэтому берем его блокировку
+        pipe = getattr(self.recorder, "parent_transcription_pipe", None)
+        if pipe is None:
+            logger.warning("Рекордер не поддерживает повторное распознавание")
+            return None
+        
+        started_at = time.perf_counter()
+        with getattr(self.recorder, "transcription_lock", None) or nullcontext():
+            pipe.send((audio, config.WHISPER_LANGUAGE))
+            if not pipe.poll(config.WARMUP_TIMEOUT):
+                logger.warning("Повторное распознавание не завершилось вовремя")
+                return None
+            status, result = pipe.recv()
+        
+        if status != "success":
+            logger.error(f"Ошибка повторного распознавания: {result}")
+            return None
+        # Разные версии RealtimeSTT возвращают текст или (текст, info)
+        text = result[0] if isinstance(result, tuple) else result
+        metrics.observe("stt_retranscribe_seconds", time.perf_counter() - started_at,
+                        "Повторное распознавание из кольцевого буфера")
+        logger.info("🔁 Повторно распознано %.1fс аудио", len(audio) / self.frontend.target_rate)
+        return text.strip()
+    
     def get_recorder_info(self) -> dict:
         """Возвращает информацию о рекордере"""
         if self.recorder == "mock":
@@ -188,15 +350,47 @@ class SpeechProcessor:
                 "type": "realtime_stt",
                 "status": "listening" if self.is_listening else "ready",
                 "model": config.WHISPER_MODEL,
-                "language": config.WHISPER_LANGUAGE
+                "language": config.WHISPER_LANGUAGE,
+                "stt_engine": self.engine.describe(),
+                "vad_backend": self.engine.settings.vad_backend,
+                "audio_source": self.audio_source.describe(),
+                "audio_frontend": self.frontend.describe(),
+                "live_settings": {
+                    name: getattr(self.recorder, name, None) for name in self.engine.LIVE_SETTINGS
+                }
             }
             return info
         except Exception as e:
             logger.error(f"Ошибка получения информации о рекордере: {e}")
             return {"type": "realtime_stt", "status": "error", "error": str(e)}
 
-    def optimize_performance(self):
-        """Оптимизирует производительность RealtimeSTT"""
+    def update_settings(self, settings: dict) -> dict:
+        """Меняет параметры VAD и пауз на лету, без перезагрузки моделей"""
+        if self.recorder == "mock":
+            return {"status": "success", "applied": {}, "message": "Mock режим активен"}
+        
+        if not self.recorder:
+            return {"status": "error", "applied": {}, "message": "Рекордер не инициализирован"}
+        
+        try:
+            applied = self.engine.apply_live_settings(self.recorder, settings)
+            rejected = sorted(set(settings) - set(applied))
+            return {
+                "status": "success" if not rejected else "partial",
+                "applied": applied,
+                "rejected": rejected,
+                "message": "Параметры обновлены" if not rejected else f"Не применены: {', '.join(rejected)}"
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении параметров рекордера: {e}")
+            return {"status": "error", "applied": {}, "message": f"Ошибка обновления: {e}"}
+    
+    def optimize_performance(self, settings: Optional[dict] = None):
+        """Оптимизирует производительность RealtimeSTT.
+        
+        Параметры применяются к работающему рекордеру: микрофон не
+        закрывается, модели не перезагружаются.
+        """
         logger.info("⚡ Выполняется оптимизация производительности...")
         
         if self.recorder == "mock":
@@ -207,27 +401,21 @@ class SpeechProcessor:
             logger.error("Рекордер не инициализирован")
             return {"status": "error", "message": "Рекордер не инициализирован"}
         
-        try:
-            # Временно останавливаем прослушивание для перенастройки
-            was_listening = self.is_listening
-            if was_listening:
-                self.stop_listening()
-                time.sleep(1)
-            
-            # Пересоздаем рекордер с оптимизированными параметрами
-            self._setup_recorder()
-            
-            # Возобновляем прослушивание если было активно
-            if was_listening:
-                time.sleep(1)
-                self.start_listening()
-            
+        if settings is None:
+            # Повторно применяем текущие значения из конфигурации
+            settings = {
+                "silero_sensitivity": config.RTT_SILERO_SENSITIVITY,
+                "webrtc_sensitivity": config.RTT_WEBRTC_SENSITIVITY,
+                "post_speech_silence_duration": config.RTT_POST_SPEECH_SILENCE,
+                "min_length_of_recording": config.RTT_MIN_RECORDING_LENGTH,
+                "min_gap_between_recordings": config.RTT_MIN_GAP_BETWEEN_RECORDINGS,
+            }
+        
+        result = self.update_settings(settings)
+        if result["status"] != "error":
             logger.info("✅ Оптимизация производительности завершена")
-            return {"status": "success", "message": "Производительность оптимизирована"}
-            
-        except Exception as e:
-            logger.error(f"Ошибка при оптимизации: {e}")
-            return {"status": "error", "message": f"Ошибка оптимизации: {e}"}
+            result["message"] = "Производительность оптимизирована"
+        return result
 
     def shutdown(self):
         """Корректно завершает работу процессора"""
@@ -236,9 +424,9 @@ class SpeechProcessor:
         
         if self.recorder and self.recorder != "mock":
             try:
-                # У RealtimeSTT может быть метод shutdown
-                if hasattr(self.recorder, 'shutdown'):
-                    self.recorder.shutdown()
+                # Рекордер общий - выгружается последним потребителем
+                self.engine.release_recorder()
+                self.recorder = None
             except Exception as e:
                 logger.error(f"Ошибка при завершении рекордера: {e}")
         
@@ -249,9 +437,17 @@ class MockSpeechProcessor:
     def __init__(self):
         self.is_listening = False
         self.text_callback = None
+        self.partial_callback = None
+        self.status_callback = None
         
     def set_text_callback(self, callback):
         self.text_callback = callback
+    
+    def set_partial_callback(self, callback):
+        self.partial_callback = callback
+    
+    def set_status_callback(self, callback):
+        self.status_callback = callback
         
     def start_listening(self):
         self.is_listening = True
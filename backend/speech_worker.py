@@ -0,0 +1,501 @@
+"""
+Распознавание речи в отдельном процессе под присмотром супервизора.
+
+Whisper, VAD и колбэки рекордера работают в дочернем процессе и не
+конкурируют за GIL с event loop, а падение нативного аудио кода не
+роняет сервер. Протокол:
+    - аудио внешних источников (файл, stdin, WebSocket) родитель пишет в
+      кольцевой буфер в разделяемой памяти, процесс читает его как
+      AudioSource; микрофон процесс открывает сам;
+    - результаты и вызовы методов идут через multiprocessing.Pipe:
+      процесс -> родитель ("text" | "partial" | "status", текст),
+      ("ready" | "heartbeat", снимок состояния), ("reply", id, ok, результат);
+      родитель -> процесс (id, метод, аргументы).
+
+Снимок состояния (get_status и get_recorder_info процесса) приходит с
+каждым heartbeat, поэтому статус супервизор отдает из кэша, не блокируя
+вызывающий поток ожиданием ответа. В снимке же - метрики процесса,
+накопленные с прошлого heartbeat (metrics.drain); супервизор добавляет
+их в реестр родителя, и они видны в /metrics и get_stats.
+
+SpeechWorkerSupervisor повторяет интерфейс SpeechProcessor, перезапускает
+упавший или зависший процесс с прогревом моделей и восстанавливает
+прослушивание и измененные на лету параметры.
+"""
+import atexit
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from config import config
+from audio_sources import AudioSource, CaptureMicrophoneSource, MicrophoneSource, MICROPHONE, create_audio_source
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Методы SpeechProcessor, доступные через канал
+WORKER_METHODS = frozenset({
+    "start_listening", "stop_listening", "get_status", "get_recorder_info", "update_settings",
+    "optimize_performance", "retranscribe", "simulate_speech",
+})
+
+# Пауза опроса кольцевого буфера, когда новых отсчетов нет
+POLL_INTERVAL = 0.01
+# Заголовок разделяемой памяти: абсолютная позиция записи (uint64)
+HEADER_BYTES = 64
+# Пустое чтение - не view на разделяемую память, иначе ее не закрыть
+_NO_SAMPLES = np.empty(0, dtype=np.int16)
+
+
+class SpeechWorkerError(RuntimeError):
+    pass
+
+
+class SharedAudioRing:
+    """Кольцевой буфер PCM16 в разделяемой памяти: один писатель, один читатель.
+
+    Писатель сначала копирует отсчеты, затем публикует новую позицию;
+    читатель держит свою позицию и при отставании больше чем на
+    capacity пропускает перезаписанное.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self._position = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf)
+        self._data = np.ndarray((capacity,), dtype=np.int16, buffer=shm.buf, offset=HEADER_BYTES)
+        self.lost = 0
+
+    @classmethod
+    def create(cls, capacity: int) -> "SharedAudioRing":
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + capacity * 2)
+        ring = cls(shm, capacity, owner=True)
+        ring._position[0] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "SharedAudioRing":
+        return cls(shared_memory.SharedMemory(name=name), capacity, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def position(self) -> int:
+        return int(self._position[0])
+
+    def write(self, samples: np.ndarray):
+        position = self.position
+        if len(samples) > self.capacity:
+            position += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        start = position % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._position[0] = position + n
+
+    def read(self, position: int):
+        """Копия отсчетов с позиции position; возвращает (отсчеты, новая позиция)"""
+        end = self.position
+        if end - position > self.capacity:
+            self.lost += end - position - self.capacity
+            position = end - self.capacity
+        n = end - position
+        if n <= 0:
+            return _NO_SAMPLES, position
+        start = position % self.capacity
+        first = min(n, self.capacity - start)
+        samples = np.empty(n, dtype=np.int16)
+        samples[:first] = self._data[start:start + first]
+        samples[first:] = self._data[:n - first]
+        return samples, end
+
+    def close(self):
+        # Массивы держат ссылки на буфер - без них SharedMemory не закрыть
+        self._position = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedMemoryAudioSource(AudioSource):
+    """Аудио, которое родительский процесс пишет в SharedAudioRing"""
+
+    name = "shared_memory"
+
+    def __init__(self, ring: SharedAudioRing, **kwargs):
+        kwargs.setdefault("realtime", False)  # темп задает родитель
+        super().__init__(**kwargs)
+        self.ring = ring
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        # Начинаем с текущей позиции: аудио до старта прослушивания уже неактуально
+        position = self.ring.position
+        while True:
+            samples, position = self.ring.read(position)
+            if not len(samples):
+                time.sleep(POLL_INTERVAL)
+            # Пустой чанк тоже отдаем - SpeechProcessor проверит остановку
+            yield samples
+
+    def describe(self) -> dict:
+        return {**super().describe(), "capacity": self.ring.capacity, "lost_samples": self.ring.lost}
+
+
+def _worker_main(conn, config_values: dict, shm_name: Optional[str], capacity: int,
+                 source_rate: int, source_spec: Optional[str]):
+    """Точка входа дочернего процесса распознавания"""
+    from speech_processor import SpeechProcessor
+
+    # Конфигурация родителя могла меняться после импорта (бенчмарк, CLI)
+    for name, value in config_values.items():
+        setattr(config, name, value)
+    metrics.enabled = config.METRICS_ENABLED
+
+    send_lock = threading.Lock()
+
+    def send(*message):
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, EOFError):
+            pass  # родитель закрыл канал - выйдем на recv
+
+    ring = SharedAudioRing.attach(shm_name, capacity) if shm_name else None
+    source = (SharedMemoryAudioSource(ring, sample_rate=source_rate) if ring is not None
+              else create_audio_source(source_spec))
+    processor = SpeechProcessor(source)
+    processor.set_text_callback(lambda text: send("text", text))
+    processor.set_partial_callback(lambda text: send("partial", text))
+    processor.set_status_callback(lambda status: send("status", status))
+    if config.WARMUP_ENABLED:
+        processor.warm_up()
+
+    def snapshot() -> dict:
+        try:
+            return {"status": processor.get_status(), "recorder_info": processor.get_recorder_info(),
+                    "metrics": metrics.drain()}
+        except Exception as e:
+            logger.error(f"Ошибка снимка состояния процесса распознавания: {e}")
+            return {}
+
+    def heartbeat():
+        while True:
+            send("heartbeat", snapshot())
+            time.sleep(config.SPEECH_WORKER_HEARTBEAT_INTERVAL)
+
+    send("ready", snapshot())
+    threading.Thread(target=heartbeat, daemon=True, name="SpeechWorkerHeartbeat").start()
+
+    shutdown_call = None
+    while True:
+        try:
+            call_id, method, args = conn.recv()
+        except (EOFError, OSError):
+            break  # родитель завершился
+        if method == "shutdown":
+            shutdown_call = call_id
+            break
+        if method not in WORKER_METHODS:
+            send("reply", call_id, False, f"Неизвестный метод: {method}")
+            continue
+        try:
+            send("reply", call_id, True, getattr(processor, method)(*args))
+        except Exception as e:
+            send("reply", call_id, False, str(e))
+
+    processor.shutdown()
+    if ring is not None:
+        ring.close()
+    if shutdown_call is not None:
+        send("reply", shutdown_call, True, None)
+
+
+class SpeechWorkerSupervisor:
+    """SpeechProcessor в дочернем процессе с тем же интерфейсом.
+
+    Колбэки вызываются из потока чтения канала, как у SpeechProcessor -
+    из потоков рекордера. get_status и get_recorder_info отвечают из
+    снимка, присланного с последним heartbeat; остальные методы ждут
+    ответа процесса до SPEECH_WORKER_CALL_TIMEOUT, и из event loop их
+    нужно вызывать через asyncio.to_thread. Процесс, который умер или перестал присылать
+    heartbeat, перезапускается с паузой SPEECH_WORKER_RESTART_DELAY,
+    удваивающейся до SPEECH_WORKER_RESTART_MAX_DELAY.
+    """
+
+    def __init__(self, audio_source: AudioSource):
+        self.audio_source = audio_source
+        self.text_callback: Optional[Callable[[str], None]] = None
+        self.partial_callback: Optional[Callable[[str], None]] = None
+        self.status_callback: Optional[Callable[[str], None]] = None
+        self.is_listening = False
+
+        # Микрофон процесс открывает сам, остальное аудио идет через разделяемую память
+        self.local_capture = isinstance(audio_source, (MicrophoneSource, CaptureMicrophoneSource))
+        self.ring = None if self.local_capture else SharedAudioRing.create(
+            int(audio_source.sample_rate * config.SPEECH_WORKER_BUFFER_SECONDS))
+        self.feed_thread: Optional[threading.Thread] = None
+        self._feed_stop = threading.Event()
+
+        self._context = multiprocessing.get_context(config.SPEECH_WORKER_START_METHOD)
+        self.process = None
+        self.conn = None
+        self._send_lock = threading.Lock()
+        self._call_ids = itertools.count(1)
+        self._calls: Dict[int, list] = {}
+        self._last_heartbeat = 0.0
+        self._snapshot: dict = {}
+        self._live_settings: dict = {}
+        self._closing = False
+        self.stats = {"starts": 0, "restarts": 0, "crashes": 0, "hangs": 0, "call_timeouts": 0}
+
+        self._start_worker()
+        atexit.register(self.shutdown)
+        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True, name="SpeechWorkerMonitor")
+        self.monitor_thread.start()
+
+    def _start_worker(self):
+        """Запускает процесс и ждет загрузки и прогрева моделей"""
+        started_at = time.time()
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, dict(vars(config)), self.ring.name if self.ring else None,
+                  self.ring.capacity if self.ring else 0, self.audio_source.sample_rate,
+                  MICROPHONE if self.local_capture else None),
+            name="SpeechWorker"
+        )
+        process.start()
+        child_conn.close()
+
+        try:
+            if not parent_conn.poll(config.SPEECH_WORKER_START_TIMEOUT):
+                raise SpeechWorkerError("процесс распознавания не загрузился вовремя")
+            message = parent_conn.recv()
+            if message[0] != "ready":
+                raise SpeechWorkerError(f"неожиданное сообщение при запуске: {message[0]}")
+            self._apply_snapshot(message[1])
+        except (SpeechWorkerError, EOFError, OSError) as e:
+            parent_conn.close()
+            process.kill()
+            process.join()
+            raise SpeechWorkerError(f"Не удалось запустить процесс распознавания: {e}") from e
+
+        self.process, self.conn = process, parent_conn
+        self._last_heartbeat = time.monotonic()
+        self.stats["starts"] += 1
+        threading.Thread(target=self._reader_loop, args=(parent_conn,), daemon=True,
+                         name="SpeechWorkerReader").start()
+        logger.info(f"🧵 Процесс распознавания запущен (pid {process.pid}) за {time.time() - started_at:.1f}с")
+
+    def _reader_loop(self, conn):
+        """Разбирает сообщения процесса и вызывает колбэки"""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "heartbeat":
+                self._last_heartbeat = time.monotonic()
+                self._apply_snapshot(message[1])
+            elif kind == "reply":
+                waiter = self._calls.pop(message[1], None)
+                if waiter is not None:
+                    waiter[1] = message[2:]
+                    waiter[0].set()
+            else:
+                callback = {"text": self.text_callback, "partial": self.partial_callback,
+                            "status": self.status_callback}.get(kind)
+                if callback:
+                    try:
+                        callback(message[1])
+                    except Exception as e:
+                        logger.error(f"Ошибка колбэка процесса распознавания: {e}")
+
+        # Канал закрыт - ожидающие вызовы не дождутся ответа
+        for call_id in list(self._calls):
+            waiter = self._calls.pop(call_id, None)
+            if waiter is not None:
+                waiter[1] = (False, "процесс распознавания завершился")
+                waiter[0].set()
+
+    def _apply_snapshot(self, snapshot: dict):
+        if snapshot:
+            metrics.merge(snapshot.pop("metrics", None))
+            self._snapshot = snapshot
+
+    def _monitor_loop(self):
+        delay = config.SPEECH_WORKER_RESTART_DELAY
+        while not self._closing:
+            time.sleep(config.SPEECH_WORKER_HEARTBEAT_INTERVAL)
+            if self._closing:
+                return
+            if self.process.is_alive():
+                if time.monotonic() - self._last_heartbeat < config.SPEECH_WORKER_HEARTBEAT_TIMEOUT:
+                    delay = config.SPEECH_WORKER_RESTART_DELAY
+                    continue
+                self.stats["hangs"] += 1
+                logger.error("💀 Процесс распознавания не отвечает - перезапускаем")
+            else:
+                self.stats["crashes"] += 1
+                logger.error(f"💀 Процесс распознавания завершился (код {self.process.exitcode}) - перезапускаем")
+
+            self._stop_process()
+            metrics.increment("speech_worker_restarts_total")
+            while not self._closing:
+                time.sleep(delay)
+                delay = min(delay * 2, config.SPEECH_WORKER_RESTART_MAX_DELAY)
+                try:
+                    self._start_worker()
+                    break
+                except SpeechWorkerError as e:
+                    logger.error(str(e))
+            if not self._closing:
+                self.stats["restarts"] += 1
+                self._restore_state()
+
+    def _restore_state(self):
+        """Возвращает новому процессу состояние старого"""
+        if self._live_settings:
+            self._safe_call("update_settings", dict(self._live_settings))
+        if self.is_listening:
+            self._safe_call("start_listening", default=False)
+
+    def _stop_process(self):
+        if self.conn is not None:
+            self.conn.close()
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+        if self.process is not None:
+            self.process.join(timeout=5)
+
+    def _call(self, method: str, *args, timeout: float = None):
+        call_id = next(self._call_ids)
+        waiter = [threading.Event(), None]
+        self._calls[call_id] = waiter
+        try:
+            with self._send_lock:
+                self.conn.send((call_id, method, args))
+        except (OSError, ValueError) as e:
+            self._calls.pop(call_id, None)
+            raise SpeechWorkerError(f"процесс распознавания недоступен: {e}") from e
+
+        if not waiter[0].wait(timeout or config.SPEECH_WORKER_CALL_TIMEOUT):
+            self._calls.pop(call_id, None)
+            self.stats["call_timeouts"] += 1
+            raise SpeechWorkerError(f"{method}: нет ответа от процесса распознавания")
+        ok, result = waiter[1]
+        if not ok:
+            raise SpeechWorkerError(f"{method}: {result}")
+        return result
+
+    def _safe_call(self, method: str, *args, default=None, timeout: float = None):
+        try:
+            return self._call(method, *args, timeout=timeout)
+        except SpeechWorkerError as e:
+            logger.error(f"Ошибка вызова процесса распознавания: {e}")
+            return default
+
+    def _feed_loop(self):
+        """Пишет аудио источника в разделяемую память"""
+        logger.info(f"Запущена подача аудио в процесс распознавания: {self.audio_source.describe()}")
+        try:
+            for chunk in self.audio_source.paced_chunks(self._feed_stop.is_set):
+                if len(chunk):
+                    self.ring.write(chunk)
+        except Exception as e:
+            logger.error(f"Ошибка подачи аудио: {e}")
+
+    def set_text_callback(self, callback: Callable[[str], None]):
+        self.text_callback = callback
+
+    def set_partial_callback(self, callback: Callable[[str], None]):
+        self.partial_callback = callback
+
+    def set_status_callback(self, callback: Callable[[str], None]):
+        self.status_callback = callback
+
+    def start_listening(self) -> bool:
+        if not self._safe_call("start_listening", default=False):
+            return False
+        self.is_listening = True
+        if self.ring is not None and not (self.feed_thread and self.feed_thread.is_alive()):
+            self._feed_stop.clear()
+            self.feed_thread = threading.Thread(target=self._feed_loop, daemon=True, name="SpeechWorkerFeed")
+            self.feed_thread.start()
+        return True
+
+    def stop_listening(self):
+        self.is_listening = False
+        self._feed_stop.set()
+        if self.feed_thread and self.feed_thread.is_alive():
+            self.feed_thread.join(timeout=2)
+        self._safe_call("stop_listening")
+
+    def is_recording_active(self) -> bool:
+        return self.is_listening
+
+    def get_worker_stats(self) -> dict:
+        return {
+            "pid": self.process.pid if self.process else None,
+            "alive": bool(self.process and self.process.is_alive()),
+            "heartbeat_age": round(time.monotonic() - self._last_heartbeat, 2),
+            "shared_memory": {"capacity": self.ring.capacity, "position": self.ring.position} if self.ring else None,
+            **self.stats
+        }
+
+    def get_status(self) -> dict:
+        status = self._snapshot.get("status", {})
+        # Снимок может отставать на интервал heartbeat - состояние прослушивания знаем сами
+        return {**status, "is_listening": self.is_listening, "worker": self.get_worker_stats()}
+
+    def get_recorder_info(self) -> dict:
+        info = self._snapshot.get("recorder_info", {"type": "worker", "status": "unavailable"})
+        return {**info, "worker": self.get_worker_stats()}
+
+    def update_settings(self, settings: dict) -> dict:
+        result = self._safe_call("update_settings", settings)
+        if result is None:
+            return {"status": "error", "applied": {}, "message": "Процесс распознавания недоступен"}
+        # Переживают перезапуск процесса
+        self._live_settings.update(result.get("applied", {}))
+        return result
+
+    def optimize_performance(self, settings: Optional[dict] = None):
+        result = self._safe_call("optimize_performance", settings)
+        if result is None:
+            return {"status": "error", "message": "Процесс распознавания недоступен"}
+        self._live_settings.update(result.get("applied", {}))
+        return result
+
+    def retranscribe(self, seconds: float) -> Optional[str]:
+        return self._safe_call("retranscribe", seconds, timeout=config.WARMUP_TIMEOUT + config.SPEECH_WORKER_CALL_TIMEOUT)
+
+    def simulate_speech(self, text: str):
+        self._safe_call("simulate_speech", text)
+
+    def shutdown(self):
+        """Останавливает процесс и освобождает разделяемую память"""
+        if self._closing:
+            return
+        self._closing = True
+        logger.info("Завершение процесса распознавания...")
+        self._feed_stop.set()
+        if self.process is not None and self.process.is_alive():
+            self._safe_call("shutdown")
+            self.process.join(timeout=5)
+        self._stop_process()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
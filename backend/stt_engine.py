@@ -0,0 +1,260 @@
+import importlib.util
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+
+from config import config
+from model_registry import recorder_guard
+from vad_backends import VAD_SILERO_TORCH, VAD_WEBRTC, resolve_vad_backend
+
+logger = logging.getLogger(__name__)
+
+# Типы вычислений faster-whisper (CTranslate2), поддерживаемые на каждом устройстве
+CPU_COMPUTE_TYPES = ("int8", "int8_float32", "float32")
+CUDA_COMPUTE_TYPES = ("int8", "int8_float16", "int8_float32", "float16", "float32")
+
+
+def detect_cuda() -> bool:
+    """Проверяет наличие CUDA устройства для CTranslate2"""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+
+def resolve_device(requested: str) -> str:
+    """Преобразует auto/cpu/cuda в фактическое устройство"""
+    requested = (requested or "auto").lower()
+    if requested == "auto":
+        return "cuda" if detect_cuda() else "cpu"
+    if requested == "cuda" and not detect_cuda():
+        logger.warning("CUDA недоступна - распознавание будет работать на CPU")
+        return "cpu"
+    return requested
+
+
+def resolve_compute_type(device: str, requested: str) -> str:
+    """Подбирает тип вычислений, допустимый на устройстве"""
+    requested = (requested or "auto").lower()
+    if requested in ("auto", "default"):
+        # На CPU квантованная int8 модель дает лучший real-time factor
+        return "float16" if device == "cuda" else "int8"
+
+    supported = CUDA_COMPUTE_TYPES if device == "cuda" else CPU_COMPUTE_TYPES
+    if requested in supported:
+        return requested
+
+    fallback = "int8" if requested.startswith("int8") else "float32"
+    logger.warning(f"compute_type={requested} не поддерживается на {device}, используем {fallback}")
+    return fallback
+
+
+@dataclass
+class WhisperModelSpec:
+    """Параметры одной модели Whisper (финальной или realtime)"""
+    model: str
+    beam_size: int
+
+
+@dataclass
+class STTEngineSettings:
+    """Настройки движка распознавания речи"""
+    final: WhisperModelSpec
+    realtime: WhisperModelSpec
+    language: str
+    device: str
+    compute_type: str
+    cpu_threads: int
+    num_workers: int
+    use_microphone: bool = True
+    vad_backend: str = "silero_onnx"
+    vad_threads: int = 1
+
+    @classmethod
+    def from_config(cls, use_microphone: bool = True) -> "STTEngineSettings":
+        device = resolve_device(config.WHISPER_DEVICE)
+        return cls(
+            final=WhisperModelSpec(config.WHISPER_MODEL, config.WHISPER_BEAM_SIZE),
+            realtime=WhisperModelSpec(config.WHISPER_REALTIME_MODEL, config.WHISPER_REALTIME_BEAM_SIZE),
+            language=config.WHISPER_LANGUAGE,
+            device=device,
+            compute_type=resolve_compute_type(device, config.WHISPER_COMPUTE_TYPE),
+            cpu_threads=config.WHISPER_CPU_THREADS,
+            num_workers=config.WHISPER_NUM_WORKERS,
+            use_microphone=use_microphone,
+            vad_backend=resolve_vad_backend(config.VAD_BACKEND),
+            vad_threads=config.VAD_THREADS
+        )
+
+
+class STTEngine:
+    """Базовый класс движка распознавания речи.
+
+    Движок отвечает за выбор устройства, квантования и параметров
+    декодирования и создает рекордер, который используется SpeechProcessor.
+    """
+
+    name = "base"
+    # Параметры, которые можно менять без перезагрузки моделей: имя -> тип
+    LIVE_SETTINGS: Dict[str, type] = {}
+
+    def __init__(self, settings: STTEngineSettings = None):
+        self.settings = settings or STTEngineSettings.from_config()
+
+    def is_available(self) -> bool:
+        return False
+
+    def create_recorder(self, **callbacks: Optional[Callable]) -> Any:
+        raise NotImplementedError
+
+    def settings_key(self) -> tuple:
+        """Описание рекордера по настройкам движка (для сообщений и статистики)"""
+        return (self.name, repr(asdict(self.settings)))
+
+    def acquire_recorder(self, **callbacks: Optional[Callable]) -> Any:
+        """Создает рекордер процесса; второй рекордер - ModelInUseError.
+
+        Модели RealtimeSTT делить между рекордерами нельзя (см. RecorderGuard).
+        """
+        return recorder_guard.acquire(self.settings_key(), lambda: self.create_recorder(**callbacks))
+
+    def release_recorder(self):
+        """Освобождает рекордер и выгружает его модели"""
+        recorder_guard.release(lambda recorder: recorder.shutdown() if hasattr(recorder, "shutdown") else None)
+
+    def apply_live_settings(self, recorder: Any, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Меняет параметры работающего рекордера, не останавливая микрофон"""
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        return {"engine": self.name, **asdict(self.settings)}
+
+
+class RealtimeSTTEngine(STTEngine):
+    """Движок на RealtimeSTT (faster-whisper + WebRTC/Silero VAD).
+
+    RealtimeSTT загружает финальную и realtime модели на одном устройстве
+    с одним compute_type; размер модели и beam size задаются раздельно,
+    поэтому можно держать крошечную realtime модель рядом с большой финальной.
+
+    RealtimeSTT импортирует PyTorch на уровне модуля, поэтому сам пакет
+    импортируется только при создании рекордера, а не при старте сервера.
+    """
+
+    name = "realtime_stt"
+    # Эти атрибуты рекордер читает на каждой итерации цикла записи
+    LIVE_SETTINGS = {
+        "silero_sensitivity": float,
+        "webrtc_sensitivity": int,
+        "post_speech_silence_duration": float,
+        "min_length_of_recording": float,
+        "min_gap_between_recordings": float,
+        "realtime_processing_pause": float,
+    }
+
+    def is_available(self) -> bool:
+        if importlib.util.find_spec("RealtimeSTT") is None:
+            logger.warning("RealtimeSTT не установлен. Используйте: pip install RealtimeSTT")
+            return False
+        return True
+
+    def apply_live_settings(self, recorder: Any, settings: Dict[str, Any]) -> Dict[str, Any]:
+        applied = {}
+        for name, value in settings.items():
+            value_type = self.LIVE_SETTINGS.get(name)
+            if value_type is None:
+                logger.warning(f"Параметр {name} нельзя менять на лету")
+                continue
+            value = value_type(value)
+
+            if name == "webrtc_sensitivity":
+                vad_model = getattr(recorder, "webrtc_vad_model", None)
+                if vad_model is None:
+                    continue
+                vad_model.set_mode(value)
+            setattr(recorder, name, value)
+            applied[name] = value
+
+        if applied:
+            logger.info(f"🎚️ Параметры рекордера обновлены на лету: {applied}")
+        return applied
+
+    def _apply_thread_settings(self):
+        # RealtimeSTT не пробрасывает cpu_threads в WhisperModel; CTranslate2
+        # при cpu_threads=0 берет число потоков из OMP_NUM_THREADS, которое
+        # наследуется и процессом финальной транскрипции
+        if self.settings.device == "cpu" and self.settings.cpu_threads > 0:
+            os.environ["OMP_NUM_THREADS"] = str(self.settings.cpu_threads)
+        if self.settings.num_workers > 1:
+            logger.info("num_workers > 1 не поддерживается RealtimeSTT - транскрипция идет одним воркером")
+        if self.settings.vad_backend == VAD_SILERO_TORCH:
+            # Silero на PyTorch по умолчанию занимает все ядра и конкурирует с Whisper;
+            # ONNX сессию RealtimeSTT и так создает с одним потоком
+            import torch
+            torch.set_num_threads(self.settings.vad_threads)
+
+    def recorder_kwargs(self, **callbacks: Optional[Callable]) -> Dict[str, Any]:
+        settings = self.settings
+        kwargs = dict(
+            model=settings.final.model,
+            language=settings.language,
+            device=settings.device,
+            compute_type=settings.compute_type,
+            beam_size=settings.final.beam_size,
+            enable_realtime_transcription=True,
+            realtime_model_type=settings.realtime.model,
+            beam_size_realtime=settings.realtime.beam_size,
+            # Без микрофона аудио подается через feed_audio
+            use_microphone=settings.use_microphone,
+            # Контроль размера очереди и задержек
+            min_length_of_recording=config.RTT_MIN_RECORDING_LENGTH,
+            min_gap_between_recordings=config.RTT_MIN_GAP_BETWEEN_RECORDINGS,
+            post_speech_silence_duration=config.RTT_POST_SPEECH_SILENCE,
+            # Производительность
+            silero_sensitivity=config.RTT_SILERO_SENSITIVITY,
+            webrtc_sensitivity=config.RTT_WEBRTC_SENSITIVITY,
+            silero_use_onnx=settings.vad_backend != VAD_SILERO_TORCH
+        )
+        kwargs.update({name: cb for name, cb in callbacks.items() if cb is not None})
+        return kwargs
+
+    def _disable_silero(self, recorder: Any):
+        """Режим webrtc: решение о речи принимает только WebRTC VAD.
+
+        RealtimeSTT запускает проверку Silero, когда WebRTC услышал речь,
+        и начинает запись, только если оба согласны. Подменяем проверку
+        Silero на согласие без инференса.
+        """
+        def always_speech(chunk) -> bool:
+            recorder.is_silero_speech_active = True
+            return True
+
+        recorder._is_silero_speech = always_speech
+
+    def create_recorder(self, **callbacks: Optional[Callable]) -> Any:
+        from RealtimeSTT import AudioToTextRecorder
+
+        self._apply_thread_settings()
+        recorder = AudioToTextRecorder(**self.recorder_kwargs(**callbacks))
+        if self.settings.vad_backend == VAD_WEBRTC:
+            self._disable_silero(recorder)
+        logger.info(f"🎙️ VAD бэкенд: {self.settings.vad_backend}")
+        return recorder
+
+
+# Доступные движки распознавания
+STT_ENGINES = {
+    RealtimeSTTEngine.name: RealtimeSTTEngine,
+}
+
+
+def create_stt_engine(name: str = None, use_microphone: bool = True) -> STTEngine:
+    """Создает движок распознавания по имени из конфигурации"""
+    name = name or config.STT_ENGINE
+    engine_class = STT_ENGINES.get(name)
+    if engine_class is None:
+        logger.warning(f"Неизвестный STT движок: {name}, используем {RealtimeSTTEngine.name}")
+        engine_class = RealtimeSTTEngine
+    return engine_class(STTEngineSettings.from_config(use_microphone=use_microphone))
@@ -1,7 +1,7 @@
 import logging
-import requests
 from typing import Dict, Any, Optional
 from config import config
+from http_client import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -23,10 +23,10 @@ class APITester:
                 'max_tokens': 10
             }
             
-            response = requests.post(
+            response = http_client.post_json_sync(
                 f"{config.PROXY_API_BASE_URL}/chat/completions",
-                headers=headers,
-                json=data,
+                headers,
+                data,
                 timeout=10
             )
             
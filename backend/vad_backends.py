@@ -0,0 +1,171 @@
+import glob
+import importlib.util
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Бэкенды определения речи
+VAD_SILERO_ONNX = "silero_onnx"  # Silero на ONNX Runtime, без PyTorch
+VAD_SILERO_TORCH = "silero_torch"  # Silero на PyTorch (JIT)
+VAD_WEBRTC = "webrtc"  # только WebRTC VAD, Silero не вызывается
+VAD_BACKENDS = (VAD_SILERO_ONNX, VAD_SILERO_TORCH, VAD_WEBRTC)
+
+SILERO_REPO = "snakers4/silero-vad"
+SILERO_FRAME = 512  # отсчетов на кадр при 16 кГц
+SILERO_CONTEXT = 64  # отсчетов прошлого кадра, которые ждет модель v5
+WEBRTC_FRAME = 480  # 30 мс при 16 кГц
+
+
+def _module_available(name: str) -> bool:
+    """Проверка без импорта (torch импортируется секунды)"""
+    return importlib.util.find_spec(name) is not None
+
+
+def backend_available(backend: str) -> bool:
+    if backend == VAD_SILERO_ONNX:
+        return _module_available("onnxruntime")
+    if backend == VAD_SILERO_TORCH:
+        return _module_available("torch")
+    if backend == VAD_WEBRTC:
+        return _module_available("webrtcvad")
+    return False
+
+
+def resolve_vad_backend(requested: str = None) -> str:
+    """Выбирает бэкенд VAD: запрошенный, если доступен, иначе ближайший по легкости"""
+    requested = (requested or config.VAD_BACKEND).lower()
+    if requested not in VAD_BACKENDS:
+        logger.warning(f"Неизвестный VAD бэкенд: {requested}, используем {VAD_SILERO_ONNX}")
+        requested = VAD_SILERO_ONNX
+    if backend_available(requested):
+        return requested
+    for fallback in (VAD_SILERO_ONNX, VAD_SILERO_TORCH):
+        if fallback != requested and backend_available(fallback):
+            logger.warning(f"VAD бэкенд {requested} недоступен, используем {fallback}")
+            return fallback
+    return requested
+
+
+def find_silero_onnx_model() -> Optional[str]:
+    """Путь к silero_vad.onnx: из конфигурации, пакета silero_vad или кэша torch.hub"""
+    if config.VAD_ONNX_MODEL_PATH:
+        return config.VAD_ONNX_MODEL_PATH
+    spec = importlib.util.find_spec("silero_vad")
+    if spec is not None and spec.submodule_search_locations:
+        for location in spec.submodule_search_locations:
+            path = os.path.join(location, "data", "silero_vad.onnx")
+            if os.path.exists(path):
+                return path
+    torch_home = os.getenv("TORCH_HOME", os.path.join(os.path.expanduser("~"), ".cache", "torch"))
+    matches = glob.glob(os.path.join(torch_home, "hub", "snakers4_silero-vad_*", "**", "silero_vad.onnx"),
+                        recursive=True)
+    return matches[0] if matches else None
+
+
+class VADBackend:
+    """Детектор речи по кадрам PCM16 16 кГц фиксированного размера"""
+
+    name = "base"
+    frame_size = SILERO_FRAME
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class SileroOnnxVAD(VADBackend):
+    """Silero VAD v5 на ONNX Runtime с заданным числом потоков"""
+
+    name = VAD_SILERO_ONNX
+
+    def __init__(self, threads: int = None, threshold: float = None, model_path: str = None):
+        import onnxruntime
+
+        model_path = model_path or find_silero_onnx_model()
+        if not model_path:
+            raise RuntimeError("silero_vad.onnx не найден: задайте VAD_ONNX_MODEL_PATH")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or config.VAD_THREADS
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options,
+                                                    providers=["CPUExecutionProvider"])
+        self.threshold = threshold if threshold is not None else 1 - config.RTT_SILERO_SENSITIVITY
+        self._input = np.zeros((1, SILERO_CONTEXT + SILERO_FRAME), dtype=np.float32)
+        self._sr = np.array(config.SAMPLE_RATE, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._input[:] = 0.0
+
+    def probability(self, frame: np.ndarray) -> float:
+        # Контекст - хвост прошлого кадра, затем новый кадр в [-1, 1]
+        self._input[0, :SILERO_CONTEXT] = self._input[0, -SILERO_CONTEXT:]
+        np.multiply(frame, 1 / 32768, out=self._input[0, SILERO_CONTEXT:], casting="unsafe")
+        prob, self._state = self.session.run(None, {"input": self._input, "state": self._state, "sr": self._sr})
+        return float(prob[0][0])
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return self.probability(frame) > self.threshold
+
+
+class SileroTorchVAD(VADBackend):
+    """Silero VAD на PyTorch (как в RealtimeSTT при silero_use_onnx=False)"""
+
+    name = VAD_SILERO_TORCH
+
+    def __init__(self, threads: int = None, threshold: float = None):
+        import torch
+
+        torch.set_num_threads(threads or config.VAD_THREADS)
+        self.torch = torch
+        self.model, _ = torch.hub.load(SILERO_REPO, "silero_vad", onnx=False, verbose=False)
+        self.threshold = threshold if threshold is not None else 1 - config.RTT_SILERO_SENSITIVITY
+
+    def reset(self):
+        self.model.reset_states()
+
+    def probability(self, frame: np.ndarray) -> float:
+        audio = self.torch.from_numpy(frame.astype(np.float32) / 32768)
+        with self.torch.no_grad():
+            return float(self.model(audio, config.SAMPLE_RATE).item())
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return self.probability(frame) > self.threshold
+
+
+class WebRTCVAD(VADBackend):
+    """WebRTC VAD (GMM, почти не нагружает CPU)"""
+
+    name = VAD_WEBRTC
+    frame_size = WEBRTC_FRAME
+
+    def __init__(self, mode: int = None):
+        import webrtcvad
+
+        self.vad = webrtcvad.Vad(config.RTT_WEBRTC_SENSITIVITY if mode is None else mode)
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return self.vad.is_speech(frame.tobytes(), config.SAMPLE_RATE)
+
+
+def create_vad_backend(backend: str, threads: int = None) -> VADBackend:
+    if backend == VAD_SILERO_ONNX:
+        return SileroOnnxVAD(threads)
+    if backend == VAD_SILERO_TORCH:
+        return SileroTorchVAD(threads)
+    if backend == VAD_WEBRTC:
+        return WebRTCVAD()
+    raise ValueError(f"Неизвестный VAD бэкенд: {backend}")
+
+
+def available_backends() -> List[str]:
+    return [backend for backend in VAD_BACKENDS if backend_available(backend)]
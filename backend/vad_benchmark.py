@@ -0,0 +1,142 @@
+"""
+Микробенчмарк бэкендов VAD: стоимость CPU и задержка обнаружения речи.
+
+Прогоняет фразы-фикстуры (с секундой тишины до и после) через каждый
+доступный бэкенд кадрами фиксированного размера и считает:
+  - cpu_ms_per_audio_second - процессорное время на секунду аудио;
+  - frame_ms - время обработки одного кадра (p50/p95);
+  - onset_delay_ms - от начала речи (по амплитуде) до первого кадра речи;
+  - offset_delay_ms - от конца речи до последнего кадра речи.
+
+Примеры:
+    python vad_benchmark.py --fixtures fixtures/
+    python vad_benchmark.py --fixtures fixtures/ --backends silero_onnx webrtc --threads 1 2
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from audio_sources import load_audio_file
+from benchmark import SPEECH_AMPLITUDE_THRESHOLD, git_revision, percentiles
+from vad_backends import VAD_BACKENDS, VAD_WEBRTC, available_backends, create_vad_backend
+
+logger = logging.getLogger("vad_benchmark")
+
+PADDING_SECONDS = 1.0
+
+
+def load_fixture(path: str) -> np.ndarray:
+    """Фраза с тишиной по краям, чтобы было что обнаруживать"""
+    padding = np.zeros(int(config.SAMPLE_RATE * PADDING_SECONDS), dtype=np.int16)
+    return np.concatenate([padding, load_audio_file(path), padding])
+
+
+def speech_bounds(samples: np.ndarray) -> Optional[tuple]:
+    voiced = np.flatnonzero(np.abs(samples.astype(np.int32)) > SPEECH_AMPLITUDE_THRESHOLD)
+    if not len(voiced):
+        return None
+    return int(voiced[0]), int(voiced[-1])
+
+
+def run_backend(vad, fixtures: List[np.ndarray]) -> dict:
+    frame_size = vad.frame_size
+    frame_times: List[float] = []
+    onset_delays: List[float] = []
+    offset_delays: List[float] = []
+    audio_seconds = 0.0
+    cpu_seconds = 0.0
+
+    for samples in fixtures:
+        vad.reset()
+        speech_frames = []
+        cpu_started = time.process_time()
+        for start in range(0, len(samples) - frame_size + 1, frame_size):
+            frame = samples[start:start + frame_size]
+            started = time.perf_counter()
+            if vad.is_speech(frame):
+                speech_frames.append(start)
+            frame_times.append(time.perf_counter() - started)
+        cpu_seconds += time.process_time() - cpu_started
+        audio_seconds += len(samples) / config.SAMPLE_RATE
+
+        bounds = speech_bounds(samples)
+        if bounds is None or not speech_frames:
+            continue
+        onset, offset = bounds
+        # Кадр речи виден детектору только после того, как пришел целиком
+        detected = [start + frame_size for start in speech_frames if start + frame_size > onset]
+        if detected:
+            onset_delays.append((detected[0] - onset) / config.SAMPLE_RATE)
+        offset_delays.append((speech_frames[-1] + frame_size - offset) / config.SAMPLE_RATE)
+
+    return {
+        "frame_size": frame_size,
+        "cpu_ms_per_audio_second": round(cpu_seconds * 1000 / audio_seconds, 2) if audio_seconds else None,
+        "frame_ms": percentiles(frame_times),
+        "onset_delay_ms": percentiles(onset_delays),
+        "offset_delay_ms": percentiles(offset_delays),
+        "detected": f"{len(offset_delays)}/{len(fixtures)}"
+    }
+
+
+def run_benchmark(args) -> dict:
+    paths = sorted(
+        os.path.join(args.fixtures, name) for name in os.listdir(args.fixtures)
+        if name.lower().endswith((".wav", ".flac"))
+    )
+    fixtures = [load_fixture(path) for path in paths]
+    backends = args.backends or available_backends()
+
+    results: Dict[str, dict] = {}
+    for backend in backends:
+        # Число потоков влияет только на Silero
+        for threads in ([None] if backend == VAD_WEBRTC else args.threads):
+            label = backend if threads is None else f"{backend}/threads={threads}"
+            try:
+                vad = create_vad_backend(backend, threads)
+            except Exception as e:
+                logger.warning(f"Бэкенд {label} пропущен: {e}")
+                continue
+            results[label] = run_backend(vad, fixtures)
+
+    return {
+        "revision": git_revision(),
+        "fixtures": len(fixtures),
+        "audio_seconds": round(sum(len(f) for f in fixtures) / config.SAMPLE_RATE, 1),
+        "backends": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк бэкендов VAD")
+    parser.add_argument("--fixtures", required=True, help="Каталог с WAV/FLAC фразами (по одной на файл)")
+    parser.add_argument("--backends", nargs="+", choices=VAD_BACKENDS,
+                        help="Бэкенды для сравнения (по умолчанию все установленные)")
+    parser.add_argument("--threads", nargs="+", type=int, default=[config.VAD_THREADS],
+                        help="Число потоков Silero для сравнения")
+    parser.add_argument("--output", default="vad_bench_output.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_benchmark(args)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"Ревизия: {result['revision']}, фраз: {result['fixtures']}, аудио: {result['audio_seconds']}с")
+    for label, stats in result["backends"].items():
+        print(f"  {label:28s} cpu={stats['cpu_ms_per_audio_second']}мс/с "
+              f"кадр p95={stats['frame_ms']['p95']}мс "
+              f"начало p50={stats['onset_delay_ms']['p50']}мс "
+              f"конец p50={stats['offset_delay_ms']['p50']}мс ({stats['detected']})")
+    print(f"Результат записан в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
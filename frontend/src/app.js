@@ -9,11 +9,15 @@ class StealthAssistantRenderer {
     this.currentProfile = "general";
     this.connectionStatus = "disconnected";
     this.responseHistory = [];
+    this.streamingResponses = new Map();
 
     // Состояние транскрипции
     this.transcriptionBuffer = "";
+    this.pendingQuestionText = "";
     this.isAutoSendEnabled = true;
     this.isProcessing = false;
+    // Промежуточная транскрипция текущей фразы, собранная из диффов
+    this.partialTranscript = { utterance: null, seq: 0, text: "", stableLength: 0 };
 
     // Инициализация при загрузке DOM
     if (document.readyState === "loading") {
@@ -59,6 +63,9 @@ class StealthAssistantRenderer {
       autoSendToggle: this.getElementById("auto-send-toggle"),
       sendTranscription: this.getElementById("send-transcription"),
       clearTranscription: this.getElementById("clear-transcription"),
+      transcriptionPartial: this.getElementById("transcription-partial"),
+      partialStable: this.getElementById("partial-stable"),
+      partialVolatile: this.getElementById("partial-volatile"),
     };
 
     console.log("✅ DOM элементы инициализированы:", Object.keys(this.ui));
@@ -219,6 +226,22 @@ class StealthAssistantRenderer {
       }
     });
 
+    // Потоковые ответы AI
+    ipcRenderer.on("ai-response-delta", (_event, data) => {
+      if (data && data.requestId && data.delta) {
+        this.handleAIResponseDelta(data);
+      }
+    });
+
+    ipcRenderer.on("ai-response-done", (_event, data) => {
+      console.log("📡 Получен ai-response-done:", data);
+      if (data && data.requestId) {
+        this.handleAIResponseDone(data);
+      } else {
+        console.warn("⚠️ Неверные данные ai-response-done:", data);
+      }
+    });
+
     // Статус подключения
     ipcRenderer.on("connection-status", (_event, data) => {
       this.connectionStatus = data.status;
@@ -286,11 +309,29 @@ class StealthAssistantRenderer {
     ipcRenderer.on("speech-transcription", (_event, data) => {
       console.log("📡 Получена транскрипция:", data);
       if (data && data.text) {
+        this.clearPartialTranscription();
         this.handleTranscriptionUpdate(data.text);
       } else {
         console.warn("⚠️ Неверные данные speech-transcription:", data);
       }
     });
+
+    // Промежуточная транскрипция: диффы к тексту текущей фразы
+    ipcRenderer.on("speech-transcription-partial", (_event, data) => {
+      if (data) {
+        this.handlePartialTranscription(data);
+      }
+    });
+
+    // Законченный вопрос, собранный бэкендом из фрагментов речи
+    ipcRenderer.on("question-ready", (_event, data) => {
+      console.log("📡 Получен question-ready:", data);
+      if (data && data.text) {
+        this.handleQuestionReady(data);
+      } else {
+        console.warn("⚠️ Неверные данные question-ready:", data);
+      }
+    });
   }
 
   handleAIResponse(data) {
@@ -300,6 +341,7 @@ class StealthAssistantRenderer {
       id: Date.now().toString(),
       question: data.question,
       answer: data.answer,
+      source: data.source || "llm",
       timestamp: new Date(),
       profile: this.currentProfile,
     };
@@ -320,6 +362,54 @@ class StealthAssistantRenderer {
     console.log(`✅ Обработка AI ответа завершена`);
   }
 
+  handleAIResponseDelta(data) {
+    let stream = this.streamingResponses.get(data.requestId);
+
+    if (!stream) {
+      const response = {
+        id: data.requestId,
+        question: data.question,
+        answer: "",
+        timestamp: new Date(),
+        profile: this.currentProfile,
+      };
+      stream = { response, element: this.displayResponse(response) };
+      this.streamingResponses.set(data.requestId, stream);
+    }
+
+    stream.response.answer += data.delta;
+    stream.element.querySelector(".response-answer").innerHTML =
+      `<strong>Ответ:</strong> ${this.formatAnswer(stream.response.answer)}`;
+  }
+
+  handleAIResponseDone(data) {
+    const stream = this.streamingResponses.get(data.requestId);
+    this.streamingResponses.delete(data.requestId);
+
+    if (!data.success || !data.answer) {
+      if (stream) {
+        stream.element.remove();
+      }
+      if (!data.cancelled) {
+        this.showNotification("AI не вернул ответ", "error");
+      }
+      return;
+    }
+
+    if (!stream) {
+      // Дельты не приходили - показываем ответ целиком
+      this.handleAIResponse(data);
+      return;
+    }
+
+    stream.response.answer = data.answer;
+    stream.element.querySelector(".response-answer").innerHTML =
+      `<strong>Ответ:</strong> ${this.formatAnswer(data.answer)}`;
+
+    this.responseHistory.unshift(stream.response);
+    this.updateQuestionHistory();
+  }
+
   displayResponse(response) {
     const responseElement = document.createElement("div");
     responseElement.className = "response-item";
@@ -327,6 +417,11 @@ class StealthAssistantRenderer {
       <div class="response-header">
         <span class="response-time">${response.timestamp.toLocaleTimeString()}</span>
         <span class="response-profile">${this.currentProfile}</span>
+        ${
+          response.source === "local"
+            ? '<span class="response-source">📚 из базы</span>'
+            : ""
+        }
       </div>
       <div class="response-question">
         <strong>Вопрос:</strong> ${this.escapeHtml(response.question)}
@@ -347,6 +442,8 @@ class StealthAssistantRenderer {
         this.ui.responseContainer.lastChild
       );
     }
+
+    return responseElement;
   }
 
   formatAnswer(answer) {
@@ -522,9 +619,13 @@ class StealthAssistantRenderer {
     console.log(`🔍 Проверка автоотправки: ${isAutoSendActive}`);
 
     if (isAutoSendActive) {
-      console.log("🤖 Автоотправка включена - отправляем сразу в AI");
-      // При автоотправке отправляем только текущую фразу
-      this.sendTextDirectlyToAI(text);
+      console.log("🤖 Автоотправка включена - ждем окончания вопроса");
+      // Фрагмент только показываем: в AI уходит вопрос целиком (question-ready)
+      this.pendingQuestionText = this.pendingQuestionText
+        ? `${this.pendingQuestionText} ${text}`
+        : text;
+      this.ui.transcriptionText.value = this.pendingQuestionText;
+      this.setTranscriptionStatus("listening", "🎤 Слушаю вопрос...");
     } else {
       console.log("⏸️ Автоотправка выключена - накапливаем текст");
 
@@ -541,6 +642,64 @@ class StealthAssistantRenderer {
     }
   }
 
+  handlePartialTranscription(data) {
+    const partial = this.partialTranscript;
+
+    // Дифф применим к состоянию, от которого построен; keep === 0 - к любому.
+    // Пропущенное обновление: ждем новой фразы или финального текста
+    if (
+      data.keep !== 0 &&
+      (data.utterance !== partial.utterance || data.base !== partial.seq)
+    ) {
+      return;
+    }
+
+    partial.utterance = data.utterance;
+    partial.seq = data.seq;
+    partial.text = partial.text.slice(0, data.keep) + data.append;
+    partial.stableLength = data.stableLength;
+    this.renderPartialTranscription();
+  }
+
+  renderPartialTranscription() {
+    const { text, stableLength } = this.partialTranscript;
+    const stable = text.slice(0, stableLength);
+    const volatile = text.slice(stableLength);
+
+    // Трогаем DOM только там, где текст изменился - без мерцания
+    if (this.ui.partialStable.textContent !== stable) {
+      this.ui.partialStable.textContent = stable;
+    }
+    if (this.ui.partialVolatile.textContent !== volatile) {
+      this.ui.partialVolatile.textContent = volatile;
+    }
+    this.ui.transcriptionPartial.hidden = !text;
+  }
+
+  clearPartialTranscription() {
+    this.partialTranscript.seq = 0;
+    this.partialTranscript.text = "";
+    this.partialTranscript.stableLength = 0;
+    this.renderPartialTranscription();
+  }
+
+  handleQuestionReady(data) {
+    console.log(`❓ Вопрос готов: "${data.text}"`);
+    this.pendingQuestionText = "";
+
+    if (!this.ui.autoSendToggle.checked) {
+      return;
+    }
+
+    this.ui.transcriptionText.value = data.text;
+    if (data.autoAsked) {
+      // Бэкенд уже отправил вопрос в AI
+      this.setTranscriptionStatus("processing", "Вопрос отправлен в AI...");
+      return;
+    }
+    this.sendTextDirectlyToAI(data.text);
+  }
+
   setTranscriptionStatus(state, message) {
     const statusElement = this.ui.transcriptionStatus;
     statusElement.textContent = message;
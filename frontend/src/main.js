@@ -34,6 +34,8 @@ class StealthAssistantApp {
     };
     this.reconnectTimer = null;
     this.hideTimer = null;
+    // Сессия на бэкенде: после переподключения сохраняются профиль и история
+    this.sessionId = null;
     this.init();
   }
 
@@ -175,7 +177,9 @@ class StealthAssistantApp {
   }
 
   connectToBackend() {
-    const wsUrl = "ws://127.0.0.1:8765";
+    const wsUrl = this.sessionId
+      ? `ws://127.0.0.1:8765/?session=${encodeURIComponent(this.sessionId)}`
+      : "ws://127.0.0.1:8765";
     this.log(`🔌 Подключение к бэкенду: ${wsUrl}`);
 
     try {
@@ -238,9 +242,24 @@ class StealthAssistantApp {
     switch (message.type) {
       case "welcome":
         this.log(`🎉 Подключено к бэкенду: ${message.message}`);
+        if (message.session_id) {
+          if (this.sessionId && !message.resumed) {
+            this.log("🆕 Предыдущая сессия истекла, создана новая");
+          }
+          this.sessionId = message.session_id;
+        }
+        if (message.ready === false) {
+          this.log("⏳ Бэкенд загружает модели распознавания речи...");
+        }
+        break;
+      case "ready":
+        // Backend отправляет: { type: "ready", speech_state: "ready", load_time: 12.3 }
+        this.log(
+          `✅ Распознавание речи готово (${message.speech_state}, ${message.load_time}с)`
+        );
         break;
       case "ai_response":
-        // Backend отправляет: { type: "ai_response", question: "...", answer: "...", timestamp: ... }
+        // Backend отправляет: { type: "ai_response", question: "...", answer: "...", source: "llm" | "local", timestamp: ... }
         this.log(
           `🤖 Получен ответ AI: вопрос="${message.question}", ответ длиной ${
             message.answer?.length || 0
@@ -249,10 +268,35 @@ class StealthAssistantApp {
         this.sendToRenderer("ai-response", {
           question: message.question,
           answer: message.answer,
+          source: message.source || "llm",
           timestamp: message.timestamp,
         });
         this.log(`📡 Отправлено в renderer: ai-response`);
         break;
+      case "ai_response_delta":
+        // Backend отправляет: { type: "ai_response_delta", request_id: "...", question: "...", delta: "..." }
+        this.sendToRenderer("ai-response-delta", {
+          requestId: message.request_id,
+          question: message.question,
+          delta: message.delta,
+        });
+        break;
+      case "ai_response_done":
+        // Backend отправляет: { type: "ai_response_done", request_id: "...", question: "...", answer: "...", ... }
+        this.log(
+          `🤖 Потоковый ответ AI завершен: вопрос="${message.question}", ответ длиной ${
+            message.answer?.length || 0
+          } символов`
+        );
+        this.sendToRenderer("ai-response-done", {
+          requestId: message.request_id,
+          question: message.question,
+          answer: message.answer,
+          success: message.success,
+          cancelled: message.cancelled || false,
+          timestamp: message.timestamp,
+        });
+        break;
       case "speech_transcription":
         // Backend отправляет: { type: "speech_transcription", text: "...", timestamp: ... }
         this.log(`🎤 Получена транскрипция: "${message.text}"`);
@@ -262,6 +306,37 @@ class StealthAssistantApp {
         });
         this.log(`📡 Отправлено в renderer: speech-transcription`);
         break;
+      case "speech_transcription_partial":
+        // Backend отправляет диффы: { type: "speech_transcription_partial", utterance: 3, seq: 5, base: 4,
+        //   keep: 12, append: "...", stable_length: 10 } - текст = прошлый.slice(0, keep) + append
+        this.sendToRenderer("speech-transcription-partial", {
+          utterance: message.utterance,
+          seq: message.seq,
+          base: message.base,
+          keep: message.keep,
+          append: message.append,
+          stableLength: message.stable_length,
+        });
+        break;
+      case "question_ready":
+        // Backend отправляет: { type: "question_ready", text: "...", fragments: 2, auto_asked: false, ... }
+        this.log(
+          `❓ Вопрос собран из ${message.fragments} фрагментов: "${message.text}"`
+        );
+        this.sendToRenderer("question-ready", {
+          text: message.text,
+          fragments: message.fragments,
+          autoAsked: message.auto_asked,
+          timestamp: message.timestamp,
+        });
+        break;
+      case "speech_status":
+        // Backend отправляет: { type: "speech_status", status: "recording" | "transcribing" }
+        this.sendToRenderer("speech-status", {
+          status: message.status,
+          timestamp: message.timestamp,
+        });
+        break;
       case "listening_status":
         // Backend отправляет: { type: "listening_status", status: "started" }
         this.isListening = message.status === "started";